@@ -27,7 +27,7 @@ import re
 
 import documentinfo
 import fileinfo
-import tokeniter
+import tokenindex
 import ly.lex.lilypond
 import ly.lex.scheme
 
@@ -50,7 +50,7 @@ def markup_commands(cursor):
     
 def schemewords(document):
     """Harvests all schemewords from the document."""
-    for t in tokeniter.all_tokens(document):
+    for t in tokenindex.index(document).tokens(ly.lex.scheme.Word):
         if type(t) is ly.lex.scheme.Word:
             yield t
 
@@ -76,10 +76,14 @@ _word_types = (
     ly.lex.String, ly.lex.Comment, ly.lex.Unparsed,
     ly.lex.lilypond.MarkupWord, ly.lex.lilypond.LyricText)
 
-def words(document):
-    """Harvests words from strings, lyrics, markup and comments."""
-    for t in tokeniter.all_tokens(document):
+def _block_words(tokens):
+    """Harvests words from strings, lyrics, markup and comments in tokens."""
+    for t in tokens:
         if isinstance(t, _word_types):
             for m in _words(t):
                 yield m.group()
 
+def words(document):
+    """Harvests words from strings, lyrics, markup and comments."""
+    return tokenindex.index(document).harvest(_block_words)
+
@@ -85,14 +85,23 @@ class Bookmarks(plugin.DocumentPlugin):
         if linenum in nums:
             return
         index = bisect.bisect_left(nums, linenum)
-        mark = QTextCursor(self.document().findBlockByNumber(linenum))
-        try:
-            # only available in very recent PyQt5 versions
-            mark.setKeepPositionOnInsert(True)
-        except AttributeError:
-            pass
-        self._marks[type].insert(index, mark)
+        self._marks[type].insert(index, self._createMark(linenum))
         self.marksChanged()
+    
+    def setMarks(self, linenums, type):
+        """Marks all the given line numbers with a mark of the given type.
+        
+        This is much faster than calling setMark() for every line, and
+        marksChanged() is emitted only once.
+        
+        """
+        nums = set(mark.blockNumber() for mark in self._marks[type])
+        new = set(linenums) - nums
+        if new:
+            marks = self._marks[type] + [self._createMark(n) for n in new]
+            marks.sort(key=lambda mark: mark.blockNumber())
+            self._marks[type] = marks
+            self.marksChanged()
         
     def unsetMark(self, linenum, type):
         """Removes a mark of the given type on the given line."""
@@ -120,14 +129,18 @@ class Bookmarks(plugin.DocumentPlugin):
                     break
                 index = bisect.bisect_left(nums, linenum)
         else:
-            mark = QTextCursor(self.document().findBlockByNumber(linenum))
-            try:
-                # only available in very recent PyQt5 versions
-                mark.setKeepPositionOnInsert(True)
-            except AttributeError:
-                pass
-            self._marks[type].insert(index, mark)
+            self._marks[type].insert(index, self._createMark(linenum))
         self.marksChanged()
+    
+    def _createMark(self, linenum):
+        """(internal) Returns a new mark (QTextCursor) for the line."""
+        mark = QTextCursor(self.document().findBlockByNumber(linenum))
+        try:
+            # only available in very recent PyQt5 versions
+            mark.setKeepPositionOnInsert(True)
+        except AttributeError:
+            pass
+        return mark
 
     def hasMark(self, linenum, type=None):
         """Returns True if the line has a mark (of the given type if specified) else False."""
@@ -0,0 +1,119 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Compact storage of the tokens of a text block.
+
+Instead of a tuple of ly.lex tokens, a CompactTokens instance stores the
+position, the length and an integer id of the class of every token in an
+array. The tokens are created again from the block's text when they are
+requested. The tokens of the most recently used blocks are cached.
+
+The highlighter uses this for very large documents, to save memory.
+
+"""
+
+
+import array
+import collections
+
+
+_classes = []       # maps class id to token class
+_class_ids = {}     # maps token class to class id
+
+_cache = collections.OrderedDict()  # id(CompactTokens) -> (instance, tokens)
+_cachesize = 256
+
+
+def class_id(cls):
+    """Return the integer id for the token class."""
+    try:
+        return _class_ids[cls]
+    except KeyError:
+        i = _class_ids[cls] = len(_classes)
+        _classes.append(cls)
+        return i
+
+
+class CompactTokens(object):
+    """Stores (pos, length, class id) for every token in an array."""
+    __slots__ = ('_data',)
+
+    def __init__(self, tokens):
+        data = self._data = array.array('i')
+        for t in tokens:
+            data.extend((t.pos, len(t), class_id(type(t))))
+
+    def __len__(self):
+        return len(self._data) // 3
+
+    def positions(self):
+        """Return the list of the positions of the tokens."""
+        return self._data[0::3].tolist()
+
+    def classes(self):
+        """Return the set of token classes, without creating the tokens."""
+        return frozenset(_classes[i] for i in self._data[2::3])
+
+    def tokens(self, text):
+        """Return the tuple of tokens, the text should be the block's text."""
+        key = id(self)
+        try:
+            result = _cache[key][1]
+        except KeyError:
+            d = self._data
+            result = tuple(_classes[d[i+2]](text[d[i]:d[i]+d[i+1]], d[i])
+                           for i in range(0, len(d), 3))
+            _cache[key] = (self, result)
+            if len(_cache) > _cachesize:
+                _cache.popitem(False)
+        else:
+            _cache.move_to_end(key)
+        return result
+
+
+def stored_tokens(block):
+    """Return the tokens the highlighter stored for the block.
+
+    Raises AttributeError if the block has no tokens stored.
+
+    """
+    data = block.userData()
+    try:
+        return data.tokens
+    except AttributeError:
+        return data.compact.tokens(block.text())
+
+
+def store_tokens(data, tokens, compact=False):
+    """Store the tokens in the QTextBlockUserData, compact if desired."""
+    if compact:
+        data.compact = CompactTokens(tokens)
+        try:
+            del data.tokens
+        except AttributeError:
+            pass
+    else:
+        data.tokens = tokens
+        try:
+            del data.compact
+        except AttributeError:
+            pass
+
+
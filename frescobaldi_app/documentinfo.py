@@ -37,6 +37,8 @@ import lydocument
 import app
 import fileinfo
 import cursortools
+import highlighter
+import tokenindex
 import tokeniter
 import plugin
 import variables
@@ -50,9 +52,13 @@ def info(document):
     return DocumentInfo.instance(document)
 
 
-def docinfo(document):
-    """Return a LyDocInfo instance for the document."""
-    return info(document).lydocinfo()
+def docinfo(document, complete=False):
+    """Return a LyDocInfo instance for the document.
+    
+    See DocumentInfo.lydocinfo() for the complete argument.
+    
+    """
+    return info(document).lydocinfo(complete)
 
 
 def music(document):
@@ -99,34 +105,175 @@ def defaultfilename(document):
     return filename + ext
     
     
+def chunk_tokens(entries):
+    """Return the tokens of the tokenindex entries, as one tuple.
+    
+    The positions of the tokens are relative to the first block, and 
+    Newline tokens are inserted between the blocks (and before the first
+    block, if it is not the first block of the document).
+    
+    """
+    start = entries[0].block.position()
+    tokens = []
+    for entry in entries:
+        pos = entry.block.position() - start
+        if pos or start:
+            tokens.append(ly.lex.Newline('\n', pos - 1))
+        tokens.extend(type(t)(t, pos + t.pos) for t in entry.tokens)
+    return tuple(tokens)
+
+
 class DocumentInfo(plugin.DocumentPlugin):
-    """Computes and caches various information about a Document."""
+    """Computes and caches various information about a Document.
+    
+    The LyDocInfo and the music tree are built from the toplevel expressions
+    in the document (see lydocinfo.ChunkedDocInfo). The information and the
+    music nodes of expressions that are not changed are reused when the
+    document is edited.
+    
+    The information is computed again when the highlighter stores new tokens,
+    e.g. while it highlights the rest of the document in the background after
+    an edit.
+    
+    """
+    # the name of the session of which the include path is used,
+    # None for the current session
+    session = None
+    
     def __init__(self, document):
-        document.contentsChanged.connect(self._reset)
-        document.closed.connect(self._reset)
+        self._chunks = {}   # cached chunks of the LyDocInfo
+        self._nodes = {}    # cached toplevel nodes of the music tree
+        self._depths = {}   # caches the parser depth of a block state
+        self._music = None
+        self._generation = 0
         self._reset()
+        document.contentsChanged.connect(self._reset)
+        document.closed.connect(self._close)
+        tokenindex.index(document).changed.connect(self._reset)
         
     def _reset(self):
-        """Called when the document is changed."""
+        """Called when the document or its tokens are changed."""
+        self._generation += 1
         self._lydocinfo = None
-        self._music = None
+        if self._music is not None:
+            # release the toplevel nodes, the next music tree reuses them
+            self._music.clear()
+            self._music = None
     
-    def lydocinfo(self):
-        """Return the lydocinfo instance for our document."""
+    def _close(self):
+        """Called when the document is closed."""
+        self._reset()
+        self._chunks = {}
+        self._nodes = {}
+    
+    def lydocinfo(self, complete=False):
+        """Return the lydocinfo instance for our document.
+        
+        Blocks the highlighter did not reach yet contribute the tokens they
+        had before (see tokenindex). If complete is True, the highlighter
+        first finishes highlighting the document, so the information is based
+        on the final tokens. Use this e.g. before running LilyPond.
+        
+        """
+        if complete:
+            hl = highlighter.highlighter(self.document())
+            if hl.isBusy():
+                hl.ensureHighlighted(self.document().lastBlock())
         if self._lydocinfo is None:
             doc = lydocument.Document(self.document())
             v = variables.manager(self.document()).variables()
-            self._lydocinfo = lydocinfo.DocInfo(doc, v)
+            self._lydocinfo = lydocinfo.ChunkedDocInfo(doc, v, self._lychunks(doc, v))
         return self._lydocinfo
     
+    def _toplevel(self, block):
+        """Return True if a toplevel expression starts at the block."""
+        text = block.text()
+        if not text or text[0].isspace():
+            return False
+        state = block.previous().userState()
+        try:
+            depth = self._depths[state]
+        except KeyError:
+            hl = highlighter.highlighter(self.document())
+            depth = self._depths[state] = hl.state(block.previous()).depth()
+        return depth == 1
+    
+    def _lychunks(self, doc, variables):
+        """Return the list of chunks for the ChunkedDocInfo.
+        
+        Every toplevel expression becomes a chunk, and chunks of which
+        the lines did not change are reused.
+        
+        """
+        cache, self._chunks = self._chunks, {}
+        chunks = []
+        for group in self._groups():
+            key = tuple(map(id, group))
+            try:
+                info = cache[key][1]
+            except KeyError:
+                info = lydocinfo.chunk(doc, variables,
+                                       functools.partial(chunk_tokens, group))
+            self._chunks[key] = (group, info)
+            first, last = group[0].block, group[-1].block
+            chunks.append((first.position(), last.position() + last.length() - 1, info))
+        return chunks
+    
+    def _groups(self):
+        """Yield lists of tokenindex entries, one list per toplevel expression."""
+        group = []
+        for entry in tokenindex.index(self.document()).entries():
+            if group and self._toplevel(entry.block):
+                yield group
+                group = []
+            group.append(entry)
+        if group:
+            yield group
+    
     def music(self):
         """Return the music.Document instance for our document."""
-        if self._music is None:
+        if self._music is not None:
+            result = self._music
+        else:
             import music
             doc = lydocument.Document(self.document())
-            self._music = music.Document(doc)
-        self._music.include_path = self.includepath()
-        return self._music
+            generation = self._generation
+            result = music.Document.from_nodes(doc, self._musicnodes(doc))
+            # reading the nodes may have highlighted blocks, changing the
+            # tokens we used, then the tree must be built again next time
+            if generation == self._generation:
+                self._music = result
+        result.include_path = self.includepath()
+        return result
+    
+    def _musicnodes(self, doc):
+        """Return the list of toplevel nodes for the music tree.
+        
+        Every toplevel expression is read separately. The nodes of an 
+        expression of which the lines did not change are reused, if the 
+        expression is read in the same state (e.g. the pitch language).
+        
+        """
+        import music
+        cache, self._nodes = self._nodes, {}
+        nodes = []
+        state = None
+        for group in self._groups():
+            first, last = group[0].block, group[-1].block
+            start = first.position()
+            key = tuple(map(id, group)), state
+            try:
+                pos, items, end_state = cache[key][1:]
+            except KeyError:
+                end = last.position() + last.length() - 1
+                items, end_state = music.read_nodes(doc, start, end, state)
+            else:
+                if pos != start:
+                    music.shift(items, start - pos)
+            self._nodes[key] = (group, start, items, end_state)
+            nodes.extend(items)
+            state = end_state
+        return nodes
     
     def mode(self, guess=True):
         """Returns the type of document ('lilypond, 'html', etc.).
@@ -151,7 +298,8 @@ class DocumentInfo(plugin.DocumentPlugin):
         
         A path is a list of directories.
         
-        If there is a session specific include path, it is used.
+        If there is a session specific include path, it is used. (The
+        session attribute can name another session than the current one.)
         Otherwise the path is taken from the LilyPond preferences.
         
         Currently the document does not matter.
@@ -163,7 +311,10 @@ class DocumentInfo(plugin.DocumentPlugin):
         
         # get the session specific include path
         import sessions
-        session_settings = sessions.currentSessionGroup()
+        if self.session is None:
+            session_settings = sessions.currentSessionGroup()
+        else:
+            session_settings = sessions.findSessionGroup(self.session)
         if session_settings and session_settings.value("set-paths", False, bool):
             sess_path = qsettings.get_string_list(session_settings, "include-path")
             if session_settings.value("repl-paths", False, bool):
@@ -198,7 +349,7 @@ class DocumentInfo(plugin.DocumentPlugin):
             scratch = scratchdir.scratchdir(self.document())
             if create:
                 scratch.saveDocument()
-            if filename and self.lydocinfo().include_args():
+            if filename and self.lydocinfo(create).include_args():
                 includepath.insert(0, os.path.dirname(filename))
             if create or (scratch.path() and os.path.exists(scratch.path())):
                 filename = scratch.path()
@@ -213,10 +364,13 @@ class DocumentInfo(plugin.DocumentPlugin):
         relative to the including file, and if that still yields no file, relative
         to the directories in the includepath().
         
-        This method uses caching for both the document contents and the other files.
+        This method uses caching for both the document contents and the other
+        files, and the set is kept (see includegraph.py) until the document's
+        include arguments or one of the included files change.
         
         """
-        return fileinfo.includefiles(self.lydocinfo(), self.includepath())
+        import includegraph
+        return set(includegraph.includefiles(self.document(), self.lydocinfo(), self.includepath()))
 
     def child_urls(self):
         """Return a tuple of urls included by the Document.
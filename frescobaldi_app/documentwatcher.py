@@ -38,6 +38,7 @@ from PyQt5.QtCore import QFileSystemWatcher, QUrl
 import app
 import plugin
 import signals
+import statcache
 
 
 __all__ = ['documentChangedOnDisk', 'DocumentWatcher', 'start', 'stop']
@@ -121,6 +122,7 @@ def whileSaving(document):
     
 def fileChanged(filename):
     """Called whenever the global filesystem watcher detects a change."""
+    statcache.invalidate(filename)
     url = QUrl.fromLocalFile(filename)
     doc = app.findDocument(url)
     if doc:
@@ -158,7 +160,16 @@ def stop():
         watcher = None
 
 
+def forgetStat(document):
+    """Called when a document is saved; its file must be stat-ed again."""
+    filename = document.url().toLocalFile()
+    if filename:
+        statcache.invalidate(filename)
+        statcache.invalidate(os.path.realpath(filename))
+
+
 # always-on connections
 app.documentLoaded.connect(unchange)
 app.documentSaved.connect(unchange)
+app.documentSaved.connect(forgetStat, -999) # before all others
 app.documentUrlChanged.connect(unchange)
@@ -33,6 +33,8 @@ import actioncollection
 import actioncollectionmanager
 import jobmanager
 import jobattributes
+import jobqueue
+import resultcache
 import plugin
 import icons
 import signals
@@ -59,6 +61,8 @@ class Engraver(plugin.MainWindowPlugin):
         ac.engrave_debug.triggered.connect(self.engraveLayoutControl)
         ac.engrave_custom.triggered.connect(self.engraveCustom)
         ac.engrave_abort.triggered.connect(self.engraveAbort)
+        ac.engrave_all.triggered.connect(self.engraveAll)
+        ac.engrave_abort_all.triggered.connect(self.engraveAbortAll)
         ac.engrave_autocompile.toggled.connect(self.engraveAutoCompileToggled)
         ac.engrave_open_lilypond_datadir.triggered.connect(self.openLilyPondDatadir)
         ac.engrave_show_available_fonts.triggered.connect(self.showAvailableFonts)
@@ -70,6 +74,8 @@ class Engraver(plugin.MainWindowPlugin):
         app.sessionChanged.connect(self.slotSessionChanged)
         app.saveSessionData.connect(self.slotSaveSessionData)
         app.documentClosed.connect(self.slotDocumentClosed)
+        jobqueue.progress.connect(self.slotQueueProgress)
+        jobqueue.finished.connect(self.slotQueueFinished)
         mainwindow.aboutToClose.connect(self.saveSettings)
         self.loadSettings()
         app.languageChanged.connect(self.updateStickyActionText)
@@ -200,6 +206,46 @@ class Engraver(plugin.MainWindowPlugin):
         if job and job.is_running():
             job.abort()
     
+    def engraveAll(self):
+        """Engraves all open LilyPond documents (in publish mode).
+        
+        Documents that are included by other open documents are skipped.
+        The jobs are run using the global job queue, several at a time.
+        
+        """
+        import documentinfo
+        import includegraph
+        from . import command
+        docs = [d for d in app.documents if documentinfo.mode(d) == "lilypond"]
+        for d in docs:
+            documentinfo.info(d).includefiles()  # updates the include graph
+        q = jobqueue.queue()
+        for d in docs:
+            filename = d.url().toLocalFile()
+            if filename and includegraph.masters(filename):
+                continue
+            job = command.defaultJob(d)
+            jobattributes.get(job).mainwindow = self.mainwindow()
+            q.add(resultcache.lookup(job, d), d, jobqueue.BATCH)
+    
+    def engraveAbortAll(self):
+        """Aborts all running engraving jobs and empties the job queue."""
+        jobqueue.queue().cancelAll()
+        for d in app.documents:
+            job = jobmanager.job(d)
+            if job and job.is_running():
+                job.abort()
+    
+    def slotQueueProgress(self, done, total):
+        """Called when the global job queue makes progress."""
+        if total > 1:
+            self.mainwindow().statusBar().showMessage(
+                _("Engraving: {done} of {total} jobs done").format(done=done, total=total))
+    
+    def slotQueueFinished(self):
+        """Called when all jobs in the global job queue are done."""
+        self.mainwindow().statusBar().showMessage(_("All engraving jobs are done."), 5000)
+    
     def saveDocumentIfDesired(self):
         """Saves the current document if desired and it makes sense.
         
@@ -239,13 +285,20 @@ class Engraver(plugin.MainWindowPlugin):
         return msgbox.clickedButton() == abort_button
 
     def runJob(self, job, document):
-        """Runs the engraving job on behalf of document."""
+        """Runs the engraving job on behalf of document.
+        
+        Returns the job that is run, which is a resultcache.CachedJob if the
+        results of the job are already known.
+        
+        """
         jobattributes.get(job).mainwindow = self.mainwindow()
         # cancel running job, that would be an autocompile job
         rjob = jobmanager.job(document)
         if rjob and rjob.is_running():
             rjob.abort()
-        jobmanager.manager(document).start_job(job)
+        job = resultcache.lookup(job, document)
+        jobqueue.queue().add(job, document, jobqueue.INTERACTIVE)
+        return job
     
     def stickyToggled(self):
         """Called when the user toggles the 'Sticky' action."""
@@ -377,6 +430,8 @@ class Actions(actioncollection.ActionCollection):
         self.engrave_debug = QAction(parent)
         self.engrave_custom = QAction(parent)
         self.engrave_abort = QAction(parent)
+        self.engrave_all = QAction(parent)
+        self.engrave_abort_all = QAction(parent)
         self.engrave_autocompile = QAction(parent)
         self.engrave_autocompile.setCheckable(True)
         self.engrave_show_available_fonts = QAction(parent)
@@ -393,6 +448,8 @@ class Actions(actioncollection.ActionCollection):
         self.engrave_debug.setIcon(icons.get('lilypond-run'))
         self.engrave_custom.setIcon(icons.get('lilypond-run'))
         self.engrave_abort.setIcon(icons.get('process-stop'))
+        self.engrave_all.setIcon(icons.get('lilypond-run'))
+        self.engrave_abort_all.setIcon(icons.get('process-stop'))
         
 
     def translateUI(self):
@@ -403,6 +460,8 @@ class Actions(actioncollection.ActionCollection):
         self.engrave_debug.setText(_("Engrave (&layout control)"))
         self.engrave_custom.setText(_("Engrave (&custom)..."))
         self.engrave_abort.setText(_("Abort Engraving &Job"))
+        self.engrave_all.setText(_("Engrave All &Documents"))
+        self.engrave_abort_all.setText(_("Abort All Engraving Jobs"))
         self.engrave_autocompile.setText(_("Automatic E&ngrave"))
         self.engrave_open_lilypond_datadir.setText(_("Open LilyPond &Data Directory"))
         self.engrave_show_available_fonts.setText(_("Show Available &Fonts..."))
@@ -27,6 +27,12 @@ When a document is modified after the last run, LilyPond is run again after
 a certain time, if the document looks complete
 (documentinfo.docinfo(doc).complete()).
 
+The time to wait depends on how long engraving the document took the last
+times: for slow scores a burst of edits is collected in one run. An
+auto-compile job that is still running or waiting when the next run starts
+is outdated, and is cancelled, as is a running job when the timer expires and
+the music has changed. There is at most one auto-compile run pending.
+
 The log is not displayed.
 
 """
@@ -38,14 +44,18 @@ from PyQt5.QtCore import QSettings, Qt, QTimer
 
 import app
 import documentinfo
+import includegraph
 import resultfiles
 import jobattributes
 import jobmanager
+import jobqueue
 import plugin
 import ly.lex
 
 from . import engraver
 from . import command
+from . import partial
+from . import server
 
 
 class AutoCompiler(plugin.MainWindowPlugin):
@@ -53,6 +63,10 @@ class AutoCompiler(plugin.MainWindowPlugin):
         self._enabled = False
         self._timer = QTimer(singleShot=True)
         self._timer.timeout.connect(self.slotTimeout)
+        self._job = None
+        self._fullJob = None
+        self._document = None
+        app.jobFinished.connect(self.slotJobFinished)
     
     def setEnabled(self, enabled):
         """Switch the autocompiler on or off."""
@@ -87,15 +101,22 @@ class AutoCompiler(plugin.MainWindowPlugin):
                 self.startTimer()
     
     def startTimer(self):
-        """Called to trigger a soon auto-compile try."""
-        self._timer.start(750)
+        """Called to trigger a soon auto-compile try.
+        
+        The timer is restarted on every call, so a burst of changes results
+        in one run.
+        
+        """
+        doc = engraver(self.mainwindow()).document()
+        delay = AutoCompileManager.instance(doc).delay() if doc else 750
+        self._timer.start(delay)
     
     def slotTimeout(self):
         """Called when the autocompile timer expires."""
         eng = engraver(self.mainwindow())
         doc = eng.document()
         rjob = jobmanager.job(doc)
-        if rjob and rjob.is_running(): # and not jobattributes.get(rjob).hidden:
+        if rjob and rjob.is_running() and not jobattributes.get(rjob).hidden:
             # a real job is running, come back when that is done
             rjob.done.connect(self.startTimer)
             return
@@ -110,9 +131,44 @@ class AutoCompiler(plugin.MainWindowPlugin):
                 if may_compile:
                     mgr.slotJobStarted()
         if may_compile:
-            job = command.defaultJob(doc, ['-dpoint-and-click'])
+            args = ['-dpoint-and-click']
+            # cancel outdated auto-compile jobs, running or waiting
+            for j in (self._job, self._fullJob):
+                if j:
+                    jobqueue.queue().cancel(j)
+            self._job = self._fullJob = job = None
+            self._document = doc
+            if partial.enabled() and doc is self.mainwindow().currentDocument():
+                job = partial.job(doc, self.mainwindow().textCursor().position(), args)
+            if job:
+                # engrave the full document in the background afterwards
+                full = command.defaultJob(doc, args)
+                attrs = jobattributes.get(full)
+                attrs.hidden = True
+                attrs.mainwindow = self.mainwindow()
+                self._fullJob = server.job(full)
+            else:
+                job = command.defaultJob(doc, args)
+            job = server.job(job)
             jobattributes.get(job).hidden = True
-            eng.runJob(job, doc)
+            self._job = eng.runJob(job, doc)
+            if self._fullJob:
+                jobqueue.queue().add(self._fullJob, doc, jobqueue.BATCH)
+    
+    def cancelJobs(self, document):
+        """Cancel our running or waiting auto-compile jobs of the document."""
+        if document is self._document:
+            for j in (self._job, self._fullJob):
+                if j:
+                    jobqueue.queue().cancel(j)
+            self._job = self._fullJob = self._document = None
+    
+    def slotJobFinished(self, document, job, success):
+        """Called when a job finishes, learns the time auto-compile takes."""
+        if job is self._job:
+            self._job = None
+            if success:
+                AutoCompileManager.instance(document).learn(job.elapsed_time())
 
 
 class AutoCompileManager(plugin.DocumentPlugin):
@@ -121,6 +177,7 @@ class AutoCompileManager(plugin.DocumentPlugin):
         document.saving.connect(self.slotDocumentSaving)
         document.loaded.connect(self.initialize)
         jobmanager.manager(document).started.connect(self.slotJobStarted)
+        self._duration = None
         self.initialize()
     
     def initialize(self):
@@ -138,29 +195,68 @@ class AutoCompileManager(plugin.DocumentPlugin):
             else:
                 ext = '.pdf'
             self._dirty = not resultfiles.results(document).files(ext)
-        self._hash = None if self._dirty else documentinfo.docinfo(document).token_hash()
+        self._hash = None if self._dirty else documentinfo.docinfo(document, True).token_hash()
     
     def may_compile(self):
-        """Return True if we could need to compile the document."""
+        """Return True if we could need to compile the document.
+        
+        This is called when the auto-compile timer expires. If the music
+        changed, a running auto-compile job is outdated and it is cancelled.
+        
+        """
         if self._dirty:
             path = self.document().url().path()
-            dinfo = documentinfo.docinfo(self.document())
+            dinfo = documentinfo.docinfo(self.document(), True)
             if (dinfo.mode() == "lilypond"
-                and (path.endswith('.ly') or path == '')
-                and dinfo.complete()
-                and documentinfo.music(self.document()).has_output()):
+                and (path.endswith('.ly') or path == '')):
                 h = dinfo.token_hash()
                 if h != self._hash:
-                    self._hash = h
-                    if h != hash(tuple()):
-                        return True
+                    self.cancelOutdatedJobs()
+                    if (dinfo.complete()
+                        and documentinfo.music(self.document()).has_output()):
+                        self._hash = h
+                        if h != hash(tuple()):
+                            return True
             self._dirty = False
     
+    def learn(self, seconds):
+        """Adds the time (in seconds) an auto-compile run took."""
+        if self._duration is None:
+            self._duration = seconds
+        else:
+            self._duration = (self._duration + seconds) / 2
+    
+    def delay(self):
+        """Returns the time (in msec) to wait after a change before auto-compiling.
+        
+        This is half the time engraving took, but at least 750 msec and at
+        most three seconds.
+        
+        """
+        if self._duration is None:
+            return 750
+        return int(min(max(750, self._duration * 500), 3000))
+    
     def slotDocumentContentsChanged(self):
         """Called when the user modifies the document."""
         doc = self.document()
         if doc.isModified() or doc.isRedoAvailable():  # not when a template was applied
             self._dirty = True
+    
+    def cancelOutdatedJobs(self):
+        """Cancel the running auto-compile jobs, because the music changed.
+        
+        So an outdated LilyPond run does not keep running, e.g. while the
+        document is incomplete.
+        
+        """
+        doc = self.document()
+        job = jobmanager.job(doc)
+        if job and job.is_running() and jobattributes.get(job).hidden:
+            for compiler in AutoCompiler.instances():
+                compiler.cancelJobs(doc)
+            if not job.is_aborted():
+                job.abort()
 
     @contextlib.contextmanager
     def slotDocumentSaving(self):
@@ -174,8 +270,12 @@ class AutoCompileManager(plugin.DocumentPlugin):
             yield
         finally:
             if modified:
-                self._dirty = True
-                self._hash = None
+                self.forceCompile()
+    
+    def forceCompile(self):
+        """Forces auto-compile once, e.g. when an included file changed."""
+        self._dirty = True
+        self._hash = None
     
     def slotJobStarted(self):
         """Called when an engraving job is started on this document."""
@@ -184,3 +284,9 @@ class AutoCompileManager(plugin.DocumentPlugin):
             self._hash = documentinfo.docinfo(self.document()).token_hash()
 
 
+@includegraph.changed.connect
+def _includedFileChanged(filename, documents):
+    """Called when a file changed that is included by open documents."""
+    for mgr in AutoCompileManager.instances():
+        if mgr.document() in documents:
+            mgr.forceCompile()
@@ -0,0 +1,151 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Engraves files from the command line, without opening a window.
+
+This is used when Frescobaldi is started with the --engrave option. The
+jobs are created in the same way as when engraving from the GUI (using
+the preferences, the include path of the given session and the automatic
+LilyPond version selection), and run using the global job queue.
+
+A report is written in JSON format, listing for every file the command,
+the time it took, whether it succeeded and the errors and warnings
+LilyPond printed.
+
+"""
+
+
+import json
+import sys
+
+import app
+import document
+import documentinfo
+import job
+import jobqueue
+import resultcache
+
+from . import command
+
+
+def engrave(urls, mode='publish', jobs=None, session=None):
+    """Engrave the files (QUrls) and return a list of Result instances.
+
+    mode is 'preview' or 'publish'. If jobs is given, it is the maximum
+    number of LilyPond processes to run at the same time. If session is
+    given, the include path of that session is used; the current session
+    is not changed.
+
+    """
+    args = ['-dpoint-and-click'] if mode == 'preview' else None
+    q = jobqueue.queue()
+    if jobs:
+        q.setMaxJobs(jobs)
+    results = []
+    for url in urls:
+        filename = url.toLocalFile()
+        try:
+            doc = document.Document.new_from_url(url)
+        except (IOError, OSError) as e:
+            results.append(Result(filename, error=str(e)))
+            continue
+        if session:
+            documentinfo.info(doc).session = session
+        try:
+            j = resultcache.lookup(command.defaultJob(doc, args), doc)
+        except Exception as e:
+            # record the failure and go on with the other files
+            results.append(Result(filename, error=str(e) or type(e).__name__))
+            doc.close()
+            continue
+        results.append(Result(filename, j))
+        q.add(j, doc, jobqueue.BATCH)
+    if q.jobs():
+        jobqueue.finished.connect(app.qApp.quit)
+        app.qApp.exec_()
+        jobqueue.finished.disconnect(app.qApp.quit)
+    return results
+
+
+def run(urls, mode='publish', jobs=None, report=None, session=None):
+    """Engrave the files, write the report and return the exit status.
+
+    report is the name of the file to write the report to; if None or '-',
+    the report is written to standard output. The exit status is 0 if all
+    files were engraved successfully, else 1.
+
+    """
+    results = engrave(urls, mode, jobs, session)
+    data = {
+        'mode': mode,
+        'results': [r.report() for r in results],
+    }
+    text = json.dumps(data, indent=2)
+    if report and report != '-':
+        with open(report, 'w') as f:
+            f.write(text + '\n')
+    else:
+        sys.stdout.write(text + '\n')
+    return 0 if all(r.success() for r in results) else 1
+
+
+class Result(object):
+    """The result of engraving one file."""
+    def __init__(self, filename, job=None, error=None):
+        self.filename = filename
+        self.job = job
+        self.error = error
+
+    def success(self):
+        """Return True if the file was engraved successfully."""
+        return bool(self.job and self.job.success)
+
+    def messages(self):
+        """Return a list of dictionaries for the file references in the log.
+
+        Every dictionary has the keys 'file', 'line', 'column' and 'message'.
+
+        """
+        from logtool.errors import Parser
+        if not self.job:
+            return []
+        parser = Parser(True)
+        refs = []
+        for text, type in self.job.history(job.STDERR):
+            refs.extend(parser.feed(text))
+        refs.extend(parser.flush())
+        return [{'file': filename, 'line': line, 'column': column, 'message': message}
+                for url, filename, line, column, message in refs]
+
+    def report(self):
+        """Return a dictionary describing the result, for the report."""
+        d = {
+            'file': self.filename,
+            'success': self.success(),
+        }
+        if self.job:
+            d['command'] = self.job.command
+            d['elapsed'] = round(self.job.elapsed_time(), 3)
+            d['messages'] = self.messages()
+            if self.job.failed_to_start():
+                d['error'] = "LilyPond could not be started"
+        if self.error:
+            d['error'] = self.error
+        return d
@@ -0,0 +1,132 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Engraves only the score at the cursor position of a document.
+
+In a document with many scores (or bookparts), the other scores are left out
+of a copy of the document (the fragment), which is saved in the scratch area
+and engraved. Headers, paper and layout blocks, variable definitions etc. are
+kept. The left out parts are replaced with whitespace, so that line and
+column numbers (used by point and click) remain valid.
+
+This is used by auto-compile, which then engraves the full document in the
+background.
+
+"""
+
+
+import os
+
+from PyQt5.QtCore import QSettings
+
+import documentinfo
+import fileinfo
+import jobattributes
+import scratchdir
+import util
+import ly.music.items
+
+from . import command
+
+
+# the toplevel items that create output on their own
+_scores = (
+    ly.music.items.Book,
+    ly.music.items.BookPart,
+    ly.music.items.Score,
+    ly.music.items.Music,
+    ly.music.items.Markup,
+)
+
+
+def enabled():
+    """Return True if auto-compile should engrave the score at the cursor first."""
+    return QSettings().value("lilypond_settings/autocompile_partial", False, bool)
+
+
+def fragment(document, position):
+    """Return the text of the document with only the score at the position.
+
+    Returns None if the position is not in a score, or there are no other
+    scores to leave out.
+
+    """
+    ranges = []
+    def strip(node):
+        """Collect the ranges of the scores not containing the position."""
+        found = False
+        for n in node:
+            if isinstance(n, _scores):
+                start, end = n.position, n.end_position()
+                if start <= position <= end:
+                    found = True
+                    if isinstance(n, (ly.music.items.Book, ly.music.items.BookPart)):
+                        count = len(ranges)
+                        if not strip(n):
+                            del ranges[count:]
+                else:
+                    ranges.append((start, end))
+        return found
+    if not strip(documentinfo.music(document)) or not ranges:
+        return
+    text = document.toPlainText()
+    result = []
+    pos = 0
+    for start, end in sorted(ranges):
+        result.append(text[pos:start])
+        result.append(''.join(c if c == '\n' else ' ' for c in text[start:end]))
+        pos = end
+    result.append(text[pos:])
+    return ''.join(result)
+
+
+def job(document, position, args=None):
+    """Return a Job engraving the score at the position, or None.
+
+    None is returned if the document has no other scores than the one at
+    the position.
+
+    """
+    text = fragment(document, position)
+    if text is None:
+        return
+    j = command.defaultJob(document, args)
+    scratch = scratchdir.scratchdir(document)
+    scratch.create()
+    filename = scratch.fragmentPath()
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, 'wb') as f:
+        f.write(util.encode(util.platform_newlines(text), document.encoding()))
+
+    # find included files relative to the document
+    docfile = document.url().toLocalFile()
+    if docfile:
+        include = '-I' + os.path.dirname(docfile)
+        args = [a for a in j.command[1:-1] if a.startswith('-I')]
+        index = j.command.index(args[0]) if args else len(j.command) - 1
+        j.command.insert(index, include)
+    j.command[-1] = filename
+    j.directory = os.path.dirname(filename)
+
+    info = documentinfo.info(document)
+    attrs = jobattributes.get(j)
+    attrs.jobfile = filename
+    attrs.basenames = fileinfo.basenames(info.lydocinfo(), info.includefiles(), filename)
+    return j
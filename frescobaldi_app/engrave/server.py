@@ -0,0 +1,284 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+A long-running LilyPond process to engrave files without starting LilyPond.
+
+Starting LilyPond takes a considerable amount of time, because it loads its
+Scheme files and initializes the fonts. The Server keeps a LilyPond process
+running (using server.scm), that forks a child process for every file to
+engrave. This is used for auto-compile.
+
+The server is only used on POSIX systems and when enabled in the
+preferences. Every ServerJob falls back to starting LilyPond itself when the
+server is not available (e.g. busy or failed to start).
+
+"""
+
+
+import os
+
+from PyQt5.QtCore import QProcess, QProcessEnvironment, QSettings, QTimer
+
+import app
+import job as job_
+import jobattributes
+
+
+# the time an idle server is kept running (msec)
+idle_timeout = 300000
+
+
+def enabled():
+    """Return True if the server may be used."""
+    return os.name == 'posix' and QSettings().value(
+        "lilypond_settings/autocompile_server", False, bool)
+
+
+def job(job):
+    """Return a ServerJob that runs the job using a server, if enabled."""
+    if enabled():
+        sjob = ServerJob(job)
+        jobattributes.copy(job, sjob)
+        return sjob
+    return job
+
+
+def server(command, environment):
+    """Return an idle Server for the command and environment, or None.
+
+    The command is the LilyPond command line without the filename. A running
+    server for a different command is stopped. None is returned if the server
+    is busy or failed before for this command.
+
+    """
+    global _server
+    key = (tuple(command), tuple(sorted(environment.items())))
+    if key in _broken:
+        return
+    if _server is not None and _server.key != key:
+        if _server.busy():
+            return
+        _server.stop()
+        _server = None
+    if _server is None:
+        _server = Server(key)
+    elif _server.busy():
+        return
+    return _server
+
+_server = None
+_broken = set()
+
+
+def stop():
+    """Stop the running server, if any."""
+    global _server
+    if _server is not None:
+        _server.stop()
+        _server = None
+
+app.aboutToQuit.connect(stop)
+
+
+class Server(object):
+    """Manages a LilyPond process running server.scm."""
+    def __init__(self, key):
+        self.key = key
+        self._job = None
+        self._pid = None
+        self._aborting = False
+        self._ready = False
+        self._stdout = b''
+        self._idle = QTimer(singleShot=True, timeout=stop)
+        self._idle.start(idle_timeout)
+        command, environment = key
+        scm = os.path.join(os.path.dirname(__file__), 'server.scm')
+        scm = scm.replace('\\', '\\\\').replace('"', '\\"')
+        p = self._process = QProcess()
+        if environment:
+            se = QProcessEnvironment.systemEnvironment()
+            for k, v in environment:
+                se.remove(k) if v is None else se.insert(k, v)
+            p.setProcessEnvironment(se)
+        p.readyReadStandardOutput.connect(self._readstdout)
+        p.readyReadStandardError.connect(self._readstderr)
+        p.finished.connect(self._finished)
+        p.error.connect(self._error)
+        p.start(command[0], list(command[1:]) + ['-e', '(load "{0}")'.format(scm)])
+
+    def busy(self):
+        """Return True if a job is being run."""
+        return self._job is not None
+
+    def run(self, job):
+        """Engrave the file of the ServerJob."""
+        self._idle.stop()
+        self._job = job
+        self._pid = None
+        self._aborting = False
+        line = '{0}\t{1}\n'.format(job.directory, job.command[-1])
+        self._process.write(line.encode('utf-8'))
+
+    def abort(self):
+        """Abort the running job by terminating the child process."""
+        self._aborting = True
+        if self._pid:
+            try:
+                os.kill(self._pid, 15)  # SIGTERM
+            except OSError:
+                pass
+
+    def stop(self):
+        """Stop the server process."""
+        self._idle.stop()
+        p, self._process = self._process, None
+        if p:
+            p.finished.disconnect(self._finished)
+            p.error.disconnect(self._error)
+            p.closeWriteChannel()
+            if not p.waitForFinished(1000):
+                p.kill()
+            p.deleteLater()
+        self._end(0, QProcess.CrashExit)
+
+    def _end(self, exitCode, exitStatus):
+        """(internal) Finish the current job, if any."""
+        j, self._job = self._job, None
+        self._pid = None
+        if self._process:
+            self._idle.start(idle_timeout)
+        if j:
+            j.serverDone(exitCode, exitStatus)
+
+    def _readstdout(self):
+        """(internal) Handle the status lines written by the server."""
+        self._stdout += bytes(self._process.readAllStandardOutput())
+        *lines, self._stdout = self._stdout.split(b'\n')
+        for line in lines:
+            words = line.split()
+            if words == [b'frescobaldi-server-ready']:
+                self._ready = True
+            elif len(words) == 2 and words[0] == b'frescobaldi-server-start':
+                self._pid = int(words[1])
+                if self._aborting:
+                    self.abort()
+            elif len(words) == 2 and words[0] == b'frescobaldi-server-done':
+                self._flushstderr()
+                self._end(int(words[1]), QProcess.NormalExit)
+            elif len(words) == 2 and words[0] == b'frescobaldi-server-crash':
+                self._flushstderr()
+                self._end(int(words[1]), QProcess.CrashExit)
+
+    def _flushstderr(self):
+        """(internal) Read the output LilyPond wrote before the job ended.
+        
+        The output of the child process may not have been read yet when the
+        server reports that the child is done.
+        
+        """
+        p = self._process
+        p.setReadChannel(QProcess.StandardError)
+        while p.waitForReadyRead(0):
+            pass
+        p.setReadChannel(QProcess.StandardOutput)
+        self._readstderr()
+
+    def _readstderr(self):
+        """(internal) Pass the output of LilyPond to the current job."""
+        output = self._process.readAllStandardError()
+        if self._job:
+            self._job.serverOutput(output)
+
+    def _finished(self, exitCode, exitStatus):
+        """(internal) Called when the server process exits unexpectedly."""
+        global _server
+        j = self._job
+        if not self._ready:
+            _broken.add(self.key)
+        self._process.deleteLater()
+        self._process = None
+        self._job = None
+        if _server is self:
+            _server = None
+        if j:
+            if self._ready:
+                j.serverDone(exitCode, QProcess.CrashExit)
+            else:
+                j.serverFailed()
+
+    def _error(self, error):
+        """(internal) Called when the server could not be started."""
+        if error == QProcess.FailedToStart:
+            self._finished(-1, QProcess.CrashExit)
+
+
+class ServerJob(job_.Job):
+    """A Job that is run by a Server if possible, else in the normal way."""
+    def __init__(self, job):
+        super(ServerJob, self).__init__()
+        self.command = job.command
+        self.directory = job.directory
+        self.environment = job.environment
+        self.set_title(job.title())
+        self._server = None
+
+    def start(self):
+        """Start the job, using the server if available."""
+        s = server(self.command[:-1], self.environment)
+        if s is None:
+            return super(ServerJob, self).start()
+        self._begin()
+        self._server = s
+        self.start_message()
+        s.run(self)
+
+    def abort(self):
+        """Abort the job."""
+        if self._server:
+            self._aborted = True
+            self.abort_message()
+            self._server.abort()
+        else:
+            super(ServerJob, self).abort()
+
+    def is_running(self):
+        """Return True if the job is running."""
+        return bool(self._server) or super(ServerJob, self).is_running()
+
+    def serverOutput(self, output):
+        """Called by the Server with output (bytes) from LilyPond."""
+        self.message(self.decoder_stderr(output, self.decode_errors)[0], job_.STDERR)
+
+    def serverDone(self, exitCode, exitStatus):
+        """Called by the Server when the file has been engraved.
+        
+        The exit code and status (a QProcess.ExitStatus) are those of the
+        child process that engraved the file, like for a normal Job.
+        
+        """
+        self._server = None
+        self.finish_message(exitCode, exitStatus)
+        self._end(exitCode == 0 and exitStatus == QProcess.NormalExit)
+
+    def serverFailed(self):
+        """Called by the Server when it could not be started, runs LilyPond itself."""
+        self._server = None
+        super(ServerJob, self).start()
+
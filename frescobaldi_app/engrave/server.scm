@@ -0,0 +1,53 @@
+;;; This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+;;;
+;;; Copyright (c) 2008 - 2014 by Wilbert Berendsen
+;;;
+;;; This program is free software; you can redistribute it and/or
+;;; modify it under the terms of the GNU General Public License
+;;; as published by the Free Software Foundation; either version 2
+;;; of the License, or (at your option) any later version.
+;;;
+;;; See http://www.gnu.org/licenses/ for more information.
+
+;;; An engraving server for LilyPond, used by Frescobaldi (see server.py).
+;;;
+;;; Loaded with lilypond -e '(load "server.scm")', it reads lines from
+;;; standard input, containing a directory and a file name separated by a
+;;; tab. For every line a child process is forked that engraves the file in
+;;; the directory, so LilyPond's initialization is only done once.
+;;;
+;;; Written to standard output are the lines:
+;;;   frescobaldi-server-ready       when the server is ready
+;;;   frescobaldi-server-start PID   when a file is being engraved
+;;;   frescobaldi-server-done CODE   when it is done, with the exit code
+;;;   frescobaldi-server-crash SIG   when it was terminated by a signal
+
+(use-modules (ice-9 rdelim))
+
+(define (frescobaldi-server)
+  (let ((lilypond-all (module-ref (resolve-module '(lily)) 'lilypond-all)))
+    (display "frescobaldi-server-ready\n")
+    (force-output)
+    (let loop ((line (read-line)))
+      (if (not (eof-object? line))
+          (let* ((tab (string-index line #\tab))
+                 (dir (substring line 0 tab))
+                 (file (substring line (1+ tab)))
+                 (pid (primitive-fork)))
+            (if (= pid 0)
+                (begin
+                  (chdir dir)
+                  (primitive-exit (if (null? (lilypond-all (list file))) 0 1))))
+            (format #t "frescobaldi-server-start ~a\n" pid)
+            (force-output)
+            (let* ((status (cdr (waitpid pid)))
+                   (code (status:exit-val status)))
+              (if code
+                  (format #t "frescobaldi-server-done ~a\n" code)
+                  (format #t "frescobaldi-server-crash ~a\n"
+                          (or (status:term-sig status) 0)))
+              (force-output))
+            (loop (read-line)))))
+    (primitive-exit 0)))
+
+(frescobaldi-server)
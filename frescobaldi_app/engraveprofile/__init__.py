@@ -0,0 +1,54 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+The engraving profile tool.
+
+Shows the time, memory and output size of the engraving runs of the current
+document over time, so it is easy to see which change made engraving slow.
+"""
+
+
+from PyQt5.QtCore import Qt
+
+import app
+import panel
+
+
+class EngraveProfile(panel.Panel):
+    """A dockwidget showing the engraving history of the current document."""
+    def __init__(self, mainwindow):
+        super(EngraveProfile, self).__init__(mainwindow)
+        self.hide()
+        mainwindow.addDockWidget(Qt.BottomDockWidgetArea, self)
+
+    def translateUI(self):
+        self.setWindowTitle(_("Engraving Profile"))
+        self.toggleViewAction().setText(_("&Engraving Profile"))
+
+    def createWidget(self):
+        from . import widget
+        return widget.Widget(self)
+
+
+# profile all engraving jobs
+@app.jobStarted.connect
+def _profile(document, job):
+    from . import profiler
+    profiler.start(document, job)
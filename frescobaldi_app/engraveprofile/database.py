@@ -0,0 +1,149 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Stores the engraving profiles in a local SQLite database.
+
+Every run is stored with the name of the document (its filename, or the
+document name for unnamed documents), so the history of a document can be
+queried.
+
+"""
+
+
+import os
+import sqlite3
+
+from PyQt5.QtCore import QStandardPaths
+
+import signals
+
+
+changed = signals.Signal()  # document name
+
+
+_schema = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    document TEXT NOT NULL,
+    time REAL NOT NULL,
+    command TEXT,
+    success INTEGER,
+    wall REAL,
+    peak_rss INTEGER,
+    output_size INTEGER,
+    output_files INTEGER,
+    text_size INTEGER
+);
+CREATE INDEX IF NOT EXISTS runs_document ON runs (document, time);
+CREATE TABLE IF NOT EXISTS phases (
+    run INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    start REAL,
+    duration REAL
+);
+CREATE INDEX IF NOT EXISTS phases_run ON phases (run);
+"""
+
+# the maximum number of runs kept per document
+maxruns = 500
+
+
+class Run(object):
+    """One engraving run, as read from the database."""
+    def __init__(self, id, document, time, command, success, wall,
+                 peak_rss, output_size, output_files, text_size):
+        self.id = id
+        self.document = document
+        self.time = time
+        self.command = command
+        self.success = bool(success)
+        self.wall = wall
+        self.peak_rss = peak_rss
+        self.output_size = output_size
+        self.output_files = output_files
+        self.text_size = text_size
+        self.phases = []    # list of (name, start, duration) tuples
+
+
+def filename():
+    """Return the filename of the database."""
+    return os.path.join(QStandardPaths.writableLocation(
+        QStandardPaths.AppLocalDataLocation), 'engraveprofile.sqlite')
+
+
+def connection():
+    """Return the (global) database connection, creating it if needed."""
+    global _connection
+    if _connection is None:
+        path = filename()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _connection = sqlite3.connect(path)
+        _connection.execute("PRAGMA foreign_keys = ON")
+        _connection.executescript(_schema)
+    return _connection
+
+_connection = None
+
+
+def add(profile):
+    """Store a profiler.Profile of a finished run."""
+    c = connection()
+    with c:
+        cur = c.execute(
+            "INSERT INTO runs (document, time, command, success, wall, "
+            "peak_rss, output_size, output_files, text_size) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+            profile.document, profile.time, ' '.join(profile.command),
+            int(profile.success), profile.wall, profile.peak_rss,
+            profile.output_size, profile.output_files, profile.text_size))
+        run = cur.lastrowid
+        c.executemany(
+            "INSERT INTO phases (run, name, start, duration) VALUES (?, ?, ?, ?)",
+            [(run, name, start, duration) for name, start, duration in profile.phases])
+        c.execute(
+            "DELETE FROM runs WHERE document = ? AND id NOT IN "
+            "(SELECT id FROM runs WHERE document = ? ORDER BY time DESC LIMIT ?)",
+            (profile.document, profile.document, maxruns))
+    changed(profile.document)
+
+
+def runs(document, limit=100):
+    """Return a list of the last Runs of the document, oldest first."""
+    c = connection()
+    result = [Run(*row) for row in c.execute(
+        "SELECT id, document, time, command, success, wall, peak_rss, "
+        "output_size, output_files, text_size FROM runs WHERE document = ? "
+        "ORDER BY time DESC LIMIT ?", (document, limit))]
+    result.reverse()
+    byid = dict((run.id, run) for run in result)
+    if byid:
+        for run, name, start, duration in c.execute(
+                "SELECT run, name, start, duration FROM phases WHERE run IN ({0}) "
+                "ORDER BY run, start".format(','.join('?' * len(byid))), list(byid)):
+            byid[run].phases.append((name, start, duration))
+    return result
+
+
+def clear(document):
+    """Remove all the runs of the document."""
+    c = connection()
+    with c:
+        c.execute("DELETE FROM runs WHERE document = ?", (document,))
+    changed(document)
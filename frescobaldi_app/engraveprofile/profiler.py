@@ -0,0 +1,173 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Records a profile of engraving jobs.
+
+The phases LilyPond goes through are found in its progress output, the peak
+memory usage of the process is sampled while it runs (on Linux only), and
+the size of the created files is determined when the job has finished.
+The profile then is stored in the database.
+
+"""
+
+
+import os
+import re
+import sqlite3
+import time
+
+from PyQt5.QtCore import QTimer
+
+import documentinfo
+import job as job_
+import jobattributes
+import resultcache
+import util
+
+from . import database
+
+
+# the phases of a LilyPond run, with the message that starts them
+phases = (
+    ('parsing', re.compile(r"^Parsing\.\.\.", re.M)),
+    ('interpreting', re.compile(r"^Interpreting music\.\.\.", re.M)),
+    ('preprocessing', re.compile(r"^Preprocessing graphical objects\.\.\.", re.M)),
+    ('breaking', re.compile(r"^(Finding the ideal number of pages|Fitting music on)", re.M)),
+    ('drawing', re.compile(r"^Drawing systems\.\.\.", re.M)),
+    ('output', re.compile(r"^(Converting to|Layout output to)", re.M)),
+)
+
+# interval to sample the memory usage (msec)
+sample_interval = 200
+
+_profiles = set()   # keeps the running Profiles alive
+
+
+def phase_names():
+    """Return a dictionary mapping the phase names to their translated titles."""
+    return {
+        'startup': _("Starting LilyPond"),
+        'parsing': _("Parsing"),
+        'interpreting': _("Interpreting music"),
+        'preprocessing': _("Preprocessing graphical objects"),
+        'breaking': _("Page breaking"),
+        'drawing': _("Drawing systems"),
+        'output': _("Writing output"),
+    }
+
+
+def document_name(document):
+    """Return the name runs of the document are stored under."""
+    return document.url().toLocalFile() or document.documentName()
+
+
+def start(document, job):
+    """Start profiling the job that runs on behalf of the document."""
+    if not isinstance(job, resultcache.CachedJob):
+        _profiles.add(Profile(document, job))
+
+
+def peak_rss(pid):
+    """Return the peak resident set size of the process in bytes, or None.
+
+    Only supported on Linux, using the /proc filesystem.
+
+    """
+    try:
+        with open('/proc/{0}/status'.format(pid)) as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+
+
+class Profile(object):
+    """Collects the information about a running job."""
+    def __init__(self, document, job):
+        self._job = job
+        self.document = document_name(document)
+        self.time = job.start_time()
+        self.command = job.command
+        self.text_size = document.characterCount()
+        self.success = None
+        self.wall = None
+        self.peak_rss = None
+        self.output_size = None
+        self.output_files = None
+        # the basenames of the files this job creates (see resultfiles)
+        self._basenames = (jobattributes.get(job).basenames
+                           or documentinfo.info(document).basenames())
+        self.phases = []            # (name, start, duration) tuples
+        self._phase = 0             # index of the next phase to look for
+        self._marks = []            # (name, start) tuples
+        self._timer = QTimer(interval=sample_interval, timeout=self.sample)
+        if os.path.isdir('/proc'):
+            self._timer.start()
+        job.output.connect(self.slotOutput)
+        job.done.connect(self.slotDone)
+        self.sample()
+
+    def elapsed(self):
+        """Return the time since the start of the job."""
+        return time.time() - self.time
+
+    def slotOutput(self, text, type):
+        """Called when the job has output, looks for the phase messages."""
+        if type == job_.STDERR:
+            for i in range(self._phase, len(phases)):
+                name, regexp = phases[i]
+                if regexp.search(text):
+                    self._marks.append((name, self.elapsed()))
+                    self._phase = i + 1
+
+    def sample(self):
+        """Read the memory usage of the process."""
+        pid = self._job.process_id()
+        if pid:
+            rss = peak_rss(pid)
+            if rss:
+                self.peak_rss = max(rss, self.peak_rss or 0)
+
+    def slotDone(self, success):
+        """Called when the job has finished, stores the profile."""
+        self._timer.stop()
+        self._job.output.disconnect(self.slotOutput)
+        self._job.done.disconnect(self.slotDone)
+        _profiles.discard(self)
+        if self._job.is_aborted():
+            return
+        self.success = success
+        self.wall = self._job.elapsed_time()
+        marks = [('startup', 0.0)] + self._marks + [(None, self.wall)]
+        self.phases = [(name, start, end - start)
+                       for (name, start), (n, end) in zip(marks, marks[1:])]
+        if success:
+            # only the files of this job, not those of a later job
+            try:
+                files = util.newer_files(util.files(self._basenames), self.time)
+            except (IOError, OSError):
+                files = []
+            self.output_files = len(files)
+            self.output_size = sum(os.path.getsize(f) for f in files if os.path.isfile(f))
+        try:
+            database.add(self)
+        except (sqlite3.Error, OSError):
+            pass
@@ -0,0 +1,254 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+The engraving profile tool widget.
+"""
+
+
+import sqlite3
+import time
+
+from PyQt5.QtCore import QRectF, QSize, Qt
+from PyQt5.QtGui import QBrush, QColor, QPainter, QPen
+from PyQt5.QtWidgets import (
+    QHBoxLayout, QLabel, QPushButton, QSplitter, QTreeWidget, QTreeWidgetItem,
+    QVBoxLayout, QWidget)
+
+import app
+import job
+import qutil
+
+from . import database
+from . import profiler
+
+
+# a run is a regression if it takes this many times the usual time
+regression_factor = 2.0
+
+# the colors of the phases in the chart
+phase_colors = {
+    'parsing': QColor(114, 159, 207),
+    'interpreting': QColor(138, 226, 52),
+    'preprocessing': QColor(252, 175, 62),
+    'breaking': QColor(173, 127, 168),
+    'drawing': QColor(233, 185, 110),
+    'output': QColor(136, 138, 133),
+    'startup': QColor(211, 215, 207),
+    None: QColor(186, 189, 182),
+}
+
+
+def regressions(runs):
+    """Return the set of the ids of the runs that took much longer than usual.
+
+    The usual time is the median of the (up to) five successful runs before
+    it. A run is only compared when at least three successful runs precede it.
+
+    """
+    result = set()
+    previous = []
+    for run in runs:
+        if run.success and run.wall:
+            if len(previous) >= 3:
+                median = sorted(previous)[len(previous) // 2]
+                if run.wall > median * regression_factor:
+                    result.add(run.id)
+            previous = (previous + [run.wall])[-5:]
+    return result
+
+
+def size2str(size):
+    """Return a short display for a size in bytes."""
+    if size is None:
+        return ""
+    for unit in ("B", "kB", "MB"):
+        if size < 1024:
+            return "{0:.0f} {1}".format(size, unit)
+        size /= 1024
+    return "{0:.1f} GB".format(size)
+
+
+class Widget(QWidget):
+    def __init__(self, tool):
+        super(Widget, self).__init__(tool)
+        self._document = None
+        self._runs = []
+
+        layout = QVBoxLayout(spacing=0)
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.setLayout(layout)
+
+        self.chart = Chart(self)
+        self.tree = QTreeWidget(self, rootIsDecorated=False, allColumnsShowFocus=True)
+        self.tree.setColumnCount(6)
+        self.tree.currentItemChanged.connect(self.slotCurrentItemChanged)
+        splitter = QSplitter(Qt.Vertical)
+        splitter.addWidget(self.chart)
+        splitter.addWidget(self.tree)
+        layout.addWidget(splitter)
+
+        hbox = QHBoxLayout()
+        hbox.setContentsMargins(4, 4, 4, 4)
+        self.summary = QLabel()
+        self.clearButton = QPushButton(clicked=self.clearHistory)
+        hbox.addWidget(self.summary, 1)
+        hbox.addWidget(self.clearButton)
+        layout.addLayout(hbox)
+
+        app.translateUI(self)
+        tool.mainwindow().currentDocumentChanged.connect(self.setDocument)
+        database.changed.connect(self.slotDatabaseChanged)
+        doc = tool.mainwindow().currentDocument()
+        if doc:
+            self.setDocument(doc)
+
+    def translateUI(self):
+        self.tree.setHeaderLabels([
+            _("Started"),
+            _("Time"),
+            _("Memory"),
+            _("Output"),
+            _("Document Size"),
+            _("Slowest Phase"),
+        ])
+        self.clearButton.setText(_("Clear History"))
+        self.clearButton.setToolTip(_("Remove all stored runs of this document."))
+        self.updateView()
+
+    def setDocument(self, doc, old=None):
+        """Show the runs of the document."""
+        self._document = profiler.document_name(doc)
+        self.updateView()
+
+    def slotDatabaseChanged(self, document):
+        """Called when a run of a document is stored."""
+        if document == self._document:
+            self.updateView()
+
+    def clearHistory(self):
+        """Remove the runs of the current document."""
+        if self._document:
+            try:
+                database.clear(self._document)
+            except (sqlite3.Error, OSError):
+                pass
+
+    def updateView(self):
+        """Read the runs of the current document and show them."""
+        self._runs = []
+        if self._document:
+            try:
+                self._runs = database.runs(self._document)
+            except (sqlite3.Error, OSError):
+                pass
+        slow = regressions(self._runs)
+        names = profiler.phase_names()
+        with qutil.signalsBlocked(self.tree):
+            self.tree.clear()
+            for run in reversed(self._runs):
+                item = QTreeWidgetItem(self.tree)
+                item.setText(0, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(run.time)))
+                item.setText(1, job.Job.elapsed2str(run.wall or 0))
+                item.setText(2, size2str(run.peak_rss))
+                item.setText(3, size2str(run.output_size))
+                item.setText(4, str(run.text_size or ""))
+                if run.phases:
+                    name, start, duration = max(run.phases, key=lambda p: p[2])
+                    item.setText(5, "{0} ({1})".format(
+                        names.get(name, name), job.Job.elapsed2str(duration)))
+                for column in (1, 2, 3, 4):
+                    item.setTextAlignment(column, Qt.AlignRight)
+                if not run.success:
+                    item.setForeground(1, QBrush(qutil.addcolor(
+                        item.foreground(1).color(), 128, 0, 0)))
+                if run.id in slow:
+                    font = item.font(1)
+                    font.setBold(True)
+                    item.setFont(1, font)
+                    item.setToolTip(1, _("Took much longer than the runs before."))
+                item.run = run
+        for column in range(self.tree.columnCount()):
+            self.tree.resizeColumnToContents(column)
+        if self._runs:
+            walls = sorted(r.wall for r in self._runs if r.success and r.wall)
+            if walls:
+                self.summary.setText(_("{count} runs, median time {time}").format(
+                    count=len(self._runs), time=job.Job.elapsed2str(walls[len(walls) // 2])))
+            else:
+                self.summary.setText(_("{count} runs").format(count=len(self._runs)))
+        else:
+            self.summary.setText(_("No engraving runs recorded for this document."))
+        self.chart.setRuns(self._runs, slow)
+
+    def slotCurrentItemChanged(self, item, previous):
+        """Highlight the run of the item in the chart."""
+        self.chart.setCurrentRun(item.run.id if item else None)
+
+
+class Chart(QWidget):
+    """Draws the engraving time of the runs as bars, divided into phases."""
+    def __init__(self, parent=None):
+        super(Chart, self).__init__(parent)
+        self._runs = []
+        self._slow = set()
+        self._current = None
+        self.setMinimumHeight(60)
+
+    def sizeHint(self):
+        return QSize(400, 120)
+
+    def setRuns(self, runs, slow):
+        """Set the runs (oldest first) and the set of ids of slow runs."""
+        self._runs = runs
+        self._slow = slow
+        self.update()
+
+    def setCurrentRun(self, run_id):
+        """Highlight the run with the id."""
+        self._current = run_id
+        self.update()
+
+    def paintEvent(self, ev):
+        runs = [r for r in self._runs if r.wall]
+        if not runs:
+            return
+        painter = QPainter(self)
+        rect = QRectF(self.rect()).adjusted(4, 4, -4, -4)
+        maximum = max(r.wall for r in runs)
+        width = rect.width() / len(runs)
+        textColor = self.palette().color(self.foregroundRole())
+        for i, run in enumerate(runs):
+            x = rect.left() + i * width
+            scale = rect.height() / maximum
+            bottom = rect.bottom()
+            phases = run.phases or [(None, 0, run.wall)]
+            for name, start, duration in phases:
+                height = duration * scale
+                painter.fillRect(QRectF(x + 1, bottom - height, max(1, width - 2), height),
+                                 phase_colors.get(name, phase_colors[None]))
+                bottom -= height
+            if run.id in self._slow or run.id == self._current or not run.success:
+                if run.id == self._current:
+                    pen = QPen(textColor, 2)
+                else:
+                    pen = QPen(qutil.addcolor(textColor, 128, 0, 0), 1)
+                painter.setPen(pen)
+                painter.drawRect(QRectF(x + 1, rect.bottom() - run.wall * scale,
+                                        max(1, width - 2), run.wall * scale))
@@ -19,12 +19,16 @@
 
 """
 Caches information about files, and checks the mtime upon request.
+
+The mtime is read using the statcache module, so many lookups in a short
+time only stat a file once.
 """
 
 
-import os
 import weakref
 
+import statcache
+
 
 class FileCache(object):
     """Caches information about files, and checks the mtime upon request.
@@ -38,7 +42,7 @@ class FileCache(object):
     def __getitem__(self, filename):
         mtime, value = self._cache[filename]
         try:
-            if mtime == os.path.getmtime(filename):
+            if mtime == statcache.getmtime(filename):
                 return value
         except (IOError, OSError):
             pass
@@ -47,7 +51,7 @@ class FileCache(object):
     
     def __setitem__(self, filename, value):
         try:
-            self._cache[filename] = (os.path.getmtime(filename), value)
+            self._cache[filename] = (statcache.getmtime(filename), value)
         except (IOError, OSError):
             pass
     
@@ -93,7 +97,7 @@ class WeakFileCache(FileCache):
         value = valueref()
         if value is not None:
             try:
-                if mtime == os.path.getmtime(filename):
+                if mtime == statcache.getmtime(filename):
                     return value
             except (IOError, OSError):
                 pass
@@ -103,7 +107,7 @@ class WeakFileCache(FileCache):
     def __setitem__(self, filename, value):
         valueref = weakref.ref(value)
         try:
-            self._cache[filename] = (os.path.getmtime(filename), valueref)
+            self._cache[filename] = (statcache.getmtime(filename), valueref)
         except (IOError, OSError):
             pass
 
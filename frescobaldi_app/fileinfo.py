@@ -19,6 +19,11 @@
 
 """
 Computes and caches various information about files.
+
+The most used information about a file (the include and output arguments
+and the definitions) is also stored on disk, in the user's cache directory,
+so that it is available right away in a new session, without reading the
+tokens of the file again. This can be disabled in the preferences.
 """
 
 
@@ -26,11 +31,18 @@ import itertools
 import re
 import os
 import atexit
+import hashlib
+import pickle
+import time
+
+from PyQt5.QtCore import QSettings, QStandardPaths
 
 import ly.document
+import ly.pkginfo
 import lydocinfo
 import ly.lex
 import filecache
+import statcache
 import util
 import variables
 
@@ -38,6 +50,16 @@ import variables
 _document_cache = filecache.FileCache()
 _suffix_chars_re = re.compile(r'[^-\w]', re.UNICODE)
 
+# the DocInfo methods of which the results are stored on disk
+_stored_methods = (
+    'include_args',
+    'scheme_load_args',
+    'output_args',
+    'definitions',
+    'markup_definitions',
+    'version_string',
+)
+
 
 ### XXX otherwise I get a segfault on shutdown when very large music trees
 ### are made (and every node references the document).
@@ -46,12 +68,140 @@ atexit.register(_document_cache.clear)
 
 
 class _CachedDocument(object):
-    """Contains a document and related items."""
+    """Contains a document and related items.
+    
+    The document is only created (and its text tokenized) when requested.
+    
+    """
     filename = None
-    document = None
+    text = None
+    digest = None
     variables = None
     docinfo = None
     music = None
+    _document = None
+    
+    @property
+    def document(self):
+        """The ly.document.Document, created on first request."""
+        if self._document is None:
+            d = self._document = ly.document.Document(self.text, self.variables.get("mode"))
+            d.filename = self.filename
+            self.text = None
+        return self._document
+
+
+class _StoredDocInfo(object):
+    """Answers the queries for the stored methods from the disk cache.
+    
+    All other attributes are taken from a real DocInfo, which is created
+    (and the file tokenized) when needed.
+    
+    """
+    def __init__(self, cached, info):
+        self._cached = cached
+        self._info = info
+        self._docinfo = None
+    
+    def __getattr__(self, name):
+        if name in self._info:
+            value = self._info[name]
+            if isinstance(value, list):
+                # a caller may change the list, the stored one must not change
+                return lambda: list(value)
+            return lambda: value
+        if self._docinfo is None:
+            c = self._cached
+            self._docinfo = lydocinfo.DocInfo(c.document, c.variables)
+        return getattr(self._docinfo, name)
+
+
+class _DiskCache(object):
+    """Stores the results of the stored methods for files on disk.
+    
+    The results are keyed by filename and used as long as the mtime, the
+    size and the hash of the contents of the file are the same.
+    
+    """
+    maxsize = 1000      # the maximum number of files to remember
+    
+    def __init__(self, path):
+        self._path = path
+        self._modified = False
+        self._items = {}
+        try:
+            with open(path, 'rb') as f:
+                version, items = pickle.load(f)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return
+        except (AttributeError, ImportError, TypeError, ValueError):
+            # written by another version, referring to other classes or
+            # containing something else than the (version, items) tuple
+            return
+        if version == ly.pkginfo.version:
+            self._items = items
+    
+    def get(self, c):
+        """Return the stored results for the _CachedDocument, or None."""
+        try:
+            stat, digest, atime, info = self._items[c.filename]
+        except KeyError:
+            return
+        if digest == c.digest and stat == _stat(c.filename):
+            # the access time is only saved when the cache is modified
+            self._items[c.filename] = stat, digest, time.time(), info
+            return info
+    
+    def set(self, c, info):
+        """Store the results (a dictionary) for the _CachedDocument."""
+        stat = _stat(c.filename)
+        if stat:
+            self._items[c.filename] = stat, c.digest, time.time(), info
+            self._modified = True
+    
+    def save(self):
+        """Write the cache to disk if it was modified."""
+        if not self._modified:
+            return
+        items = sorted(self._items.items(), key=lambda i: i[1][2], reverse=True)
+        items = dict((filename, item) for filename, item in items[:self.maxsize]
+                     if os.path.exists(filename))
+        try:
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            with open(self._path + '.tmp', 'wb') as f:
+                pickle.dump((ly.pkginfo.version, items), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(self._path + '.tmp', self._path)
+        except (IOError, OSError):
+            pass
+        self._modified = False
+
+
+_disk_cache = None
+
+
+def _stat(filename):
+    """Return a tuple (mtime, size) for the filename, or None."""
+    s = statcache.stat(filename)
+    if s:
+        return s.st_mtime, s.st_size
+
+
+def disk_cache():
+    """Return the _DiskCache, or None if it is disabled in the preferences."""
+    global _disk_cache
+    if not QSettings().value("fileinfo_cache", True, bool):
+        return
+    if _disk_cache is None:
+        path = QStandardPaths.writableLocation(QStandardPaths.CacheLocation)
+        _disk_cache = _DiskCache(os.path.join(path, "fileinfo.cache"))
+    return _disk_cache
+
+
+@atexit.register
+def _save_disk_cache():
+    """Save the disk cache on exit."""
+    if _disk_cache is not None:
+        _disk_cache.save()
 
 
 def _cached(filename):
@@ -61,11 +211,12 @@ def _cached(filename):
         c = _document_cache[filename]
     except KeyError:
         with open(filename, 'rb') as f:
-            text = util.decode(f.read())
+            data = f.read()
         c = _document_cache[filename] = _CachedDocument()
-        c.variables = v = variables.variables(text)
-        c.document = ly.document.Document(text, v.get("mode"))
-        c.filename = c.document.filename = filename
+        c.filename = filename
+        c.text = util.decode(data)
+        c.digest = hashlib.sha1(data).hexdigest()
+        c.variables = variables.variables(c.text)
     return c
 
 
@@ -74,14 +225,44 @@ def document(filename):
     return _cached(filename).document
 
 
+def digest(filename):
+    """Return the (cached) SHA-1 hex digest of the contents of the file."""
+    return _cached(filename).digest
+
+
 def docinfo(filename):
-    """Return a (cached) LyDocInfo instance for the specified file."""
+    """Return a (cached) LyDocInfo instance for the specified file.
+    
+    If the results of the stored methods for the file are found in the disk
+    cache, an object is returned that only reads the file's tokens when
+    other information is requested.
+    
+    """
     c = _cached(filename)
     if c.docinfo is None:
-        c.docinfo = lydocinfo.DocInfo(c.document, c.variables)
+        cache = disk_cache()
+        info = cache and cache.get(c)
+        if info:
+            c.docinfo = _StoredDocInfo(c, info)
+        else:
+            c.docinfo = lydocinfo.DocInfo(c.document, c.variables)
+            if cache:
+                cache.set(c, dict((name, _plain(getattr(c.docinfo, name)()))
+                                  for name in _stored_methods))
     return c.docinfo
 
 
+def _plain(value):
+    """Return value with tokens turned into plain strings, for storing."""
+    if isinstance(value, list):
+        return [_plain(v) for v in value]
+    elif isinstance(value, tuple):
+        return tuple(_plain(v) for v in value)
+    elif isinstance(value, str):
+        return str(value)
+    return value
+
+
 def music(filename):
     """Return a (cached) music.Document instance for the specified file."""
     c = _cached(filename)
@@ -122,7 +303,7 @@ def includefiles(dinfo, include_path=()):
     
     def tryarg(directory, arg):
         path = os.path.realpath(os.path.join(directory, arg))
-        if path not in files and os.path.isfile(path):
+        if path not in files and statcache.isfile(path):
             files.add(path)
             args = docinfo(path).include_args()
             find(args, os.path.dirname(path))
@@ -24,6 +24,9 @@ about a document's contents.
 
 
 
+import time
+
+from PyQt5.QtCore import QTimer
 from PyQt5.QtGui import (
     QColor, QSyntaxHighlighter, QTextBlockUserData, QTextCharFormat,
     QTextCursor, QTextDocument)
@@ -33,10 +36,12 @@ import ly.lex
 import ly.colorize
 
 import app
+import compacttokens
 import cursortools
 import textformats
 import metainfo
 import plugin
+import signals
 import variables
 import documentinfo
 
@@ -94,15 +99,47 @@ class Highlighter(plugin.Plugin, QSyntaxHighlighter):
     The Highlighter automatically re-reads the highlighting settings if they
     are changed.
     
+    The blockTokensChanged signal is emitted with the QTextBlock as argument
+    every time new tokens are stored for a block.
+    
     """
+    blockTokensChanged = signals.Signal() # QTextBlock
+    
+    # maximum time (in seconds) to spend highlighting in one go, before
+    # the remaining blocks are highlighted in the background (at least one
+    # block is highlighted, so 0 highlights one block at a time)
+    timeSlice = 0.02
+    
+    # documents with at least this number of blocks store their tokens
+    # in a compact form (see compacttokens.py), None disables this
+    compactThreshold = 10000
+    
     def __init__(self, document):
         QSyntaxHighlighter.__init__(self, document)
+        # we want to know about changes before the QSyntaxHighlighter does,
+        # so we reconnect it after connecting ourselves
+        self.setDocument(None)
+        document.contentsChange.connect(self._contentsChange)
+        self.setDocument(document)
         self._fridge = ly.lex.Fridge()
         app.settingsChanged.connect(self.rehighlight)
         self._initialState = None
         self._highlighting = True
         self._mode = None
+        self._blockCount = document.blockCount()
+        self._pendingStart = None   # first block number to (re)highlight
+        self._pendingEnd = None     # last block number to (re)highlight
+        self._cutBlock = -1         # after this block highlighting is postponed
+        self._deadline = 0          # ... if this time has passed
+        self._autoContinue = True
+        self._compact = False
+        self._resetTimer = QTimer(singleShot=True, timeout=self._resetCut)
+        self._backgroundTimer = QTimer(singleShot=True,
+                                       timeout=self.continueHighlighting)
         self.initializeDocument()
+        self._updateCompact()
+        self._setPending(0, self._blockCount - 1)
+        self.continueHighlighting()
     
     def initializeDocument(self):
         """This method is always called by the __init__ method.
@@ -132,22 +169,103 @@ class Highlighter(plugin.Plugin, QSyntaxHighlighter):
         """Switch highlighting on or off depending on saved metainfo."""
         self.setHighlighting(metainfo.info(self.document()).highlighting)
         
+    def _contentsChange(self, position, removed, added):
+        """Called before the QSyntaxHighlighter handles a change.
+        
+        Marks the changed blocks for highlighting, and sets the block after
+        which highlighting the following blocks (if their state changed) may
+        be postponed to the background.
+        
+        """
+        doc = self.document()
+        count = doc.blockCount()
+        first = doc.findBlock(position).blockNumber()
+        if first == -1:
+            first = count - 1
+        last = doc.findBlock(position + added).blockNumber()
+        if last == -1:
+            last = count - 1
+        # renumber the pending blocks after the change
+        delta = count - self._blockCount
+        self._blockCount = count
+        if self._pendingStart is not None:
+            if self._pendingStart > first:
+                self._pendingStart = min(max(first, self._pendingStart + delta), count - 1)
+            if self._pendingEnd > first:
+                self._pendingEnd = min(max(first, self._pendingEnd + delta), count - 1)
+        self._setPending(first, last)
+        self._cutBlock = last
+        self._deadline = time.time() + self.timeSlice
+        self._resetTimer.start(0)
+        self._updateCompact()
+    
+    def _updateCompact(self):
+        """Decide whether to store tokens compactly, based on the size."""
+        threshold = self.compactThreshold
+        self._compact = (threshold is not None
+                         and self.document().blockCount() >= threshold)
+    
+    def _resetCut(self):
+        """Called when the event loop is reentered after a change."""
+        self._cutBlock = -1
+        self._deadline = 0
+    
+    def _setPending(self, first, last):
+        """Mark the blocks with numbers first through last for highlighting."""
+        if self._pendingStart is None:
+            self._pendingStart, self._pendingEnd = first, last
+        else:
+            self._pendingStart = min(self._pendingStart, first)
+            self._pendingEnd = max(self._pendingEnd, last)
+        if self._autoContinue and not self._backgroundTimer.isActive():
+            self._backgroundTimer.start(0)
+    
+    def _isPending(self, number):
+        """Return True if the block with the number needs highlighting."""
+        return (self._pendingStart is not None
+                and self._pendingStart <= number <= self._pendingEnd)
+    
+    def _mustPostpone(self, number):
+        """Return True if highlighting should stop at this block for now."""
+        return number > self._cutBlock and time.time() >= self._deadline
+    
     def highlightBlock(self, text):
         """Called by Qt when the highlighting of the current line needs updating."""
-        # find the state of the previous line
-        prev = self.previousBlockState()
-        state = self._fridge.thaw(prev)
-        blank = not state and (not text or text.isspace())
-        if not state:
-            state = self.initialState()
-
-        # collect and save the tokens
-        tokens = tuple(state.tokens(text))
-        cursortools.data(self.currentBlock()).tokens = tokens
-        
-        # if blank thus far, keep the highlighter coming back
-        # because the parsing state is not yet known; else save the state
-        self.setCurrentBlockState(prev - 1 if blank else self._fridge.freeze(state))
+        block = self.currentBlock()
+        number = block.blockNumber()
+        if ((not self._isPending(number) and block.userState() != -1)
+            or self._mustPostpone(number)):
+            # keeping the old state makes the QSyntaxHighlighter stop here;
+            # the old tokens are used (until we continue in the background)
+            self.setCurrentBlockState(block.userState())
+            try:
+                tokens = compacttokens.stored_tokens(block)
+            except AttributeError:
+                tokens = ()
+        else:
+            # find the state of the previous line
+            prev = self.previousBlockState()
+            state = self._fridge.thaw(prev)
+            blank = not state and (not text or text.isspace())
+            if not state:
+                state = self.initialState()
+            
+            # collect and save the tokens
+            tokens = tuple(state.tokens(text))
+            compacttokens.store_tokens(cursortools.data(block), tokens, self._compact)
+            self.blockTokensChanged(block)
+            
+            # if blank thus far, keep the highlighter coming back
+            # because the parsing state is not yet known; else save the state
+            newState = prev - 1 if blank else self._fridge.freeze(state)
+            if newState != block.userState() and number + 1 < self._blockCount:
+                self._setPending(number + 1, number + 1)
+            self.setCurrentBlockState(newState)
+            if number == self._pendingStart:
+                if number < self._pendingEnd:
+                    self._pendingStart += 1
+                else:
+                    self._pendingStart = self._pendingEnd = None
         
         # apply highlighting if desired
         if self._highlighting:
@@ -157,7 +275,98 @@ class Highlighter(plugin.Plugin, QSyntaxHighlighter):
                 f = mapping[token]
                 if f:
                     setFormat(f)
+    
+    def _highlightPending(self, last, deadline):
+        """Highlight the pending blocks.
         
+        If last is a block number, highlights the pending blocks up to and
+        including that block, the blocks after it are postponed. If last is
+        None, highlights blocks until the deadline (a time.time() value) has
+        passed, but always at least one block.
+        
+        """
+        doc = self.document()
+        while self._pendingStart is not None:
+            number = self._pendingStart
+            if last is not None and number > last:
+                break
+            block = doc.findBlockByNumber(number)
+            if not block.isValid():
+                self._pendingStart = self._pendingEnd = None
+                break
+            old = self._cutBlock, self._deadline
+            self._cutBlock = number if last is None else last
+            self._deadline = deadline
+            try:
+                self.rehighlightBlock(block)
+            finally:
+                self._cutBlock, self._deadline = old
+            if last is None and time.time() >= deadline:
+                break
+    
+    def continueHighlighting(self):
+        """Highlight the pending blocks for one time slice.
+        
+        Returns True if there are still blocks left to highlight.
+        This method is called automatically from a timer, unless that is
+        disabled using setAutoContinue().
+        
+        """
+        self._highlightPending(None, time.time() + self.timeSlice)
+        if self._pendingStart is not None:
+            if self._autoContinue:
+                self._backgroundTimer.start(0)
+            return True
+        return False
+    
+    def setAutoContinue(self, enable):
+        """Set whether postponed highlighting automatically continues.
+        
+        If disabled, someone else should call continueHighlighting(),
+        e.g. when the application is idle. The default is True.
+        
+        """
+        self._autoContinue = enable
+        if not enable:
+            self._backgroundTimer.stop()
+        elif self._pendingStart is not None:
+            self._backgroundTimer.start(0)
+    
+    def isBusy(self):
+        """Return True if highlighting still continues in the background."""
+        return self._pendingStart is not None
+    
+    def progress(self):
+        """Return the number of blocks that are highlighted without interruption.
+        
+        This is the block count of the document if the highlighter is not busy.
+        
+        """
+        if self._pendingStart is None:
+            return self.document().blockCount()
+        return self._pendingStart
+    
+    def ensureHighlighted(self, block):
+        """Make sure the tokens and the state at the end of block are known.
+        
+        Pending blocks are highlighted, but only up to and including the
+        specified block; the rest of the document is highlighted in the
+        background.
+        
+        """
+        self._highlightPending(block.blockNumber(), 0)
+        
+    def rehighlight(self):
+        """Reimplemented to highlight the whole document at once."""
+        self._pendingStart = self._pendingEnd = None
+        self._setPending(0, self.document().blockCount() - 1)
+        old = self._cutBlock
+        self._cutBlock = self.document().blockCount()
+        try:
+            QSyntaxHighlighter.rehighlight(self)
+        finally:
+            self._cutBlock = old
+    
     def setHighlighting(self, enable):
         """Enable or disable highlighting."""
         changed = enable != self._highlighting
@@ -0,0 +1,159 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Tokenizes loaded documents in the background while the user is idle.
+
+When a document is loaded (e.g. when a session with many documents is
+restored), it is queued here. When a document was not changed and the
+cursor and view were not moved for a while, the documents are tokenized
+one after another, in small time slices, using the highlighter of each
+document. So the tokens are already there when the user switches to a
+document, or when a tool like autocompile needs them.
+
+The progress(Document, done, total) signal is emitted after each time slice,
+the finished(Document) signal when a document has been tokenized completely.
+
+"""
+
+
+import weakref
+
+from PyQt5.QtCore import QObject, QTimer
+
+import app
+import highlighter
+import signals
+
+
+progress = signals.Signal()     # Document, blocks done, total blocks
+finished = signals.Signal()     # Document
+
+
+class IdleTokenizer(QObject):
+    """Tokenizes queued documents in time slices when the user is idle."""
+
+    # seconds to wait after user input before continuing
+    inputDelay = 0.5
+
+    # milliseconds between two time slices
+    interval = 10
+
+    def __init__(self):
+        super(IdleTokenizer, self).__init__()
+        self._queue = []
+        self._timer = QTimer(singleShot=True, timeout=self.slotTimeout)
+        app.documentCreated.connect(self.documentCreated)
+        app.documentLoaded.connect(self.add)
+        app.documentClosed.connect(self.remove)
+        app.viewCreated.connect(self.viewCreated)
+        app.mainwindowCreated.connect(self.mainwindowCreated)
+        for d in app.documents:
+            self.documentCreated(d)
+        for w in app.windows:
+            self.mainwindowCreated(w)
+
+    def mainwindowCreated(self, mainwindow):
+        """Called when a MainWindow is created."""
+        mainwindow.currentDocumentChanged.connect(self.currentDocumentChanged)
+
+    def currentDocumentChanged(self, document):
+        """Called when a document is shown; it highlights itself from now on."""
+        if any(ref() is document for ref in self._queue):
+            highlighter.highlighter(document).setAutoContinue(True)
+
+    def documentCreated(self, document):
+        """Called when a Document is created."""
+        document.contentsChange.connect(self.activity)
+
+    def viewCreated(self, view):
+        """Called when a View is created."""
+        view.cursorPositionChanged.connect(self.activity)
+        view.verticalScrollBar().valueChanged.connect(self.activity)
+
+    def activity(self, *args):
+        """Called on user input, postpones tokenizing until the user is idle."""
+        if self._queue:
+            self._timer.start(int(self.inputDelay * 1000))
+
+    def add(self, document):
+        """Queue a document for tokenizing."""
+        if not any(ref() is document for ref in self._queue):
+            self._queue.append(weakref.ref(document))
+            self.start()
+
+    def remove(self, document):
+        """Remove a document from the queue."""
+        self._queue = [ref for ref in self._queue if ref() not in (None, document)]
+
+    def start(self):
+        """Start tokenizing, if there is work to do."""
+        if self._queue and not self._timer.isActive():
+            self._timer.start(self.interval)
+
+    def slotTimeout(self):
+        """Called by the timer, tokenizes the first document for a while."""
+        while self._queue:
+            doc = self._queue[0]()
+            if doc is not None:
+                break
+            del self._queue[0]
+        else:
+            return
+        hl = highlighter.highlighter(doc)
+        if doc in [w.currentDocument() for w in app.windows]:
+            # the current document of a window continues highlighting by
+            # itself; look again later whether it has finished
+            hl.setAutoContinue(True)
+            if hl.isBusy():
+                self._queue.append(self._queue.pop(0))
+                self._timer.start(self.interval)
+                return
+        else:
+            hl.setAutoContinue(False)
+            if hl.continueHighlighting():
+                progress(doc, hl.progress(), doc.blockCount())
+                self._timer.start(self.interval)
+                return
+            hl.setAutoContinue(True)
+        del self._queue[0]
+        progress(doc, doc.blockCount(), doc.blockCount())
+        finished(doc)
+        self.start()
+
+
+_tokenizer = None
+
+
+def tokenizer():
+    """Return the global IdleTokenizer, creating it if needed."""
+    global _tokenizer
+    if _tokenizer is None:
+        _tokenizer = IdleTokenizer()
+    return _tokenizer
+
+
+@app.oninit
+def _start():
+    """Create the IdleTokenizer and queue the already loaded documents."""
+    t = tokenizer()
+    for d in app.documents:
+        t.add(d)
+
+
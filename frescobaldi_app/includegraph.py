@@ -0,0 +1,246 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Keeps track of the files the open documents include.
+
+The include graph consists of the files that are included by the open
+Documents, with for every file the files it includes itself. The included
+files of a file depend on its directory, the directory of the master
+document and the include path; that is the context of its edges.
+
+For every Document of which the included files are requested, the set of
+files it includes (recursively) is kept, and for every included file the
+Documents that include it (the reverse edges). So it is easy to find out
+which documents are affected when a file changes.
+
+The included files are watched; when one of them is changed on disk, or
+saved from within Frescobaldi, only the edges of that file (and the edges
+of files that could not find it before) are discarded, and the include sets
+containing that file are computed again when requested.
+
+"""
+
+
+import collections
+import os
+import weakref
+
+from PyQt5.QtCore import QFileSystemWatcher
+
+import app
+import fileinfo
+import signals
+import statcache
+
+
+__all__ = ['includefiles', 'masters', 'changed']
+
+
+changed = signals.Signal()  # filename, set of Documents that included it
+
+
+# filename -> {context: (frozenset of included filenames, set of missing paths)}
+_edges = collections.defaultdict(dict)
+
+# path -> set of (filename, context) of the files that did not find it
+_missing = collections.defaultdict(set)
+
+# path -> Documents that did not find it
+_missing_documents = collections.defaultdict(weakref.WeakSet)
+
+# Document -> [key, context, included filenames, missing paths, include set]
+_documents = weakref.WeakKeyDictionary()
+
+# filename -> Documents that include it (recursively)
+_masters = collections.defaultdict(weakref.WeakSet)
+
+# one global QFileSystemWatcher instance
+watcher = None
+
+
+def includefiles(document, dinfo, include_path):
+    """Return the frozenset of files included by the Document.
+
+    dinfo is the LyDocInfo of the document and include_path the list of
+    directories to search. The files are found in the same way as
+    fileinfo.includefiles() does, and the set is reused until the include
+    arguments of the document, the include path or one of the included
+    files change.
+
+    """
+    filename = dinfo.document.filename
+    context = (os.path.dirname(filename) if filename else None, tuple(include_path))
+    key = tuple(dinfo.include_args())
+    entry = _documents.get(document)
+    if entry is None or entry[:2] != [key, context]:
+        _forget(document)
+        files, missing = _resolve(key, context[0], context)
+        for path in missing:
+            _missing_documents[path].add(document)
+        entry = _documents[document] = [key, context, files, missing, None]
+    if entry[4] is None:
+        files = set()
+        todo = list(entry[2])
+        while todo:
+            f = todo.pop()
+            if f not in files:
+                files.add(f)
+                todo.extend(_children(f, context))
+        files = entry[4] = frozenset(files)
+        for f in files:
+            _masters[f].add(document)
+        _watch(files)
+    return entry[4]
+
+
+def masters(filename):
+    """Return the set of Documents that are known to include the file."""
+    return set(_masters.get(os.path.realpath(filename), ()))
+
+
+def invalidate(filename):
+    """Discard the edges and include sets depending on the file (because it changed)."""
+    filename = os.path.realpath(filename)
+    statcache.invalidate(filename)
+    files = [filename]
+    # the files and documents that did not find the file before
+    for node in _missing.pop(filename, ()):
+        files.append(node[0])
+        _remove_edges(*node)
+    documents = set(_missing_documents.pop(filename, ()))
+    for document in documents:
+        _forget(document)
+    # the edges of the file itself
+    for context in list(_edges.get(filename, ())):
+        _remove_edges(filename, context)
+    for f in files:
+        documents.update(_masters.get(f, ()))
+    for document in documents:
+        _discard_includes(document)
+    if documents:
+        changed(filename, documents)
+
+
+def _resolve(args, directory, context):
+    """Find the files the include args refer to.
+
+    Returns a two-tuple: the frozenset of the found files and the set of
+    the paths that were tried but did not exist.
+
+    """
+    basedir, include_path = context
+    files = set()
+    missing = set()
+    for arg in args:
+        for d in (directory, basedir) + include_path:
+            if d:
+                path = os.path.realpath(os.path.join(d, arg))
+                if statcache.isfile(path):
+                    files.add(path)
+                    break
+                missing.add(path)
+    return frozenset(files), missing
+
+
+def _children(filename, context):
+    """Return the frozenset of the files the file includes in the context."""
+    try:
+        return _edges[filename][context][0]
+    except KeyError:
+        pass
+    try:
+        args = fileinfo.docinfo(filename).include_args()
+    except (IOError, OSError):
+        args = ()
+    files, missing = _resolve(args, os.path.dirname(filename), context)
+    _edges[filename][context] = (files, missing)
+    node = (filename, context)
+    for path in missing:
+        _missing[path].add(node)
+    return files
+
+
+def _remove_edges(filename, context):
+    """Remove the edges of the file in the context."""
+    contexts = _edges.get(filename)
+    if not contexts or context not in contexts:
+        return
+    missing = contexts.pop(context)[1]
+    if not contexts:
+        del _edges[filename]
+    node = (filename, context)
+    for path in missing:
+        _discard(_missing, path, node)
+
+
+def _discard(mapping, key, value):
+    """Remove value from the set mapping[key], and the key if the set is empty."""
+    values = mapping.get(key)
+    if values is not None:
+        values.discard(value)
+        if not values:
+            del mapping[key]
+
+
+def _discard_includes(document):
+    """Remove the include set of the document, it is computed again when needed."""
+    entry = _documents.get(document)
+    if entry is None or entry[4] is None:
+        return
+    files, entry[4] = entry[4], None
+    for filename in files:
+        _discard(_masters, filename, document)
+        if filename not in _masters and watcher is not None:
+            watcher.removePath(filename)
+
+
+def _forget(document):
+    """Remove everything that is kept about the document."""
+    _discard_includes(document)
+    entry = _documents.pop(document, None)
+    if entry is not None:
+        for path in entry[3]:
+            _discard(_missing_documents, path, document)
+
+
+def _watch(files):
+    """Add the files to the filesystem watcher."""
+    global watcher
+    if watcher is None:
+        watcher = QFileSystemWatcher()
+        watcher.fileChanged.connect(invalidate)
+    watching = set(watcher.files())
+    new = [f for f in files if f not in watching]
+    if new:
+        watcher.addPaths(new)
+
+
+@app.documentSaved.connect
+def _documentSaved(document):
+    """Called when a document is saved."""
+    filename = document.url().toLocalFile()
+    if filename:
+        invalidate(filename)
+
+
+@app.documentClosed.connect
+def _documentClosed(document):
+    """Called when a document is closed."""
+    _forget(document)
@@ -23,8 +23,12 @@ to get it later or to have a log follow it.
 """
 
 
+import bisect
 import codecs
+import collections
+import heapq
 import os
+import tempfile
 import time
 
 from PyQt5.QtCore import QCoreApplication, QProcess, QProcessEnvironment
@@ -91,7 +95,7 @@ class Job(object):
         self._title = ""
         self._aborted = False
         self._process = None
-        self._history = []
+        self._history = History()
         self._starttime = 0.0
         self._elapsed = 0.0
         self.decoder_stdout = self.create_decoder(STDOUT)
@@ -133,12 +137,7 @@ class Job(object):
     
     def start(self):
         """Starts the process."""
-        self.success = None
-        self.error = None
-        self._aborted = False
-        self._history = []
-        self._elapsed = 0.0
-        self._starttime = time.time()
+        self._begin()
         if self._process is None:
             self.set_process(QProcess())
         self.start_message()
@@ -182,6 +181,11 @@ class Job(object):
         """Returns True if this job is running."""
         return bool(self._process)
     
+    def process_id(self):
+        """Return the id of the running process, or None."""
+        if self._process:
+            return self._process.processId() or None
+    
     def failed_to_start(self):
         """Return True if the process failed to start.
         
@@ -210,26 +214,40 @@ class Job(object):
     def message(self, text, type=NEUTRAL):
         """Output some text as the given type (NEUTRAL, SUCCESS, FAILURE, STDOUT or STDERR)."""
         self.output(text, type)
-        self._history.append((text, type))
+        self._history.append(text, type)
         
-    def history(self, types=ALL):
+    def history(self, types=ALL, start=0):
         """Yield the output messages as two-tuples (text, type) since the process started.
         
         If types is given, it should be an OR-ed combination of the status types
         STDERR, STDOUT, NEUTRAL, SUCCESS or FAILURE.
         
+        If start is given, the messages before that number are skipped, so
+        a consumer that has read history_length() messages before can
+        continue where it left off.
+        
         """
-        for msg, type in self._history:
-            if type & types:
-                yield msg, type
+        return self._history.messages(types, start)
+    
+    def history_length(self):
+        """Return the number of messages since the process started."""
+        return len(self._history)
+    
+    def history_lines(self, types=OUTPUT, start=0):
+        """Yield the text of the messages of the types as complete lines.
+        
+        See History.lines().
+        
+        """
+        return self._history.lines(types, start)
         
     def stdout(self):
         """Return the standard output of the process as unicode text."""
-        return "".join(self.history(STDOUT))
+        return "".join(msg for msg, type in self.history(STDOUT))
     
     def stderr(self):
         """Return the standard error of the process as unicode text."""
-        return "".join(self.history(STDERR))
+        return "".join(msg for msg, type in self.history(STDERR))
     
     def _finished(self, exitCode, exitStatus):
         """(internal) Called when the process has finished."""
@@ -245,12 +263,30 @@ class Job(object):
     
     def _bye(self, success):
         """(internal) Ends and emits the done() signal."""
-        self._elapsed = time.time() - self._starttime
         if not success:
             self.error = self._process.error()
-        self.success = success
         self._process.deleteLater()
         self._process = None
+        self._end(success)
+    
+    def _begin(self):
+        """(internal) Resets the state of the job, called when it is started.
+        
+        A subclass that runs the job in another way than in a QProcess calls
+        this method when it starts, and _end() when the job has finished.
+        
+        """
+        self.success = None
+        self.error = None
+        self._aborted = False
+        self._history = History()
+        self._elapsed = 0.0
+        self._starttime = time.time()
+    
+    def _end(self, success):
+        """(internal) Records the result and emits the done() signal."""
+        self._elapsed = time.time() - self._starttime
+        self.success = success
         self.done(success)
         
     def _readstderr(self):
@@ -319,3 +355,84 @@ class Job(object):
         return '{0:.1f}"'.format(seconds)
 
 
+class History(object):
+    """Stores the messages of a Job, keeping the memory usage bounded.
+    
+    The messages are (text, type) tuples, numbered from 0. When the texts of
+    the messages in memory exceed maxsize characters, the oldest messages
+    are written to a temporary file. The numbers of the messages of every
+    type are kept, so messages of one type are found without looking at the
+    others.
+    
+    """
+    maxsize = 1048576
+    
+    def __init__(self):
+        self._memory = []       # (text, type) tuples, from self._first on
+        self._first = 0
+        self._size = 0          # total length of the texts in memory
+        self._file = None       # temporary file with the spilled messages
+        self._spilled = []      # (offset, length, type) per spilled message
+        self._types = collections.defaultdict(list) # type -> message numbers
+    
+    def __len__(self):
+        return len(self._spilled) + len(self._memory) - self._first
+    
+    def append(self, text, type):
+        """Adds a message."""
+        self._types[type].append(len(self))
+        self._memory.append((text, type))
+        self._size += len(text)
+        while self._size > self.maxsize and len(self._memory) - self._first > 1:
+            self._spill()
+    
+    def _spill(self):
+        """(internal) Writes the oldest message in memory to the file."""
+        text, type = self._memory[self._first]
+        self._first += 1
+        if self._first > 1024 and self._first * 2 > len(self._memory):
+            del self._memory[:self._first]
+            self._first = 0
+        self._size -= len(text)
+        if self._file is None:
+            self._file = tempfile.TemporaryFile()
+        data = text.encode('utf-8', 'surrogatepass')
+        offset = self._file.seek(0, 2)
+        self._file.write(data)
+        self._spilled.append((offset, len(data), type))
+    
+    def get(self, index):
+        """Returns the message (text, type) with the number."""
+        spilled = len(self._spilled)
+        if index < spilled:
+            offset, length, type = self._spilled[index]
+            self._file.seek(offset)
+            return self._file.read(length).decode('utf-8', 'surrogatepass'), type
+        return self._memory[self._first + index - spilled]
+    
+    def messages(self, types=ALL, start=0):
+        """Yields the messages (text, type) of the types, from number start."""
+        if types & ALL == ALL:
+            indices = range(start, len(self))
+        else:
+            indices = heapq.merge(*(l[bisect.bisect_left(l, start):]
+                                    for t, l in self._types.items() if t & types))
+        for i in indices:
+            yield self.get(i)
+    
+    def lines(self, types=OUTPUT, start=0):
+        """Yields the text of the messages of the types as complete lines.
+        
+        A process writes output in chunks that do not necessarily end at a
+        line boundary; the chunks are joined and every line is yielded with
+        its newline. The last line is yielded even if it has no newline.
+        
+        """
+        rest = ''
+        for text, type in self.messages(types, start):
+            lines = (rest + text).split('\n')
+            rest = lines.pop()
+            for line in lines:
+                yield line + '\n'
+        if rest:
+            yield rest
@@ -31,6 +31,11 @@ def get(job):
     return JobAttributes.instance(job)
 
 
+def copy(job, other):
+    """Copies the attributes of the job to the other job."""
+    get(other)._attrs.update(get(job)._attrs)
+
+
 class JobAttributes(plugin.AttributePlugin):
     """Manages attributes of a Job.
     
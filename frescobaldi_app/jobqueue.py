@@ -0,0 +1,189 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+A global queue for engraving jobs.
+
+The JobQueue runs jobs on behalf of documents (using the JobManager of each
+document), but not more at the same time than configured in the
+preferences (by default the number of processors).
+
+Every job has a priority: INTERACTIVE jobs (started by the user for the
+current document) are run before BATCH jobs (e.g. engraving all documents).
+When an interactive job is added while the maximum number of jobs is
+running, a running batch job is aborted and queued again, to make room.
+
+The progress(done, total) signal is emitted when a job is added or has
+finished, the finished() signal when all queued jobs are done.
+
+"""
+
+
+import bisect
+import os
+
+from PyQt5.QtCore import QSettings
+
+import app
+import jobmanager
+import signals
+
+
+# priorities
+INTERACTIVE = 0
+BATCH = 1
+
+
+progress = signals.Signal()     # jobs done, total jobs
+finished = signals.Signal()     # (no arguments)
+
+
+def queue():
+    """Return the global JobQueue, creating it if needed."""
+    global _queue
+    if _queue is None:
+        _queue = JobQueue()
+    return _queue
+
+_queue = None
+
+
+def max_jobs():
+    """Return the maximum number of jobs that may run at the same time."""
+    return max(1, QSettings().value("lilypond_settings/max_jobs", os.cpu_count() or 1, int))
+
+
+class JobQueue(object):
+    """Runs jobs in order of priority, with a maximum number at a time."""
+    def __init__(self):
+        self._waiting = []  # sorted list of (priority, serial, document, job)
+        self._running = {}  # job -> (priority, serial, document, slot)
+        self._preempted = set()
+        self._serial = 0
+        self._done = 0
+        self._total = 0
+        self._maxJobs = None
+        app.documentClosed.connect(self._documentClosed)
+        app.jobFinished.connect(self._start)
+
+    def add(self, job, document, priority=BATCH):
+        """Queue the job to be run on behalf of the document."""
+        self._serial += 1
+        bisect.insort(self._waiting, (priority, self._serial, document, job))
+        self._total += 1
+        if priority == INTERACTIVE:
+            self._preempt()
+        self._start()
+        progress(self._done, self._total)
+
+    def cancel(self, job):
+        """Remove the job from the queue, or abort it if it is running."""
+        for i, entry in enumerate(self._waiting):
+            if entry[3] is job:
+                del self._waiting[i]
+                self._total -= 1
+                self._check()
+                return
+        if job in self._running:
+            job.abort()
+
+    def cancelAll(self):
+        """Remove all waiting jobs from the queue and abort the running ones."""
+        self._total -= len(self._waiting)
+        del self._waiting[:]
+        for job in list(self._running):
+            job.abort()
+        self._check()
+
+    def jobs(self):
+        """Return the list of running and waiting jobs."""
+        return list(self._running) + [entry[3] for entry in self._waiting]
+
+    def setMaxJobs(self, count):
+        """Override the maximum number of jobs from the preferences.
+
+        Use None to use the preferences setting again.
+
+        """
+        self._maxJobs = count
+        self._start()
+
+    def maxJobs(self):
+        """Return the maximum number of jobs that may run at the same time."""
+        return max(1, self._maxJobs) if self._maxJobs else max_jobs()
+
+    def count(self):
+        """Return a two-tuple (done, total) for the current batch of jobs."""
+        return self._done, self._total
+
+    def _start(self, *args):
+        """Start waiting jobs, as long as the maximum is not reached."""
+        limit = self.maxJobs()
+        i = 0
+        while i < len(self._waiting) and len(self._running) < limit:
+            priority, serial, document, job = self._waiting[i]
+            if jobmanager.manager(document).is_running():
+                # only one job per document, wait for the current job
+                i += 1
+                continue
+            del self._waiting[i]
+            slot = lambda success, job=job: self._jobDone(job, success)
+            self._running[job] = (priority, serial, document, slot)
+            job.done.connect(slot)
+            jobmanager.manager(document).start_job(job)
+
+    def _preempt(self):
+        """Abort the most recently started batch job if there is no room."""
+        if len(self._running) < self.maxJobs():
+            return
+        batch = [(serial, job) for job, (priority, serial, document, slot)
+                 in self._running.items()
+                 if priority == BATCH and job not in self._preempted]
+        if batch:
+            job = max(batch)[1]
+            self._preempted.add(job)
+            job.abort()
+
+    def _jobDone(self, job, success):
+        """Called when a running job has finished."""
+        priority, serial, document, slot = self._running.pop(job)
+        job.done.disconnect(slot)
+        if job in self._preempted:
+            # requeue it with its original position
+            self._preempted.discard(job)
+            bisect.insort(self._waiting, (priority, serial, document, job))
+        else:
+            self._done += 1
+        self._start()
+        progress(self._done, self._total)
+        self._check()
+
+    def _check(self):
+        """Emit finished() and reset the counters if no jobs are left."""
+        if not self._waiting and not self._running and self._total:
+            self._done = self._total = 0
+            finished()
+
+    def _documentClosed(self, document):
+        """Called when a document is closed, removes its waiting jobs."""
+        for entry in self._waiting[:]:
+            if entry[2] is document:
+                self._waiting.remove(entry)
+                self._total -= 1
+        self._check()
@@ -24,11 +24,12 @@ Settings stuff and handling for different LilyPond versions.
 
 import glob
 import codecs
+import json
 import os
 import sys
 import re
 
-from PyQt5.QtCore import QEventLoop, QSettings, QTimer
+from PyQt5.QtCore import QEventLoop, QSettings, QStandardPaths, QTimer
 from PyQt5.QtWidgets import QProgressDialog
 
 import app
@@ -38,7 +39,8 @@ import util
 import qutil
 
 
-_scheduler = process.Scheduler()
+# probe different LilyPond versions in parallel
+_scheduler = process.Scheduler(os.cpu_count() or 1)
 
 
 _infos = None   # this can hold a list of configured LilyPondInfo instances
@@ -61,6 +63,9 @@ def infos():
             if info.abscommand():
                 _infos.append(info)
         app.aboutToQuit.connect(saveinfos)
+        # start finding out the versions, so they are known when needed
+        for info in _infos:
+            info.datadir.start()
     return _infos
 
 
@@ -129,6 +134,85 @@ def suitable(version):
     return preferred()
 
 
+def _stat(filename):
+    """Return a list [mtime, size] for the filename, or None."""
+    try:
+        s = os.stat(filename)
+    except OSError:
+        return
+    return [int(s.st_mtime), s.st_size]
+
+
+def _probe_cache_path():
+    """Return the filename of the probe cache."""
+    return os.path.join(QStandardPaths.writableLocation(
+        QStandardPaths.CacheLocation), 'lilypondinfo.json')
+
+
+_probe_cache = None
+
+
+def probe_cache():
+    """Return the dictionary with the results of probing LilyPond executables.
+    
+    The dictionary maps the absolute path of an executable to a dictionary
+    with a "stat" entry (the mtime and size of the executable) and the probed
+    values (like "version" and "datadir"). The cache is saved on exit, so
+    LilyPond needs to be run only once for every executable.
+    
+    """
+    global _probe_cache
+    if _probe_cache is None:
+        _probe_cache = {}
+        try:
+            with open(_probe_cache_path(), encoding='utf-8') as f:
+                cache = json.load(f)
+        except (IOError, OSError, ValueError):
+            pass
+        else:
+            if isinstance(cache, dict):
+                _probe_cache = cache
+        app.aboutToQuit.connect(_save_probe_cache)
+    return _probe_cache
+
+
+def _save_probe_cache():
+    """Write the probe cache to disk, dropping the executables that are gone."""
+    cache = dict((command, entry) for command, entry in probe_cache().items()
+                 if entry.get('stat') == _stat(command))
+    path = _probe_cache_path()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(cache, f, indent=1)
+        os.replace(path + '.tmp', path)
+    except (IOError, OSError):
+        pass
+
+
+def probed(command, name):
+    """Return the value stored for the executable command, or None.
+    
+    None is also returned when the executable has changed since the value
+    was stored.
+    
+    """
+    entry = probe_cache().get(command)
+    if entry and entry.get('stat') == _stat(command):
+        return entry.get(name)
+
+
+def store_probed(command, name, value):
+    """Store a value found by running the executable command."""
+    stat = _stat(command)
+    if stat:
+        cache = probe_cache()
+        entry = cache.get(command)
+        if not entry or entry.get('stat') != stat:
+            entry = cache[command] = {'stat': stat}
+        entry[name] = value
+
+
 class CachedProperty(cachedproperty.CachedProperty):
     def wait(self, msg=None, timeout=0):
         """Returns the value for the property, waiting for it to be computed.
@@ -215,6 +299,10 @@ class LilyPondInfo(object):
         if not self.abscommand():
             return ""
         
+        version = probed(self.abscommand(), 'version')
+        if version:
+            return version
+        
         p = process.Process([self.abscommand(), '--version'])
         
         @p.done.connect
@@ -223,6 +311,8 @@ class LilyPondInfo(object):
                 output = codecs.decode(p.process.readLine(), 'latin1', 'replace')
                 m = re.search(r"\d+\.\d+(.\d+)?", output)
                 self.versionString = m.group() if m else ""
+                if m:
+                    store_probed(self.abscommand(), 'version', m.group())
             else:
                 self.versionString = ""
         
@@ -259,6 +349,10 @@ class LilyPondInfo(object):
         if not self.abscommand():
             return False
         
+        d = probed(self.abscommand(), 'datadir')
+        if d and os.path.isdir(d):
+            return d
+        
         # First ask LilyPond itself.
         p = process.Process([self.abscommand(), '-e',
             "(display (ly:get-option 'datadir)) (newline) (exit)"])
@@ -267,6 +361,7 @@ class LilyPondInfo(object):
             if success:
                 d = codecs.decode(p.process.readLine(), 'latin1', 'replace').strip('\n')
                 if os.path.isabs(d) and os.path.isdir(d):
+                    store_probed(self.abscommand(), 'datadir', d)
                     self.datadir = d
                     return
             
@@ -359,7 +454,9 @@ class LilyPondInfo(object):
                 info.name = settings.value("name", "LilyPond", str)
                 for name in cls.ly_tool_names:
                     info.set_ly_tool(name, settings.value(name, name, str))
-                if int(os.path.getmtime(info.abscommand())) == int(settings.value("mtime", 0, float)):
+                stat = _stat(info.abscommand())
+                if (stat and stat[0] == int(settings.value("mtime", 0, float))
+                    and stat[1] == settings.value("size", -1, int)):
                     info.versionString = settings.value("version", "", str)
                     datadir = settings.value("datadir", "", str)
                     if datadir and os.path.isdir(datadir):
@@ -371,8 +468,10 @@ class LilyPondInfo(object):
         settings.setValue("command", self.command)
         settings.setValue("version", self.versionString())
         settings.setValue("datadir", self.datadir() or "")
-        if self.abscommand():
-            settings.setValue("mtime", int(os.path.getmtime(self.abscommand())))
+        stat = self.abscommand() and _stat(self.abscommand())
+        if stat:
+            settings.setValue("mtime", stat[0])
+            settings.setValue("size", stat[1])
         settings.setValue("auto", self.auto)
         settings.setValue("name", self.name)
         for name in self.ly_tool_names:
@@ -58,7 +58,7 @@ class Log(QTextBrowser):
     
     def connectJob(self, job):
         """Gives us the output from the Job (past and upcoming)."""
-        for msg, type in job.history():
+        for msg, type in job.history(self._types):
             self.write(msg, type)
         job.output.connect(self.write)
         
@@ -19,6 +19,11 @@
 
 """
 Manages cursor positions of file-references in error messages.
+
+The output of a job is parsed line by line, as it comes in (see Parser).
+The error marks in the documents are set in batches, once per event loop
+iteration, so that jobs printing thousands of warnings do not slow down the
+user interface.
 """
 
 
@@ -26,7 +31,7 @@ import os
 import re
 import sys
 
-from PyQt5.QtCore import QSettings, QUrl
+from PyQt5.QtCore import QSettings, QTimer, QUrl
 from PyQt5.QtGui import QTextCursor
 
 import app
@@ -47,17 +52,99 @@ def errors(document):
     return Errors.instance(document)
 
 
+def _setMark(document, linenum):
+    """Sets an error mark on the line of the document, in the next batch."""
+    _pending.setdefault(document, set()).add(linenum)
+    if not _timer.isActive():
+        _timer.start()
+
+
+def _setMarks():
+    """Sets the pending error marks."""
+    for document, linenums in _pending.items():
+        bookmarks.bookmarks(document).setMarks(linenums, "error")
+    _pending.clear()
+
+
+def _clearMarks(document):
+    """Clears the error marks of the document, including pending ones."""
+    _pending.pop(document, None)
+    bookmarks.bookmarks(document).clear("error")
+
+
+_pending = {}   # Document -> set of line numbers
+_timer = QTimer(singleShot=True, interval=0, timeout=_setMarks)
+
+
+class Parser(object):
+    """Finds the file references in the output of a job.
+    
+    The output comes in chunks, that do not necessarily end at a line
+    boundary; only complete lines are parsed, and the incomplete last line
+    is kept until the rest of it arrives, or flush() is called.
+    
+    If messages is True, the text of the message after every reference
+    is also returned (see parse()).
+    
+    """
+    def __init__(self, messages=False):
+        self._rest = b''
+        self._encoding = sys.getfilesystemencoding()
+        self._messages = messages
+    
+    def feed(self, text):
+        """Returns the references in the complete lines of text.
+        
+        See parse() for the format of the references.
+        
+        """
+        data = self._rest + text.encode('latin1')
+        end = data.rfind(b'\n') + 1
+        self._rest = data[end:]
+        return self.parse(data[:end]) if end else []
+    
+    def flush(self):
+        """Returns the references in the remaining (incomplete) line."""
+        data, self._rest = self._rest, b''
+        return self.parse(data)
+    
+    def parse(self, data):
+        """Returns a list of four-tuples (url, filename, line, column).
+        
+        data is a bytes string containing complete lines. If the Parser was
+        created with messages=True, five-tuples are returned, the message
+        text following the reference on the same line being the last item.
+        
+        """
+        if b':' not in data:
+            return []
+        enc = self._encoding
+        refs = []
+        for m in message_re.finditer(data):
+            ref = (m.group(1).decode(enc),
+                   util.normpath(m.group(2).decode(enc)),
+                   int(m.group(3)), int(m.group(4) or 0))
+            if self._messages:
+                end = data.find(b'\n', m.end())
+                if end == -1:
+                    end = len(data)
+                ref += (data[m.end()+1:end].decode('utf-8', 'replace').strip(),)
+            refs.append(ref)
+        return refs
+
+
 class Errors(plugin.DocumentPlugin):
     """Maintains the list of references (errors/warnings) to documents after a Job run."""
     
     def __init__(self, document):
         self._refs = {}
+        self._parser = Parser()
         mgr = jobmanager.manager(document)
         if mgr.job():
             self.connectJob(mgr.job())
         mgr.started.connect(self.connectJob)
         
-    def connectJob(self, job):
+    def connectJob(self, j):
         """Starts collecting the references of a started Job.
         
         Output already created by the Job is read and we start
@@ -65,7 +152,7 @@ class Errors(plugin.DocumentPlugin):
         
         """
         # do not collect errors for auto-engrave jobs if the user has disabled it
-        if jobattributes.get(job).hidden and QSettings().value("log/hide_auto_engrave", False, bool):
+        if jobattributes.get(j).hidden and QSettings().value("log/hide_auto_engrave", False, bool):
             return
         # clear earlier set error marks
         docs = {self.document()}
@@ -74,12 +161,16 @@ class Errors(plugin.DocumentPlugin):
             if c:
                 docs.add(c.document())
         for doc in docs:
-            bookmarks.bookmarks(doc).clear("error")
+            _clearMarks(doc)
         self._refs.clear()
         # take over history and connect
-        for msg, type in job.history():
+        self._parser = Parser()
+        for msg, type in j.history(job.STDERR):
             self.slotJobOutput(msg, type)
-        job.output.connect(self.slotJobOutput)
+        j.output.connect(self.slotJobOutput)
+        j.done.connect(self.slotJobDone)
+        if not j.is_running():
+            self.slotJobDone()
     
     def slotJobOutput(self, message, type):
         """Called whenever the job has output.
@@ -89,13 +180,16 @@ class Errors(plugin.DocumentPlugin):
         
         """
         if type == job.STDERR:
-            enc = sys.getfilesystemencoding()
-            for m in message_re.finditer(message.encode('latin1')):
-                url = m.group(1).decode(enc)
-                filename = m.group(2).decode(enc)
-                filename = util.normpath(filename)
-                line, column = int(m.group(3)), int(m.group(4) or 0)
-                self._refs[url] = Reference(filename, line, column)
+            self.addReferences(self._parser.feed(message))
+    
+    def slotJobDone(self):
+        """Called when the job has finished, parses the last line."""
+        self.addReferences(self._parser.flush())
+    
+    def addReferences(self, references):
+        """Adds the references, as returned by the Parser."""
+        for url, filename, line, column in references:
+            self._refs[url] = Reference(filename, line, column)
         
     def cursor(self, url, load=False):
         """Returns a QTextCursor belonging to the url (string).
@@ -145,7 +239,7 @@ class Reference(object):
             c.setPosition(b.position() + self._column)
             document.closed.connect(self.unbind)
             if self._line > 0:
-                bookmarks.bookmarks(document).setMark(self._line - 1, "error")
+                _setMark(document, self._line - 1)
         else:
             self._cursor = None
             
@@ -30,9 +30,12 @@ available to both text documents on disk and loaded Frescobaldi documents.
 
 from __future__ import absolute_import
 
+import collections
 import re
 
 import ly.docinfo
+import ly.lex.lilypond
+import ly.pitch
 
 
 class DocInfo(ly.docinfo.DocInfo):
@@ -49,6 +52,10 @@ class DocInfo(ly.docinfo.DocInfo):
         version = super(DocInfo, self).version_string()
         if version:
             return version
+        return self._version_fallback()
+    
+    def _version_fallback(self):
+        """Return the version from the variables or comments, if any."""
         version = self.variables.get("version")
         if version:
             return version
@@ -58,3 +65,279 @@ class DocInfo(ly.docinfo.DocInfo):
             return m.group(1)
 
 
+def chunk(doc, variables, tokens):
+    """Return a DocInfo for a part of a document, to use in ChunkedDocInfo.
+    
+    The tokens argument is a function returning a tuple of tokens with their
+    positions relative to the start of the part, including the Newline tokens
+    between the lines (and before the first line, if the part does not start
+    at the beginning of the document).
+    
+    The information ChunkedDocInfo needs is harvested right away, the tokens
+    are not kept but requested again if they are needed later.
+    
+    """
+    return _Chunk(doc, variables, tokens)
+
+
+def _tokeninfo(doc, tokens):
+    """Return a ly.docinfo.DocInfo for the tuple of tokens."""
+    info = ly.docinfo.DocInfo.__new__(ly.docinfo.DocInfo)
+    info._d = doc
+    info.tokens = tokens
+    info.classes = tuple(map(type, tokens))
+    return info
+
+
+class _Chunk(ly.docinfo.DocInfo):
+    """The information about a part of a document, see chunk().
+    
+    The methods return the results of ly.docinfo.DocInfo, e.g. without
+    looking in the variables for the version, and language() only looks
+    for a \\language command.
+    
+    """
+    def __init__(self, doc, variables, tokens):
+        self._d = doc
+        self.variables = variables
+        self._tokenfunc = tokens
+        info = _tokeninfo(doc, tokens())
+        self._counter = info.counted_tokens()
+        self._version_string = info.version_string()
+        self._include_args = info.include_args()
+        self._scheme_load_args = info.scheme_load_args()
+        self._output_args = info.output_args()
+        self._definitions = info.definitions()
+        self._markup_definitions = info.markup_definitions()
+        self._language = self._find_language(info)
+        self._global_staff_size = info.global_staff_size()
+        self._token_hash = info.token_hash()
+        self._has_output = info.has_output()
+    
+    @staticmethod
+    def _find_language(info):
+        """Return the language set with \\language in the DocInfo, or None."""
+        languages = ly.pitch.pitchInfo.keys()
+        for i in info.find_all("\\language", ly.lex.lilypond.Keyword):
+            for t in info.tokens[i+1:i+10]:
+                if isinstance(t, ly.lex.Space) or t == '"':
+                    continue
+                if t in languages:
+                    return t
+    
+    @property
+    def tokens(self):
+        """The tokens, requested again every time."""
+        return self._tokenfunc()
+    
+    @property
+    def classes(self):
+        return tuple(map(type, self.tokens))
+    
+    def range(self, start=0, end=None):
+        """Return a new chunk for the selected range."""
+        tokens = _tokeninfo(self._d, self.tokens).range(start, end).tokens
+        return _Chunk(self._d, self.variables, lambda: tokens)
+    
+    def version_string(self):
+        return self._version_string
+    
+    def include_args(self):
+        return list(self._include_args)
+    
+    def scheme_load_args(self):
+        return list(self._scheme_load_args)
+    
+    def output_args(self):
+        return list(self._output_args)
+    
+    def definitions(self):
+        return list(self._definitions)
+    
+    def markup_definitions(self):
+        return list(self._markup_definitions)
+    
+    def language(self):
+        return self._language
+    
+    def global_staff_size(self):
+        return self._global_staff_size
+    
+    def token_hash(self):
+        return self._token_hash
+    
+    def has_output(self):
+        return self._has_output
+    
+    def count_tokens(self, cls):
+        return sum(n for c, n in self._counter.items() if issubclass(c, cls))
+    
+    def counted_tokens(self):
+        return collections.Counter(self._counter)
+
+
+class ChunkedDocInfo(DocInfo):
+    """A DocInfo combining DocInfo instances of consecutive parts of a document.
+    
+    The parts ("chunks") are typically the toplevel expressions of a 
+    document, and they can be reused after the document has changed 
+    elsewhere. Every chunk is created by chunk(), with its token positions
+    relative to the start of the chunk. The chunks do not keep their tokens.
+    
+    Most methods combine the results of the chunks. The tokens and classes
+    attributes (with the positions in the document) are only created when
+    they are requested. Tokens returned by e.g. definitions() have their
+    positions in the document, like the tokens of a DocInfo.
+    
+    """
+    def __init__(self, doc, variables, chunks):
+        """Initialize with document, variables and a list of chunks.
+        
+        Every chunk is a three-tuple (pos, end, info), where pos and end 
+        are the position of the chunk in the document and info is a DocInfo
+        instance for that part.
+        
+        """
+        self._d = doc
+        self.variables = variables
+        self.chunks = chunks
+    
+    @property
+    def tokens(self):
+        """All tokens, with positions in the document."""
+        try:
+            return self._tokens
+        except AttributeError:
+            self._tokens = tuple(type(t)(t, pos + t.pos)
+                for pos, end, info in self.chunks for t in info.tokens)
+            return self._tokens
+    
+    @property
+    @ly.docinfo._cache
+    def classes(self):
+        """The classes of all tokens."""
+        return tuple(map(type, self.tokens))
+    
+    def range(self, start=0, end=None):
+        """Return a new ChunkedDocInfo for the selected range.
+        
+        Chunks that are completely contained in the range are reused.
+        
+        """
+        if start == 0 and end is None:
+            return self
+        chunks = []
+        for pos, cend, info in self.chunks:
+            if cend < start:
+                continue
+            elif end is not None and pos > end:
+                break
+            if pos < start or (end is not None and cend > end):
+                info = info.range(max(0, start - pos),
+                                  None if end is None else end - pos)
+            chunks.append((pos, cend, info))
+        return type(self)(self._d, self.variables, chunks)
+    
+    def _combine(self, method):
+        """Return a list with the results of method for all chunks."""
+        result = []
+        for pos, end, info in self.chunks:
+            result.extend(method(info))
+        return result
+    
+    def _combine_tokens(self, method):
+        """Return a list with the tokens method returns for all chunks.
+        
+        The tokens get their positions in the document.
+        
+        """
+        result = []
+        for pos, end, info in self.chunks:
+            result.extend(type(t)(t, pos + t.pos) for t in method(info))
+        return result
+    
+    def _first(self, method):
+        """Return the first result of method that is not None."""
+        for pos, end, info in self.chunks:
+            result = method(info)
+            if result is not None:
+                return result
+    
+    @ly.docinfo._cache
+    def version_string(self):
+        """Return the version, but also looks in the variables and comments."""
+        version = self._first(lambda info: info.version_string())
+        if version:
+            return version
+        return self._version_fallback()
+    
+    @ly.docinfo._cache
+    def include_args(self):
+        r"""The list of \include command arguments."""
+        return self._combine(lambda info: info.include_args())
+    
+    @ly.docinfo._cache
+    def scheme_load_args(self):
+        """The list of scheme (load) command arguments."""
+        return self._combine(lambda info: info.scheme_load_args())
+    
+    @ly.docinfo._cache
+    def output_args(self):
+        """The list of arguments defining the name of output documents."""
+        return self._combine(lambda info: info.output_args())
+    
+    @ly.docinfo._cache
+    def definitions(self):
+        """The list of LilyPond identifiers the document defines."""
+        return self._combine_tokens(lambda info: info.definitions())
+    
+    @ly.docinfo._cache
+    def markup_definitions(self):
+        """The list of markup command definitions in the document."""
+        return self._combine_tokens(lambda info: info.markup_definitions())
+    
+    @ly.docinfo._cache
+    def language(self):
+        """The pitch language, None if not set in the document."""
+        lang = self._first(lambda info: info.language())
+        if lang:
+            return lang
+        languages = ly.pitch.pitchInfo.keys()
+        for n in self.include_args():
+            lang = n.rsplit('.', 1)[0]
+            if lang in languages:
+                return lang
+    
+    @ly.docinfo._cache
+    def global_staff_size(self):
+        """The global-staff-size, if set, else None."""
+        return self._first(lambda info: info.global_staff_size())
+    
+    @ly.docinfo._cache
+    def token_hash(self):
+        """Return an integer hash for all non-whitespace and non-comment tokens.
+        
+        This hash does not change when only comments or whitespace are changed.
+        
+        """
+        empty = hash(tuple())
+        return hash(tuple(h for h in (info.token_hash()
+            for pos, end, info in self.chunks) if h != empty))
+    
+    @ly.docinfo._cache
+    def has_output(self):
+        """Return True when the document probably generates output."""
+        return any(info.has_output() for pos, end, info in self.chunks)
+    
+    def count_tokens(self, cls):
+        """Return the number of tokens that are (a subclass) of the specified class."""
+        return sum(info.count_tokens(cls) for pos, end, info in self.chunks)
+    
+    def counted_tokens(self):
+        """Return a dictionary mapping classes to the number of instances of that class."""
+        counter = collections.Counter()
+        for pos, end, info in self.chunks:
+            counter.update(info.counted_tokens())
+        return counter
+
+
@@ -72,6 +72,15 @@ def parse_commandline():
         help=_("List the session names and exit"))
     parser.add_argument('-n', '--new', action="store_true", default=False,
         help=_("Always start a new instance"))
+    parser.add_argument('--engrave', action="store_true", default=False,
+        help=_("Engrave the files without opening a window and exit"))
+    parser.add_argument('--mode', choices=('preview', 'publish'), default='publish',
+        help=_("Engraving mode to use with --engrave (default: publish)"))
+    parser.add_argument('-j', '--jobs', type=int, metavar=_("NUM"),
+        help=_("Maximum number of LilyPond processes to run with --engrave"))
+    parser.add_argument('--report', metavar=_("FILE"),
+        help=_("File to write the JSON report of --engrave to "
+               "(default: standard output)"))
     parser.add_argument('files', metavar=_("file"), nargs='*', 
         help=_("File to be opened"))
     
@@ -200,6 +209,12 @@ def main():
     
     urls = list(map(url, args.files))
     
+    if args.engrave:
+        # engrave without GUI, using the include path of the session if given
+        session = args.session if args.session != "-" else None
+        import engrave.batch
+        sys.exit(engrave.batch.run(urls, args.mode, args.jobs, args.report, session))
+    
     if not app.qApp.isSessionRestored():
         if not args.new and remote.enabled():
             api = remote.get()
@@ -228,6 +243,7 @@ def main():
     import musicpos         # shows music time in statusbar
     import autocomplete     # auto-complete input
     import wordboundary     # better wordboundary behaviour for the editor
+    import idletokenizer    # tokenizes loaded documents while the user is idle
     
     if sys.platform.startswith('darwin'):
         import macosx.setup
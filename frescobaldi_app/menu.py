@@ -271,6 +271,9 @@ def menu_lilypond(mainwindow):
     m.addAction(ac.engrave_custom)
     m.addAction(ac.engrave_abort)
     m.addSeparator()
+    m.addAction(ac.engrave_all)
+    m.addAction(ac.engrave_abort_all)
+    m.addSeparator()
     m.addMenu(menu_lilypond_generated_files(mainwindow))
     m.addSeparator()
     m.addAction(ac.engrave_open_lilypond_datadir)
@@ -19,16 +19,80 @@
 
 """
 Frescobaldi's extensions of ly.music.
+
+Besides the music.Document type, this module contains the functions to
+build a music tree from separately read toplevel nodes, so that the nodes
+of unchanged parts of a document can be reused after an edit.
+
+The time_position() and time_length() methods of music.Document use a
+TimeIndex, that caches the musical length of every node and the time
+offsets of the children of music expressions. So after the first query,
+the music preceding a position does not need to be traversed again.
 """
 
 
 
+import ly.document
+import ly.lex
+import ly.music.event
 import ly.music.items
+import ly.music.read
 import fileinfo
 
 
 class Document(ly.music.items.Document):
     """music.Document type that caches music trees using fileinfo."""
+    @classmethod
+    def from_nodes(cls, doc, nodes):
+        """Return a Document for the ly.document.Document with the nodes.
+        
+        The nodes are toplevel nodes, e.g. read using read_nodes().
+        
+        """
+        self = cls.__new__(cls)
+        ly.music.items.Item.__init__(self)
+        self.document = doc
+        self.include_node = None
+        self.include_path = []
+        self.relative_includes = True
+        self.extend(nodes)
+        return self
+    
+    _time_index = None
+    
+    def time_index(self):
+        """Return the TimeIndex for this Document, creating it if needed."""
+        if self._time_index is None:
+            self._time_index = TimeIndex()
+        return self._time_index
+    
+    def time_position(self, position):
+        """Return the time position in the music at the specified cursor position.
+        
+        The value is a fraction. If None is returned, we are not in a music 
+        expression.
+        
+        """
+        events = self.music_events_til_position(position)
+        if events:
+            return self.time_index().time(events)
+    
+    def time_length(self, start, end):
+        """Return the length of the music between start and end positions.
+        
+        Returns None if start and end are not in the same expression.
+        
+        """
+        if start > end:
+            start, end = end, start
+        start_evts = self.music_events_til_position(start)
+        if start_evts:
+            end_evts = self.music_events_til_position(end)
+            if end_evts and start_evts[0][0] is end_evts[0][0]:
+                # yes, we have the same toplevel expression.
+                index = self.time_index()
+                return index.time(end_evts) - index.time(start_evts)
+    
     def get_included_document_node(self, node):
         """Return a Document for the Include node."""
         filename = node.filename()
@@ -45,3 +109,115 @@ class Document(ly.music.items.Document):
                     return d
 
 
+def read_nodes(doc, start, end, state=None):
+    """Read the toplevel nodes from the ly.document.Document from start to end.
+    
+    The state, if given, is the state of the reader (the pitch language
+    etc.) at the start, as returned by a previous call.
+    
+    Returns a two-tuple (nodes, state), where nodes is the list of nodes read
+    and state the state of the reader at the end.
+    
+    """
+    c = ly.document.Cursor(doc, start, end)
+    s = ly.document.Source(c, True, tokens_with_position=True)
+    r = ly.music.read.Reader(s)
+    if state:
+        r.language, r.in_chord, r.prev_duration = state
+    nodes = list(r.read())
+    return nodes, (r.language, r.in_chord, r.prev_duration)
+
+
+def shift(nodes, offset):
+    """Add offset to the positions of the nodes and their descendants.
+    
+    The pos and end attributes of the tokens the nodes refer to are shifted
+    as well. The tokens must belong to the nodes, as read by read_nodes().
+    
+    """
+    done = set()
+    def visit(obj):
+        if id(obj) in done:
+            return
+        if isinstance(obj, ly.lex.Token):
+            done.add(id(obj))
+            obj.pos += offset
+            obj.end += offset
+        elif isinstance(obj, ly.music.items.Item):
+            done.add(id(obj))
+            d = vars(obj)
+            if 'position' in d:
+                obj.position += offset
+            for value in d.values():
+                visit(value)
+            for node in obj:
+                visit(node)
+        elif isinstance(obj, (tuple, list)):
+            for value in obj:
+                visit(value)
+    for node in nodes:
+        visit(node)
+
+
+class TimeIndex(ly.music.event.Events):
+    """Caches the musical length of nodes of a music tree.
+    
+    For every music expression of which the time position of a child is
+    requested, the cumulative lengths of its children are stored, so the
+    length of the children preceding a node is found by a lookup.
+    
+    Because the length of a node can depend on other nodes (e.g. a user
+    command refers to an assignment), a TimeIndex is only valid for one
+    version of a music tree.
+    
+    """
+    def __init__(self):
+        self._lengths = {}
+        self._offsets = {}
+    
+    def traverse(self, node, time, scaling):
+        """Reimplemented to use the cached length of the node."""
+        return time + self.length(node) * scaling
+    
+    def length(self, node):
+        """Return the length of the node (and its children)."""
+        try:
+            return self._lengths[node]
+        except KeyError:
+            length = self._lengths[node] = node.events(self, 0, 1)
+            return length
+    
+    def offsets(self, parent):
+        """Return a list of the time offsets of the children of parent.
+        
+        The list has one more item than the number of children: the sum of
+        the lengths of all the children.
+        
+        """
+        try:
+            return self._offsets[parent]
+        except KeyError:
+            time = 0
+            offsets = [0]
+            for node in parent:
+                time += self.length(node)
+                offsets.append(time)
+            self._offsets[parent] = offsets
+            return offsets
+    
+    def time(self, events):
+        """Return the time from the list returned by music_events_til_position()."""
+        time = 0
+        scaling = 1
+        for parent, nodes, s in events:
+            scaling *= s
+            if not nodes:
+                continue
+            count = len(nodes)
+            if count <= len(parent) and parent[0] is nodes[0] and parent[count - 1] is nodes[-1]:
+                # the nodes are the first children of the parent
+                length = self.offsets(parent)[count]
+            else:
+                length = sum(self.length(n) for n in nodes)
+            time += length * scaling
+        return time
@@ -52,6 +52,7 @@ class PanelManager(plugin.MainWindowPlugin):
         self.loadPanel("svgview.SvgViewPanel")
         self.loadPanel("viewers.manuscript.ManuscriptViewPanel")
         self.loadPanel("logtool.LogTool")
+        self.loadPanel("engraveprofile.EngraveProfile")
         self.loadPanel("docbrowser.HelpBrowser")
         self.loadPanel("snippet.tool.SnippetTool")
         self.loadPanel("miditool.MidiTool")
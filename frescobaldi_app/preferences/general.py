@@ -78,6 +78,8 @@ class General(preferences.Group):
         grid.addWidget(self.splashScreen, 4, 0, 1, 3)
         self.allowRemote = QCheckBox(toggled=self.changed)
         grid.addWidget(self.allowRemote, 5, 0, 1, 3)
+        self.fileinfoCache = QCheckBox(toggled=self.changed)
+        grid.addWidget(self.fileinfoCache, 6, 0, 1, 3)
         
         grid.setColumnStretch(2, 1)
         
@@ -114,6 +116,7 @@ class General(preferences.Group):
         self.systemIcons.setChecked(s.value("system_icons", True, bool))
         self.tabsClosable.setChecked(s.value("tabs_closable", True, bool))
         self.splashScreen.setChecked(s.value("splash_screen", True, bool))
+        self.fileinfoCache.setChecked(s.value("fileinfo_cache", True, bool))
         self.allowRemote.setChecked(remote.enabled())
     
     def saveSettings(self):
@@ -123,6 +126,7 @@ class General(preferences.Group):
         s.setValue("tabs_closable", self.tabsClosable.isChecked())
         s.setValue("splash_screen", self.splashScreen.isChecked())
         s.setValue("allow_remote", self.allowRemote.isChecked())
+        s.setValue("fileinfo_cache", self.fileinfoCache.isChecked())
         if self.styleCombo.currentIndex() == 0:
             s.remove("guistyle")
         else:
@@ -146,6 +150,11 @@ class General(preferences.Group):
         self.allowRemote.setToolTip(_(
             "If checked, files will be opened in a running Frescobaldi "
             "application if available, instead of starting a new instance."))
+        self.fileinfoCache.setText(_("Remember Information about Included Files"))
+        self.fileinfoCache.setToolTip(_(
+            "If checked, information about included files (like the names they "
+            "define) is stored on disk, so it is available right away on the "
+            "next start of {appname}.").format(appname=appinfo.appname))
 
 
 class StartSession(preferences.Group):
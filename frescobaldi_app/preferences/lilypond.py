@@ -29,7 +29,7 @@ from PyQt5.QtCore import QSettings, Qt
 from PyQt5.QtWidgets import (
     QAbstractItemView, QCheckBox, QDialog, QDialogButtonBox, QFileDialog,
     QGridLayout, QHBoxLayout, QLabel, QLineEdit, QListWidgetItem,
-    QPushButton, QRadioButton, QTabWidget, QVBoxLayout, QWidget)
+    QPushButton, QRadioButton, QSpinBox, QTabWidget, QVBoxLayout, QWidget)
 
 import app
 import userguide
@@ -303,6 +303,12 @@ class Running(preferences.Group):
         self.deleteFiles = QCheckBox(clicked=self.changed)
         self.embedSourceCode = QCheckBox(clicked=self.changed)
         self.noTranslation = QCheckBox(clicked=self.changed)
+        self.resultCache = QCheckBox(clicked=self.changed)
+        self.autocompileServer = QCheckBox(clicked=self.changed)
+        self.autocompilePartial = QCheckBox(clicked=self.changed)
+        self.maxJobsLabel = QLabel()
+        self.maxJobs = QSpinBox(minimum=1, maximum=64, valueChanged=self.changed)
+        self.maxJobsLabel.setBuddy(self.maxJobs)
         self.includeLabel = QLabel()
         self.include = widgets.listedit.FilePathEdit()
         self.include.listBox.setDragDropMode(QAbstractItemView.InternalMove)
@@ -311,6 +317,14 @@ class Running(preferences.Group):
         layout.addWidget(self.deleteFiles)
         layout.addWidget(self.embedSourceCode)
         layout.addWidget(self.noTranslation)
+        layout.addWidget(self.resultCache)
+        layout.addWidget(self.autocompileServer)
+        layout.addWidget(self.autocompilePartial)
+        hbox = QHBoxLayout()
+        hbox.addWidget(self.maxJobsLabel)
+        hbox.addWidget(self.maxJobs)
+        hbox.addStretch(1)
+        layout.addLayout(hbox)
         layout.addWidget(self.includeLabel)
         layout.addWidget(self.include)
         app.translateUI(self)
@@ -333,6 +347,25 @@ class Running(preferences.Group):
         self.noTranslation.setToolTip(_(
             "If checked, LilyPond's output messages will be in English.\n"
             "This can be useful for bug reports."))
+        self.resultCache.setText(_("Reuse earlier results of unchanged documents"))
+        self.resultCache.setToolTip(_(
+            "If checked, the output files of LilyPond are stored, and used again\n"
+            "instead of running LilyPond when a document and the files it includes\n"
+            "are engraved unchanged with the same LilyPond version and options.\n"
+            "Only files included with \\include are checked for changes."))
+        self.autocompileServer.setText(_("Keep LilyPond running for auto-compile"))
+        self.autocompileServer.setToolTip(_(
+            "If checked, LilyPond is kept running in the background and asked to\n"
+            "engrave the document when auto-compiling, which saves the time\n"
+            "LilyPond needs to start up (not available on Windows)."))
+        self.autocompilePartial.setText(_("Auto-compile the score at the cursor first"))
+        self.autocompilePartial.setToolTip(_(
+            "If checked, auto-compile first engraves only the score, bookpart or\n"
+            "book the cursor is in, and then the full document in the background."))
+        self.maxJobsLabel.setText(_("Maximum number of concurrent jobs:"))
+        self.maxJobs.setToolTip(_(
+            "The maximum number of LilyPond processes that may run at the same\n"
+            "time, e.g. when engraving all documents."))
         self.includeLabel.setText(_("LilyPond include path:"))
     
     def loadSettings(self):
@@ -341,6 +374,11 @@ class Running(preferences.Group):
         self.deleteFiles.setChecked(s.value("delete_intermediate_files", True, bool))
         self.embedSourceCode.setChecked(s.value("embed_source_code", False, bool))
         self.noTranslation.setChecked(s.value("no_translation", False, bool))
+        self.resultCache.setChecked(s.value("result_cache", False, bool))
+        self.autocompileServer.setChecked(s.value("autocompile_server", False, bool))
+        self.autocompileServer.setEnabled(os.name == 'posix')
+        self.autocompilePartial.setChecked(s.value("autocompile_partial", False, bool))
+        self.maxJobs.setValue(s.value("max_jobs", os.cpu_count() or 1, int))
         include_path = qsettings.get_string_list(s, "include_path")
         self.include.setValue(include_path)
         
@@ -350,6 +388,10 @@ class Running(preferences.Group):
         s.setValue("delete_intermediate_files", self.deleteFiles.isChecked())
         s.setValue("embed_source_code", self.embedSourceCode.isChecked())
         s.setValue("no_translation", self.noTranslation.isChecked())
+        s.setValue("result_cache", self.resultCache.isChecked())
+        s.setValue("autocompile_server", self.autocompileServer.isChecked())
+        s.setValue("autocompile_partial", self.autocompilePartial.isChecked())
+        s.setValue("max_jobs", self.maxJobs.value())
         s.setValue("include_path", self.include.value())
 
 
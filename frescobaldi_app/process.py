@@ -19,7 +19,7 @@
 
 """
 A very simple wrapper around QProcess, and a scheduler to enable running
-one process at a time.
+one process (or a limited number of processes) at a time.
 """
 
 __all__ = ['Process', 'Scheduler']
@@ -80,16 +80,19 @@ class Scheduler(object):
     You can use this to run e.g. commandline tools asynchronously and you
     don't want to have them running at the same time.
     
+    If maxprocesses is given, up to that number of processes are run at
+    the same time.
+    
     """
-    def __init__(self):
+    def __init__(self, maxprocesses=1):
+        self._maxprocesses = max(1, maxprocesses)
         self._schedule = []
+        self._running = []
     
     def add(self, process):
         """Adds the process to run."""
-        process.done.connect(self._done)
         self._schedule.append(process)
-        if len(self._schedule) == 1:
-            self._schedule[0].start()
+        self._startNext()
     
     def remove(self, process):
         """Removes the process from the schedule.
@@ -97,13 +100,19 @@ class Scheduler(object):
         This only works if the process has not been started yet.
         
         """
-        if process in self._schedule[1:]:
+        if process in self._schedule:
             self._schedule.remove(process)
-            process.done.disconnect(self._done)
     
-    def _done(self):
-        del self._schedule[0]
-        if self._schedule:
-            self._schedule[0].start()
-
+    def _startNext(self):
+        """Starts waiting processes as long as there is room."""
+        while self._schedule and len(self._running) < self._maxprocesses:
+            process = self._schedule.pop(0)
+            self._running.append(process)
+            process.done.connect(lambda success, p=process: self._done(p))
+            process.start()
+    
+    def _done(self, process):
+        if process in self._running:
+            self._running.remove(process)
+        self._startNext()
 
@@ -21,94 +21,184 @@
 Cache logic.
 """
 
+import collections
+import os
 import weakref
-import time
+
+
+def defaultmaxsize():
+    """Return a cache size in bytes suitable for the amount of system memory.
+    
+    This is one sixteenth of the physical memory, but at least 100MB and at
+    most 1GB. If the amount of memory can't be determined, 100MB is returned.
+    
+    """
+    minimum, maximum = 104857600, 1073741824
+    try:
+        memory = os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return minimum
+    return max(minimum, min(maximum, memory // 16))
 
 
 class ImageEntry:
     def __init__(self, image):
         self.image = image
         self.bcount = image.byteCount()
-        self.time = time.time()
+
+
+class CacheGroup:
+    """The images of one group, with their own least recently used order."""
+    def __init__(self, ref):
+        self.ref = ref
+        self.pages = {}     # page -> OrderedDict(size -> entry)
+        self.lru = collections.OrderedDict()    # (page, size) -> entry
+        self.size = 0
 
 
 class ImageCache:
     """Cache generated images.
     
-    Store and retrieve them under a key (see render.Renderer.key()).
+    The images are stored per group (e.g. a document) under a page key and
+    a size key, using add() and get(). They can also be stored and retrieved
+    under a key with group, page and size attributes (see
+    render.Renderer.key()).
+    
+    The images are kept in least recently used order, so storing, retrieving
+    and removing an image takes constant time. When the cache grows beyond
+    maxsize, the least recently used images are removed. A single group (e.g.
+    a document) may not use more than groupshare of the cache, and of one page
+    at most maxzooms different sizes are kept.
     
+    The hits, misses and evictions attributes count how often an exact image
+    was found, was not found, and was removed to make room for other images.
     
     """
-    maxsize = 104857600 # 100M
+    maxsize = defaultmaxsize()
+    groupshare = 0.75
+    maxzooms = 4
     currentsize = 0
 
     def __init__(self):
-        self._cache = weakref.WeakKeyDictionary()
+        self._groups = {}   # weakref(group) -> CacheGroup
+        self._lru = collections.OrderedDict()   # (weakref, page, size) -> entry
+        self._dead = []     # weak references to groups that disappeared
+        self.hits = self.misses = self.evictions = 0
     
     def clear(self):
         """Remove all cached images."""
-        self._cache.clear()
+        self._groups.clear()
+        self._lru.clear()
+        del self._dead[:]
+        self.currentsize = 0
     
-    def __getitem__(self, key):
-        """Retrieve the exact image.
-        
-        Raises a KeyError when there is no cached image for the key.
-        
-        """
-        return self._cache[key.group][key.page][key.size].image
+    def cleargroup(self, group):
+        """Remove the cached images of the group."""
+        g = self._groups.get(weakref.ref(group))
+        if g:
+            self._dead.append(g.ref)
+            self._purgeDead()
     
-    def __setitem__(self, key, image):
+    def statistics(self):
+        """Return a dictionary with the hits, misses, evictions and size."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'images': len(self._lru),
+            'size': self.currentsize,
+            'maxsize': self.maxsize,
+        }
+    
+    def contains(self, group, page, size):
+        """Return True if the image is in the cache (without touching it)."""
+        g = self._groups.get(weakref.ref(group))
+        return g is not None and size in g.pages.get(page, ())
+    
+    def get(self, group, page, size):
+        """Return the exact image, or None."""
+        self._purgeDead()
+        try:
+            g = self._groups[weakref.ref(group)]
+            sizes = g.pages[page]
+            entry = sizes[size]
+        except KeyError:
+            self.misses += 1
+            return
+        self.hits += 1
+        self._lru.move_to_end((g.ref, page, size))
+        g.lru.move_to_end((page, size))
+        sizes.move_to_end(size)
+        return entry.image
+    
+    def nearest(self, group, page, width):
+        """Return the image of the page with the width closest to width, or None."""
+        self._purgeDead()
+        try:
+            sizes = self._groups[weakref.ref(group)].pages[page]
+        except KeyError:
+            return
+        # find the closest size (assuming aspect ratio has not changed)
+        if sizes:
+            size = min(sizes, key=lambda s: abs(1 - s[0] / width))
+            return sizes[size].image
+    
+    def add(self, image, group, page, size, limitzooms=True):
         """Store the image.
         
-        Automatically removes the oldest cached images to keep the cache
-        under maxsize.
+        Automatically removes the least recently used images to keep the
+        cache under maxsize. If limitzooms is True, at most maxzooms sizes
+        are kept of the page.
         
         """
+        self._purgeDead()
+        g = self._groups.get(weakref.ref(group))
+        if g and size in g.pages.get(page, ()):
+            # this may remove the group if it was its only image
+            self._remove(g, page, size)
         try:
-            self.currentsize -= self._cache[key.group][key.page][key.size].bcount
+            g = self._groups[weakref.ref(group)]
         except KeyError:
-            pass
+            ref = weakref.ref(group, self._dead.append)
+            g = self._groups[ref] = CacheGroup(ref)
         
-        purgeneeded = self.currentsize > self.maxsize
+        sizes = g.pages.setdefault(page, collections.OrderedDict())
+        while limitzooms and len(sizes) >= self.maxzooms:
+            self._evict(g, page, next(iter(sizes)))
         
         e = ImageEntry(image)
+        sizes[size] = e
+        g.lru[(page, size)] = e
+        self._lru[(g.ref, page, size)] = e
+        g.size += e.bcount
         self.currentsize += e.bcount
         
-        self._cache.setdefault(key.group, {}).setdefault(key.page, {})[key.size] = e
-        
-        if not purgeneeded:
-            return
+        # keep the group within its share, but never remove the image just stored
+        while g.size > self.maxsize * self.groupshare and len(g.lru) > 1:
+            self._evict(g, *next(iter(g.lru)))
+        self.purge()
+    
+    def purge(self):
+        """Remove the least recently used images until the cache fits in maxsize."""
+        self._purgeDead()
+        while self.currentsize > self.maxsize and len(self._lru) > 1:
+            ref, page, size = next(iter(self._lru))
+            self._evict(self._groups[ref], page, size)
+    
+    def __getitem__(self, key):
+        """Retrieve the exact image.
         
-        # purge old images if needed,
-        # cache groups may have disappeared so count all images
-        items = []
-        items.extend(sorted(
-            (entry.time, entry.bcount, group, page, size)
-            for group, groupd in self._cache.items()
-                for page, paged in groupd.items()
-                    for size, entry in sorted(paged.items())[1:]))
-        # smallest for each page last
-        items.extend(sorted(
-            (entry.time, entry.bcount, group, page, size)
-            for group, groupd in self._cache.items()
-                for page, paged in groupd.items()
-                    for size, entry in sorted(paged.items())[:1]))
+        Raises a KeyError when there is no cached image for the key.
         
-        # now count the newest images until maxsize ...
-        items = reversed(items)
-        currentsize = 0
-        for time, bcount, group, page, size in items:
-            currentsize += bcount
-            if currentsize > self.maxsize:
-                break
-        self.currentsize = currentsize
-        # ... and delete the remaining images, deleting empty dicts as well
-        for time, bcount, group, page, size in items:
-            del self._cache[group][page][size]
-            if not self._cache[group][page]:
-                del self._cache[group][page]
-                if not self._cache[group]:
-                    del self._cache[group]
+        """
+        image = self.get(key.group, key.page, key.size)
+        if image is None:
+            raise KeyError(key)
+        return image
+    
+    def __setitem__(self, key, image):
+        """Store the image."""
+        self.add(image, key.group, key.page, key.size)
     
     def closest(self, key):
         """Retrieve the correct image but with a different size.
@@ -117,13 +207,31 @@ class ImageCache:
         rendered.
         
         """
-        try:
-            entries = self._cache[key.group][key.page]
-        except KeyError:
-            return
-        # find the closest size (assuming aspect ratio has not changed)
-        if entries:
-            width = key.size[0]
-            sizes = sorted(entries, key=lambda s: abs(1 - s[0] / width))
-            return entries[sizes[0]].image
-
+        return self.nearest(key.group, key.page, key.size[0])
+    
+    def _evict(self, group, page, size):
+        """Remove an image to make room for others."""
+        self._remove(group, page, size)
+        self.evictions += 1
+    
+    def _remove(self, group, page, size):
+        """Remove an image, deleting the empty page and group as well."""
+        e = group.lru.pop((page, size))
+        del self._lru[(group.ref, page, size)]
+        sizes = group.pages[page]
+        del sizes[size]
+        if not sizes:
+            del group.pages[page]
+        group.size -= e.bcount
+        self.currentsize -= e.bcount
+        if not group.lru:
+            del self._groups[group.ref]
+    
+    def _purgeDead(self):
+        """Remove the images of the groups that disappeared."""
+        while self._dead:
+            group = self._groups.pop(self._dead.pop(), None)
+            if group:
+                for page, size in group.lru:
+                    del self._lru[(group.ref, page, size)]
+                self.currentsize -= group.size
@@ -22,7 +22,7 @@
 Caching of generated images.
 """
 
-import time
+import os
 import weakref
 
 try:
@@ -30,52 +30,95 @@ try:
 except ImportError:
     from . import popplerqt5_dummy as popplerqt5
 
-from PyQt5.QtCore import Qt, QThread
+from PyQt5.QtCore import QRect, Qt, QThread
 from PyQt5.QtGui import QImage, QPainter, QFont
 
+import qpageview.cache
+
 from . import render
 from . import rectangles
 from .locking import lock
 
-__all__ = ['maxsize', 'setmaxsize', 'image', 'generate', 'clear', 'links', 'options']
+__all__ = ['maxsize', 'setmaxsize', 'image', 'tile', 'tiled', 'tiles', 'generate',
+           'preview', 'previews', 'prefetch', 'cancelprefetch', 'cancel', 'clear', 'links',
+           'options', 'setsource', 'statistics', 'waiting']
 
 
-_cache = weakref.WeakKeyDictionary()
 _schedulers = weakref.WeakKeyDictionary()
+_sources = weakref.WeakKeyDictionary()
 _options = weakref.WeakKeyDictionary()
 _links = weakref.WeakKeyDictionary()
 
 
-# cache size
-_maxsize = 104857600 # 100M
-_currentsize = 0
+# cache size, None means: depending on the amount of memory
+_maxsize = None
+
+# a single document may use this part of the cache
+_documentshare = 0.75
+
+# the maximum number of sizes (zoom levels) cached for a page
+_maxzooms = 4
+
+# the maximum number of threads rendering pages of one document at a time
+maxworkers = min(4, os.cpu_count() or 1)
+
+# pages with more pixels than this are rendered and cached in tiles
+tilethreshold = 4194304 # 2048x2048
+
+# the width and height of a tile in pixels
+tilesize = 512
+
+# the resolution of the preview images that are rendered first
+previewdpi = 24.0
+
+# the maximum number of pages and the maximum size (in bytes) of the images
+# rendered in advance by prefetch()
+prefetchpages = 2
+prefetchbytes = 33554432 # 32M
 
 _globaloptions = None
 
 
 def setmaxsize(maxsize):
-    """Sets the maximum cache size in Megabytes."""
+    """Sets the maximum cache size in Megabytes.
+    
+    Use None to choose the size depending on the amount of system memory
+    (the default).
+    
+    """
     global _maxsize
-    _maxsize = maxsize * 1048576
+    _maxsize = None if maxsize is None else maxsize * 1048576
     purge()
     
 
 def maxsize():
     """Returns the maximum cache size in Megabytes."""
-    return _maxsize / 1048576
+    return _maxbytes() / 1048576
+
+
+def _maxbytes():
+    """Returns the maximum cache size in bytes."""
+    global _defaultmaxsize
+    if _maxsize is not None:
+        return _maxsize
+    if _defaultmaxsize is None:
+        _defaultmaxsize = qpageview.cache.defaultmaxsize()
+    return _defaultmaxsize
+
+_defaultmaxsize = None
+
+
+def statistics():
+    """Returns a dictionary with the hits, misses, evictions and size of the cache."""
+    return _cache.statistics()
 
 
 def clear(document=None):
     """Clears the whole cache or the cache for the given Poppler.Document."""
     if document:
-        try:
-            del _cache[document]
-        except KeyError:
-            pass
+        _cache.cleargroup(document)
     else:
         _cache.clear()
-        global _currentsize
-        _currentsize = 0
 
 
 def image(page, exact=True):
@@ -91,46 +134,157 @@ def image(page, exact=True):
     sizeKey = (page.physWidth(), page.physHeight())
     
     if exact:
-        try:
-            entry = _cache[document][pageKey][sizeKey]
-        except KeyError:
-            return
-        else:
-            entry[1] = time.time()
-            return entry[0]
-    try:
-        sizes = _cache[document][pageKey].keys()
-    except KeyError:
+        return _cache.get(document, pageKey, sizeKey)
+    return _cache.nearest(document, pageKey, page.physWidth())
+
+
+def tiled(page):
+    """Returns True if the Page is so large that it is rendered in tiles."""
+    return page.physWidth() * page.physHeight() > tilethreshold
+
+
+def tiles(page, rect):
+    """Yields (x, y, QRect) tuples for the tiles of the Page touched by rect.
+    
+    The rect and the yielded QRect are in pixels of the image of the whole
+    page, the yielded QRect is the part of the tile inside rect.
+    
+    """
+    width, height = int(page.physWidth()), int(page.physHeight())
+    rect = rect & QRect(0, 0, width, height)
+    if rect.isEmpty():
         return
-    # find the closest size (assuming aspect ratio has not changed)
-    if sizes:
-        sizes = sorted(sizes, key=lambda s: abs(1 - s[0] / float(page.physWidth())))
-        return _cache[document][pageKey][sizes[0]][0]
+    for y in range(rect.top() // tilesize, rect.bottom() // tilesize + 1):
+        for x in range(rect.left() // tilesize, rect.right() // tilesize + 1):
+            yield x, y, rect & QRect(x * tilesize, y * tilesize, tilesize, tilesize)
 
 
-def generate(page):
-    """Schedule an image to be generated for the cache."""
-    # Poppler-Qt4 crashes when different pages from a Document are rendered at the same time,
-    # so we schedule them to be run in sequence.
+def tile(page, x, y):
+    """Returns the image of tile (x, y) of the Page if in cache, or None."""
+    pageKey = (page.pageNumber(), page.rotation(), page.physWidth(), page.physHeight())
+    return _cache.get(page.document(), pageKey, (x, y))
+
+
+def generate(page, tile=None):
+    """Schedule an image to be generated for the cache.
+    
+    If tile is given, it is the (x, y) tuple of the tile to generate.
+    
+    """
     document = page.document()
     try:
         scheduler = _schedulers[document]
     except KeyError:
-        scheduler = _schedulers[document] = Scheduler()
-    scheduler.schedulejob(page)
+        scheduler = _schedulers[document] = Scheduler(document)
+    scheduler.schedulejob(page, tile)
+
+
+def preview(page, urgent=False):
+    """Schedule a low resolution preview image to be generated for the Page.
+    
+    This is only done if there is no image of the page in the cache at all.
+    Urgent previews (e.g. for pages that are visible) are rendered before all
+    other images, other previews after all other images.
+    
+    """
+    if image(page, False) is None:
+        document = page.document()
+        try:
+            scheduler = _schedulers[document]
+        except KeyError:
+            scheduler = _schedulers[document] = Scheduler(document)
+        scheduler.schedulepreview(page, urgent)
+
+
+def previews(pages):
+    """Schedule preview images for the pages, in the background, the first page first."""
+    for page in reversed(list(pages)):
+        preview(page)
+
+
+def prefetch(pages):
+    """Schedule images to be generated for the pages in advance, at idle priority.
+    
+    The pages should be given in the order they are expected to be viewed.
+    The images of the pages given to a previous call are not generated anymore
+    if they were not started yet. Pages that are cached already or rendered in
+    tiles are skipped, and at most prefetchpages pages are prefetched, with
+    images of at most prefetchbytes in total.
+    
+    """
+    cancelprefetch()
+    count, budget = 0, prefetchbytes
+    for page in pages:
+        if count >= prefetchpages:
+            break
+        if tiled(page):
+            break
+        pageKey = (page.pageNumber(), page.rotation())
+        sizeKey = (page.physWidth(), page.physHeight())
+        if _cache.contains(page.document(), pageKey, sizeKey):
+            continue
+        budget -= page.physWidth() * page.physHeight() * 4
+        if budget < 0:
+            break
+        count += 1
+        document = page.document()
+        try:
+            scheduler = _schedulers[document]
+        except KeyError:
+            scheduler = _schedulers[document] = Scheduler(document)
+        scheduler.scheduleprefetch(page)
+
+
+def cancelprefetch():
+    """Do not generate the images requested by prefetch() that were not started yet.
+    
+    Call this e.g. when the zoom factor changes.
+    
+    """
+    for scheduler in list(_schedulers.values()):
+        scheduler.cancelprefetch()
+
+
+def cancel(page):
+    """Cancel generating an image for the page, if it has not been started yet.
+    
+    Call this e.g. for pages that were scrolled out of view.
+    
+    """
+    try:
+        scheduler = _schedulers[page.document()]
+    except KeyError:
+        return
+    scheduler.cancel(page)
+
+
+def waiting():
+    """Yield the pages an image is being generated for."""
+    for scheduler in list(_schedulers.values()):
+        for page in scheduler.pages():
+            yield page
+
+
+def setsource(document, data):
+    """Set the data (a QByteArray) the Poppler.Document was loaded from.
+    
+    Pages of a document for which the data is known are rendered in several
+    threads at the same time, each thread using its own copy of the document
+    loaded from the data. Pages of other documents are rendered one at a time,
+    using the document itself.
+    
+    """
+    _sources[document] = data
 
 
 def add(image, document, pageNumber, rotation, width, height):
     """(Internal) Adds an image to the cache."""
-    pageKey = (pageNumber, rotation)
-    sizeKey = (width, height)
-    _cache.setdefault(document, {}).setdefault(pageKey, {})[sizeKey] = [image, time.time()]
-    
-    # maintain cache size
-    global _maxsize, _currentsize
-    _currentsize += image.byteCount()
-    if _currentsize > _maxsize:
-        purge()
+    _cache.add(image, document, (pageNumber, rotation), (width, height))
+
+
+def addtile(image, document, pageNumber, rotation, width, height, x, y):
+    """(Internal) Adds the image of a tile to the cache."""
+    _cache.add(image, document, (pageNumber, rotation, width, height), (x, y), False)
 
 
 def purge():
@@ -139,25 +293,20 @@ def purge():
     (Not necessary to call, as the cache will monitor its size automatically.)
     
     """
-    # make a list of the images, sorted on time, newest first
-    images = iter(sorted((
-        (time, document, pageKey, sizeKey, image.byteCount())
-            for document, pageKeys in _cache.items()
-            for pageKey, sizeKeys in pageKeys.items()
-            for sizeKey, (image, time) in sizeKeys.items()),
-                reverse=True))
-
-    # sum the size of the newest images
-    global _maxsize, _currentsize
-    byteCount = 0
-    for item in images:
-        byteCount += item[4]
-        if byteCount > _maxsize:
-            break
-    _currentsize = byteCount
-    # delete the other images
-    for time, document, pageKey, sizeKey, byteCount in images:
-        del _cache[document][pageKey][sizeKey]
+    _cache.purge()
+
+
+class _ImageCache(qpageview.cache.ImageCache):
+    """The image cache, grouping the images per Poppler.Document."""
+    groupshare = _documentshare
+    maxzooms = _maxzooms
+    
+    @property
+    def maxsize(self):
+        return _maxbytes()
+
+
+_cache = _ImageCache()
 
 
 def links(page):
@@ -209,78 +358,237 @@ def setoptions(options, document=None):
 
 
 class Scheduler(object):
-    """Manages running rendering jobs in sequence for a Document."""
-    def __init__(self):
-        self._schedule = []     # order
+    """Manages running rendering jobs for a Document.
+    
+    If the data the document was loaded from is known (see setsource()),
+    up to maxworkers jobs run at the same time, each in its own copy of the
+    document. Otherwise the jobs are run in sequence, in the document itself.
+    The most recently requested job is started first.
+    
+    """
+    def __init__(self, document):
+        self._schedule = []     # order of the jobs not yet started
         self._jobs = {}         # jobs on key
-        self._waiting = weakref.WeakKeyDictionary()      # jobs on page
-        self._running = None
+        self._urgent = []       # order of the urgent previews not yet started
+        self._background = []   # order of the other previews not yet started
+        self._previews = {}     # preview jobs on (pageNumber, rotation)
+        self._prefetch = []     # order of the prefetch jobs not yet started
+        self._waiting = weakref.WeakKeyDictionary()      # sets of jobs on page
+        self._running = set()   # the running Runners
+        self._copies = []       # copies of the document not in use
+        self._source = _sources.get(document)
+        self._maxworkers = maxworkers if self._source is not None else 1
         
-    def schedulejob(self, page):
+    def schedulejob(self, page, tile=None):
         """Creates or retriggers an existing Job.
         
-        If a Job was already scheduled for the page, it is canceled.
+        If a Job was already scheduled for the page, it is moved to the front.
+        Pending jobs for the page at another size are removed.
         The page's update() method will be called when the Job has completed.
         
         """
         # uniquely identify the image to be generated
-        key = (page.pageNumber(), page.rotation(), page.physWidth(), page.physHeight())
+        key = (page.pageNumber(), page.rotation(), page.physWidth(), page.physHeight(), tile)
         try:
             job = self._jobs[key]
         except KeyError:
-            job = self._jobs[key] = Job(page)
+            job = self._jobs[key] = Job(page, tile)
             job.key = key
+            self._schedule.append(job)
         else:
-            self._schedule.remove(job)
-        self._schedule.append(job)
-        self._waiting[page] = job
+            if job in self._schedule:
+                self._schedule.remove(job)
+                self._schedule.append(job)
+            elif job in self._prefetch:
+                # the page is needed now
+                self._prefetch.remove(job)
+                self._schedule.append(job)
+                job.prefetch = None
+        jobs = self._waiting.setdefault(page, set())
+        for old in [j for j in jobs if j.key[:4] != key[:4]]:
+            jobs.remove(old)
+            self._discard(old)
+        jobs.add(job)
+        self.checkStart()
+    
+    def schedulepreview(self, page, urgent=False):
+        """Creates or retriggers a preview Job for the page.
+        
+        The update() method of every page that asked for the preview is called
+        when the Job has completed.
+        
+        """
+        key = (page.pageNumber(), page.rotation())
+        try:
+            job = self._previews[key]
+        except KeyError:
+            job = self._previews[key] = Job(page)
+            job.key = key
+            job.preview = weakref.WeakSet()
+            size = page.pageSize()
+            job.width = max(1, round(size.width() * previewdpi / 72.0))
+            job.height = max(1, round(size.height() * previewdpi / 72.0))
+            job.preview.add(page)
+        else:
+            job.preview.add(page)
+            if job in self._urgent:
+                if not urgent:
+                    return
+                self._urgent.remove(job)
+            elif job in self._background:
+                self._background.remove(job)
+            else:
+                return # running
+        (self._urgent if urgent else self._background).append(job)
         self.checkStart()
+    
+    def scheduleprefetch(self, page):
+        """Creates a Job for the page at idle priority, if not already scheduled."""
+        key = (page.pageNumber(), page.rotation(), page.physWidth(), page.physHeight(), None)
+        if key not in self._jobs:
+            job = self._jobs[key] = Job(page)
+            job.key = key
+            job.prefetch = weakref.ref(page)
+            self._prefetch.append(job)
+            self.checkStart()
+    
+    def cancelprefetch(self):
+        """Removes the prefetch jobs that are not started yet."""
+        for job in self._prefetch:
+            del self._jobs[job.key]
+        del self._prefetch[:]
+    
+    def cancel(self, page):
+        """Removes the jobs for the page that are not running and not needed anymore."""
+        for job in self._waiting.pop(page, ()):
+            self._discard(job)
+    
+    def pages(self):
+        """Returns a list of the pages waiting for an image."""
+        return list(self._waiting.keys())
+    
+    def _needed(self, job):
+        """Returns True if a page waits for the job."""
+        return any(job in jobs for jobs in self._waiting.values())
+    
+    def _discard(self, job):
+        """Removes the job if it has not been started and no page waits for it."""
+        if job in self._schedule and not self._needed(job):
+            self._schedule.remove(job)
+            del self._jobs[job.key]
+    
+    def nextJob(self):
+        """Takes the job to start next from the schedule, or returns None.
         
+        First the urgent previews are started, then the other jobs, then the
+        prefetch jobs, and then the other previews. The most recently requested
+        job comes first, except for prefetch jobs, which are started in order.
+        
+        """
+        for schedule in self._urgent, self._schedule:
+            if schedule:
+                return schedule.pop()
+        if self._prefetch:
+            return self._prefetch.pop(0)
+        if self._background:
+            return self._background.pop()
+    
     def checkStart(self):
-        """Starts a job if none is running and at least one is waiting."""
-        while self._schedule and not self._running:
-            job = self._schedule[-1]
-            document = job.document()
-            if document and job in self._waiting.values():
-                self._running = Runner(self, document, job)
+        """Starts jobs while there are free workers and jobs are waiting."""
+        while len(self._running) < self._maxworkers:
+            job = self.nextJob()
+            if not job:
                 break
+            document = job.document()
+            if job.preview is not None:
+                needed = any(image(page, False) is None for page in job.preview)
+            elif job.prefetch:
+                # not needed anymore if the page changed size
+                page = job.prefetch()
+                needed = page is not None and (
+                    (page.physWidth(), page.physHeight()) == (job.width, job.height))
+            else:
+                needed = self._needed(job)
+            if document and needed:
+                copy = self._copies.pop() if self._copies else None
+                self._running.add(Runner(self, document, job, self._source, copy))
+            elif job.preview is not None:
+                del self._previews[job.key]
             else:
-                self.done(job)
+                del self._jobs[job.key]
             
-    def done(self, job):
-        """Called when the job has completed."""
+    def done(self, runner):
+        """Called when the runner has completed its job."""
+        self._running.discard(runner)
+        if runner.copy is not None:
+            self._copies.append(runner.copy)
+        job = runner.job
+        if job.preview is not None:
+            del self._previews[job.key]
+            for page in list(job.preview):
+                page.update()
+            return
         del self._jobs[job.key]
-        self._schedule.remove(job)
-        self._running = None
-        for page in list(self._waiting):
-            if self._waiting[page] is job:
+        for page, jobs in list(self._waiting.items()):
+            if job in jobs:
+                jobs.remove(job)
+                if not jobs:
+                    del self._waiting[page]
                 page.update()
-                del self._waiting[page]
 
 
 class Job(object):
-    """Simply contains data needed to create an image later."""
-    def __init__(self, page):
+    """Simply contains data needed to create an image (or a tile) later.
+    
+    For a preview, the preview attribute is a WeakSet of the pages waiting
+    for it, and for a job rendering a page in advance the prefetch attribute
+    is a weak reference to the page.
+    
+    """
+    preview = None
+    prefetch = None
+    
+    def __init__(self, page, tile=None):
         self.document = weakref.ref(page.document())
         self.pageNumber = page.pageNumber()
         self.rotation = page.rotation()
         self.width = page.physWidth()
         self.height = page.physHeight()
+        self.tile = tile
+    
+    def rect(self):
+        """Returns the rectangle of the page image to render."""
+        rect = QRect(0, 0, int(self.width), int(self.height))
+        if self.tile is None:
+            return rect
+        x, y = self.tile
+        return rect & QRect(x * tilesize, y * tilesize, tilesize, tilesize)
 
 
 class Runner(QThread):
-    """Immediately runs a Job in a background thread."""
-    def __init__(self, scheduler, document, job):
+    """Immediately runs a Job in a background thread.
+    
+    If the data of the document is given, the page is rendered in a copy of
+    the document, which is loaded from the data if no copy is given. The copy
+    can be used again for a next Job.
+    
+    """
+    def __init__(self, scheduler, document, job, source=None, copy=None):
         super(Runner, self).__init__()
         self.scheduler = scheduler
         self.job = job
         self.document = document # keep reference now so that it does not die during this thread
+        self.source = source
+        self.copy = copy
         self.finished.connect(self.slotFinished)
         self.start()
         
     def run(self):
         """Main method of this thread, called by Qt on start()."""
-        page = self.document.page(self.job.pageNumber)
+        if self.source is not None and self.copy is None:
+            self.copy = popplerqt5.Poppler.Document.loadFromData(self.source) or None
+        document = self.copy or self.document
+        page = document.page(self.job.pageNumber)
         pageSize = page.pageSize()
         if self.job.rotation & 1:
             pageSize.transpose()
@@ -288,24 +596,32 @@ class Runner(QThread):
         yres = 72.0 * self.job.height / pageSize.height()
         threshold = options().oversampleThreshold() or options(self.document).oversampleThreshold()
         multiplier = 2 if xres < threshold else 1
-        with lock(self.document):
-            options().write(self.document)
-            options(self.document).write(self.document)
-            self.image = page.renderToImage(xres * multiplier, yres * multiplier, 0, 0, self.job.width * multiplier, self.job.height * multiplier, self.job.rotation)
+        rect = self.job.rect()
+        with lock(document):
+            options().write(document)
+            options(self.document).write(document)
+            self.image = page.renderToImage(xres * multiplier, yres * multiplier,
+                rect.x() * multiplier, rect.y() * multiplier,
+                rect.width() * multiplier, rect.height() * multiplier, self.job.rotation)
 
         if self.image.isNull():
-            self.image = QImage( self.job.width, self.job.height, QImage.Format_RGB32 )
+            self.image = QImage( rect.width(), rect.height(), QImage.Format_RGB32 )
             self.image.fill( Qt.white )
-            p = QPainter(self.image)
-            p.setFont(QFont("Helvetica",self.job.height/20))
-            p.drawText(self.image.rect(), Qt.AlignCenter,
-                       _("Failed to render page") );
+            if self.job.tile is None:
+                p = QPainter(self.image)
+                p.setFont(QFont("Helvetica",self.job.height/20))
+                p.drawText(self.image.rect(), Qt.AlignCenter,
+                           _("Failed to render page") );
         elif multiplier == 2:
-            self.image = self.image.scaledToWidth(self.job.width, Qt.SmoothTransformation)
+            self.image = self.image.scaledToWidth(rect.width(), Qt.SmoothTransformation)
         
     def slotFinished(self):
         """Called when the thread has completed."""
-        add(self.image, self.document, self.job.pageNumber, self.job.rotation, self.job.width, self.job.height)
-        self.scheduler.done(self.job)
+        if self.job.tile is None:
+            add(self.image, self.document, self.job.pageNumber, self.job.rotation, self.job.width, self.job.height)
+        else:
+            addtile(self.image, self.document, self.job.pageNumber, self.job.rotation,
+                    self.job.width, self.job.height, *self.job.tile)
+        self.scheduler.done(self)
         self.scheduler.checkStart()
 
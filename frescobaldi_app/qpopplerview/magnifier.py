@@ -24,11 +24,12 @@ The Magnifier magnifies a part of the displayed Poppler document.
 
 import weakref
 
-from PyQt5.QtCore import QPoint, QRect
+from PyQt5.QtCore import QPoint, QRect, QRectF
 from PyQt5.QtGui import QColor, QPainter, QPen, QRegion
 from PyQt5.QtWidgets import QWidget
 
 from . import cache
+from .page import drawTiles
 
 
 class Magnifier(QWidget):
@@ -96,10 +97,21 @@ class Magnifier(QWidget):
         relx = pagePos.x() / float(page.width())
         rely = pagePos.y() / float(page.height())
         
-        image = cache.image(self._page)
         img_rect = QRect(self.rect())
         img_rect.setSize( img_rect.size()*self._page._retinaFactor );
         
+        if cache.tiled(self._page):
+            # only render the magnified part of the page
+            img_rect.moveCenter(QPoint(int(relx * self._page.physWidth()),
+                                       int(rely * self._page.physHeight())))
+            p = QPainter(self)
+            drawTiles(p, self._page, QRectF(self.rect()), img_rect)
+            p.setRenderHint(QPainter.Antialiasing, True)
+            p.setPen(QPen(QColor(192, 192, 192, 128), 6))
+            p.drawEllipse(self.rect().adjusted(2, 2, -2, -2))
+            return
+        
+        image = cache.image(self._page)
         if not image:
             cache.generate(self._page)
             image = cache.image(self._page, False)
@@ -34,6 +34,54 @@ from . import cache
 from .locking import lock
 
 
+def drawTiles(painter, page, target, source):
+    """Draws the source QRect of the image of the page to the target QRectF.
+    
+    The tiles of the image are taken from the cache. Tiles that are not
+    available are scheduled to be generated, and drawn using drawFallback()
+    meanwhile. Returns True if all tiles were available.
+    
+    """
+    hscale = target.width() / source.width()
+    vscale = target.height() / source.height()
+    complete = True
+    for x, y, rect in cache.tiles(page, source):
+        tile_target = QRectF(target.x() + (rect.x() - source.x()) * hscale,
+                             target.y() + (rect.y() - source.y()) * vscale,
+                             rect.width() * hscale, rect.height() * vscale)
+        image = cache.tile(page, x, y)
+        if image:
+            painter.drawImage(tile_target, image,
+                QRectF(rect.translated(-x * cache.tilesize, -y * cache.tilesize)))
+        else:
+            complete = False
+            cache.generate(page, (x, y))
+            drawFallback(painter, page, tile_target, rect)
+    return complete
+
+
+def drawFallback(painter, page, target, source):
+    """Draws the source QRect of the page to the target QRectF, while the image is generated.
+    
+    An image of the page at another size is scaled if available, otherwise
+    blank paper is drawn.
+    
+    """
+    image = cache.image(page, False)
+    if image:
+        hscale = float(image.width()) / page.physWidth()
+        vscale = float(image.height()) / page.physHeight()
+        image_rect = QRectF(source.x() * hscale, source.y() * vscale,
+                            source.width() * hscale, source.height() * vscale)
+        painter.drawImage(target, image, image_rect)
+    else:
+        # draw blank paper, using the background color of the cache rendering (if set)
+        # or from the document itself.
+        color = (cache.options(page.document()).paperColor()
+                 or cache.options().paperColor() or page.document().paperColor())
+        painter.fillRect(target, color)
+
+
 class Page(object):
     """Represents a page from a Poppler.Document.
     
@@ -174,6 +222,14 @@ class Page(object):
         image_rect.moveTopLeft( image_rect.topLeft()*self._retinaFactor );
         image_rect.setSize( image_rect.size()*self._retinaFactor );
 
+        if cache.tiled(self):
+            if cache.image(self, False) is None:
+                # render a preview first, shown until the tiles are ready
+                cache.preview(self, True)
+            # only draw the tiles touched by the update rect
+            self._waiting = not drawTiles(painter, self, QRectF(update_rect), image_rect)
+            return
+        
         image = cache.image(self)
         self._waiting = not image
         if image:
@@ -181,20 +237,10 @@ class Page(object):
         else:
             # schedule an image to be generated, if done our update() method is called
             cache.generate(self)
+            # render a preview first if nothing is to be seen at all
+            cache.preview(self, True)
             # find suitable image to be scaled from other size
-            image = cache.image(self, False)
-            if image:
-                hscale = float(image.width()) / self.physWidth()
-                vscale = float(image.height()) / self.physHeight()
-                image_rect = QRectF(image_rect.x() * hscale, image_rect.y() * vscale,
-                                    image_rect.width() * hscale, image_rect.height() * vscale)
-                painter.drawImage(QRectF(update_rect), image, image_rect)
-            else:
-                # draw blank paper, using the background color of the cache rendering (if set)
-                # or from the document itself.
-                color = (cache.options(self.document()).paperColor()
-                         or cache.options().paperColor() or self.document().paperColor())
-                painter.fillRect(update_rect, color)
+            drawFallback(painter, self, QRectF(update_rect), image_rect)
 
     def update(self):
         """Called when an image is drawn."""
@@ -205,7 +251,11 @@ class Page(object):
     def repaint(self):
         """Call this to force a repaint (e.g. when the rendering options are changed)."""
         self._waiting = True
-        cache.generate(self)
+        if cache.tiled(self):
+            # the visible tiles are requested when painting
+            self.update()
+        else:
+            cache.generate(self)
     
     def image(self, rect, xdpi=72.0, ydpi=None, options=None):
         """Returns a QImage of the specified rectangle (relative to our top-left position).
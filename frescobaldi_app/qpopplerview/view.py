@@ -133,6 +133,8 @@ class View(KineticScrollArea):
         if self.viewMode():
             self.fit()
         self.surface().pageLayout().update()
+        # render a preview of all pages, so there is something to see while scrolling
+        cache.previews(self.surface().pageLayout().pages())
 
     def clear(self):
         """Convenience method to clear the current layout."""
@@ -145,6 +147,7 @@ class View(KineticScrollArea):
         
     def setScale(self, scale):
         """Sets the scale of all pages in the View."""
+        cache.cancelprefetch()
         self.surface().pageLayout().setScale(scale)
         self.surface().pageLayout().update()
         self.setViewMode(FixedScale)
@@ -175,6 +178,9 @@ class View(KineticScrollArea):
         if mode == FixedScale:
             return
         
+        # the pages will probably get another size
+        cache.cancelprefetch()
+        
         maxsize = self.maximumViewportSize()
         
         # can vertical or horizontal scrollbars appear?
@@ -266,6 +272,37 @@ class View(KineticScrollArea):
         self.fastCenter(QPoint(newx, newy))
         self._centerPos = None
 
+    def scrollContentsBy(self, dx, dy):
+        super(View, self).scrollContentsBy(dx, dy)
+        self.cancelHiddenPages()
+        if dx or dy:
+            self.prefetch(dy < 0 or (not dy and dx < 0))
+
+    def prefetch(self, forward=True):
+        """Renders the pages just outside the View in advance, at idle priority.
+        
+        If forward is True, the pages after the visible pages are rendered,
+        otherwise the pages before them. See cache.prefetch().
+        
+        """
+        visible = list(self.visiblePages())
+        if not visible:
+            return
+        pages = list(self.surface().pageLayout().pages())
+        if forward:
+            pages = pages[pages.index(visible[-1])+1:]
+        else:
+            pages = pages[:pages.index(visible[0])][::-1]
+        cache.prefetch(pages)
+
+    def cancelHiddenPages(self):
+        """Cancels rendering images for our pages that are not visible anymore."""
+        layout = self.surface().pageLayout()
+        visible = set(self.visiblePages())
+        for page in cache.waiting():
+            if page.layout() is layout and page not in visible:
+                cache.cancel(page)
+
     def zoom(self, scale, pos=None):
         """Changes the display scale (1.0 is 100%).
         
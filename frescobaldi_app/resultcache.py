@@ -0,0 +1,246 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+A persistent cache of engraving results.
+
+When an engraving job succeeds, the PDF, SVG and MIDI files it created are
+stored in the cache directory, under a key computed from everything that
+determines the output: the contents of the file that is engraved and of
+all the files it includes, the LilyPond version and the command line.
+
+When the same document is engraved again with the same key (e.g. after it
+was reverted or closed and opened again), lookup() returns a CachedJob that
+copies the stored files in place instead of running LilyPond. The files then
+are picked up by resultfiles and the music view as if LilyPond had created
+them. The output LilyPond printed is stored as well, and shown again.
+
+Only files that are included using \include are part of the key, so the
+cache is disabled by default. Hidden jobs (e.g. those of auto-compile) are
+never cached.
+
+"""
+
+
+import hashlib
+import json
+import os
+import shutil
+
+from PyQt5.QtCore import QSettings, QStandardPaths, QTimer
+
+import app
+import documentinfo
+import fileinfo
+import job
+import jobattributes
+import lilypondinfo
+import resultfiles
+import statcache
+
+
+# the extensions of the files that are stored
+extensions = ('.pdf', '.svg', '.svgz', '.mid', '.midi')
+
+# the maximum number of results to keep
+maxsize = 100
+
+
+def enabled():
+    """Return True if the result cache is enabled in the preferences."""
+    return QSettings().value("lilypond_settings/result_cache", False, bool)
+
+
+def directory():
+    """Return the directory the results are stored in."""
+    return os.path.join(QStandardPaths.writableLocation(
+        QStandardPaths.CacheLocation), 'results')
+
+
+def key(j, document):
+    """Return the key for the results of the job, or None.
+
+    None is returned if the file to engrave can't be read.
+
+    """
+    filename = j.command[-1]
+    h = hashlib.sha1()
+    try:
+        with open(filename, 'rb') as f:
+            h.update(f.read())
+    except (IOError, OSError):
+        return
+    h.update(repr((
+        _version(j.command[0]),
+        j.command[:-1],
+        os.path.basename(filename),
+        sorted((f, fileinfo.digest(f))
+               for f in documentinfo.info(document).includefiles()),
+    )).encode('utf-8'))
+    return h.hexdigest()
+
+
+def _version(command):
+    """Return a string identifying the LilyPond version for the command."""
+    for info in lilypondinfo.infos():
+        if info.abscommand() == command:
+            return info.versionString()
+    s = statcache.stat(os.path.realpath(command))
+    return (s.st_size, s.st_mtime) if s else None
+
+
+def lookup(j, document):
+    """Return a CachedJob if the results of the job are cached, else the job.
+
+    If the results are not cached, the job is returned unchanged, and its
+    results are stored when it succeeds. Hidden jobs are returned unchanged
+    and never stored.
+
+    """
+    if not enabled() or jobattributes.get(j).hidden:
+        return j
+    k = key(j, document)
+    if k is None:
+        return j
+    path = os.path.join(directory(), k)
+    if os.path.isdir(path):
+        cached = CachedJob(j, path)
+        jobattributes.copy(j, cached)
+        return cached
+    jobattributes.get(j).resultcache_key = k
+    return j
+
+
+def store(j, document):
+    """Store the output of the finished job in the cache."""
+    k = jobattributes.get(j).resultcache_key
+    if not k:
+        return
+    files = [f for f in resultfiles.results(document).files_lastjob()
+             if os.path.splitext(f)[1].lower() in extensions]
+    names = [os.path.relpath(f, j.directory) for f in files]
+    if not files or any(n.startswith(os.pardir) for n in names):
+        return
+    root = directory()
+    path = os.path.join(root, k)
+    temp = path + '.tmp'
+    try:
+        shutil.rmtree(temp, ignore_errors=True)
+        for f, name in zip(files, names):
+            dest = os.path.join(temp, 'files', name)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            shutil.copyfile(f, dest)
+        with open(os.path.join(temp, 'output.json'), 'w') as f:
+            json.dump(list(j.history(job.OUTPUT)), f)
+        os.replace(temp, path)
+    except (IOError, OSError):
+        shutil.rmtree(temp, ignore_errors=True)
+        return
+    prune(root)
+
+
+def prune(root=None):
+    """Remove the least recently used results if there are more than maxsize."""
+    if root is None:
+        root = directory()
+    try:
+        entries = [os.path.join(root, name) for name in os.listdir(root)]
+    except OSError:
+        return
+    entries.sort(key=os.path.getmtime, reverse=True)
+    for path in entries[maxsize:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def clear():
+    """Remove all stored results."""
+    shutil.rmtree(directory(), ignore_errors=True)
+
+
+@app.jobFinished.connect
+def _jobFinished(document, j, success):
+    """Called when a job finishes, stores its results if it succeeded."""
+    if success and not isinstance(j, CachedJob):
+        store(j, document)
+
+
+class CachedJob(job.Job):
+    """A Job that copies stored results in place instead of running LilyPond.
+
+    It has the same command, directory and title as the job it replaces,
+    and behaves the same way (emitting the output LilyPond printed when the
+    results were stored, and the done() signal), but finishes almost
+    instantly.
+
+    """
+    def __init__(self, j, path):
+        super(CachedJob, self).__init__()
+        self.command = j.command
+        self.directory = j.directory
+        self.environment = j.environment
+        self.set_title(j.title())
+        self._path = path
+        self._running = False
+
+    def start(self):
+        """Start copying the results."""
+        self._begin()
+        self._running = True
+        self.start_message()
+        QTimer.singleShot(0, self._copy)
+
+    def abort(self):
+        """Abort, the results are not copied."""
+        if self._running:
+            self._aborted = True
+            self.abort_message()
+
+    def is_running(self):
+        """Return True if the results are being copied."""
+        return self._running
+
+    def _copy(self):
+        """(internal) Copy the results to the job's directory."""
+        success = False
+        if not self._aborted:
+            files = os.path.join(self._path, 'files')
+            try:
+                with open(os.path.join(self._path, 'output.json')) as f:
+                    output = json.load(f)
+                for dirpath, dirnames, filenames in os.walk(files):
+                    for name in filenames:
+                        src = os.path.join(dirpath, name)
+                        dest = os.path.join(self.directory,
+                                            os.path.relpath(src, files))
+                        os.makedirs(os.path.dirname(dest), exist_ok=True)
+                        shutil.copyfile(src, dest)
+                        statcache.invalidate(dest)
+                os.utime(self._path)    # mark as recently used
+                success = True
+            except (IOError, OSError, ValueError) as e:
+                self.message(_("Could not use the cached results: {message}").format(
+                    message=getattr(e, 'strerror', None) or str(e)), job.FAILURE)
+                shutil.rmtree(self._path, ignore_errors=True)
+        if success:
+            for text, type in output:
+                self.message(text, type)
+            self.message(_("Used cached results."), job.SUCCESS)
+        self._running = False
+        self._end(success)
+
@@ -28,8 +28,10 @@ import os
 
 import app
 import documentinfo
+import jobattributes
 import jobmanager
 import plugin
+import statcache
 import util
 
 
@@ -40,8 +42,15 @@ def results(document):
 # Set the basenames of the resulting documents to expect when a job starts
 @app.jobStarted.connect
 def _init_basenames(document, job):
-    results(document).saveDocumentInfo(job.start_time())
-    
+    attrs = jobattributes.get(job)
+    results(document).saveDocumentInfo(job.start_time(), attrs.jobfile, attrs.basenames)
+
+
+def _forget_stats(document, job, success):
+    """Called when a job finishes; the files it created must be stat-ed again."""
+    statcache.invalidate()
+
+app.jobFinished.connect(_forget_stats, -999) # before all others
 
 
 class Results(plugin.DocumentPlugin):
@@ -52,7 +61,7 @@ class Results(plugin.DocumentPlugin):
         self._start_time = 0.0
         document.saved.connect(self.forgetDocumentInfo)
         
-    def saveDocumentInfo(self, start_time):
+    def saveDocumentInfo(self, start_time, jobfile=None, basenames=None):
         """Takes over some vital information from a DocumentInfo instance.
         
         This method is called as soon as a job is started.
@@ -65,11 +74,14 @@ class Results(plugin.DocumentPlugin):
         document was modified but saving it would result in DocumentInfo.jobinfo()[0] pointing
         to the real document instead.
         
+        A job that does not engrave the document's usual job file (e.g. a
+        fragment, see engrave/partial.py) can specify the jobfile and basenames.
+        
         """
         info = documentinfo.info(self.document())
         self._start_time = start_time
-        self._jobfile = info.jobinfo()[0]
-        self._basenames = info.basenames()
+        self._jobfile = jobfile or info.jobinfo()[0]
+        self._basenames = basenames or info.basenames()
 
     def forgetDocumentInfo(self):
         """Called when the user saves a Document.
@@ -141,7 +153,7 @@ class Results(plugin.DocumentPlugin):
         jobfile = self.jobfile()
         if jobfile:
             try:
-                return os.path.getmtime(filename) > os.path.getmtime(jobfile)
+                return statcache.getmtime(filename) > statcache.getmtime(jobfile)
             except (OSError, IOError):
                 pass
         return True
@@ -49,7 +49,8 @@ def findDocument(filename):
         if d.url().toLocalFile() == filename:
             return d
         s = ScratchDir.instance(d)
-        if s.directory() and util.equal_paths(filename, s.path()):
+        if s.directory() and (util.equal_paths(filename, s.path())
+                              or util.equal_paths(filename, s.fragmentPath())):
             return d
 
 
@@ -77,6 +78,13 @@ class ScratchDir(plugin.DocumentPlugin):
                 basename = 'document' + ly.lex.extensions[documentinfo.mode(self.document())]
             return os.path.join(self._directory, basename)
             
+    def fragmentPath(self):
+        """Returns the path a fragment of the document is saved to (see engrave/partial.py), or None."""
+        path = self.path()
+        if path:
+            directory, basename = os.path.split(path)
+            return os.path.join(directory, 'fragment', basename)
+    
     def saveDocument(self):
         """Writes the text of the document to our path()."""
         if not self._directory:
@@ -73,20 +73,30 @@ def sessionGroup(name):
     If the group doesn't exist, it is created.
     
     """
-    session = app.settings("sessions")
-    childGroups = session.childGroups()
-    for group in childGroups:
-        if session.value(group + "/name", "", str) == name:
-            break
-    else:
+    session = findSessionGroup(name)
+    if session is None:
+        session = app.settings("sessions")
+        childGroups = session.childGroups()
         for count in itertools.count(1):
             group = "session{0}".format(count)
             if group not in childGroups:
                 session.setValue(group +  "/name", name)
                 break
-    session.beginGroup(group)
+        session.beginGroup(group)
     return session
 
+def findSessionGroup(name):
+    """Returns the session settings group of the named session.
+    
+    Returns None if the session doesn't exist; the group is not created.
+    
+    """
+    session = app.settings("sessions")
+    for group in session.childGroups():
+        if session.value(group + "/name", "", str) == name:
+            session.beginGroup(group)
+            return session
+
 def sessionNames():
     session = app.settings("sessions")
     names = [session.value(group + "/name", "", str) for group in session.childGroups()]
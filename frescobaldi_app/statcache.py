@@ -0,0 +1,84 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Caches the results of os.stat() for a short time.
+
+Looking up the same files many times in a row (e.g. when resolving includes
+or checking cached file information) then only costs one os.stat() call per
+file, which matters on slow (network) file systems.
+
+The results are kept for ttl seconds. Code that knows a file has changed
+(e.g. a filesystem watcher, or after saving or running LilyPond) should
+call invalidate().
+
+"""
+
+
+import os
+import stat as _stat
+import time
+
+
+ttl = 1.0       # seconds to keep a result
+
+_cache = {}     # filename -> (time, stat_result or None)
+
+
+def stat(filename):
+    """Return the os.stat_result for the filename, or None if it does not exist."""
+    now = time.time()
+    try:
+        t, result = _cache[filename]
+        if now - t < ttl:
+            return result
+    except KeyError:
+        pass
+    try:
+        result = os.stat(filename)
+    except (IOError, OSError):
+        result = None
+    _cache[filename] = (now, result)
+    return result
+
+
+def getmtime(filename):
+    """Return the mtime of the file, like os.path.getmtime().
+
+    Raises OSError if the file does not exist.
+
+    """
+    s = stat(filename)
+    if s is None:
+        raise OSError("No such file: {0}".format(filename))
+    return s.st_mtime
+
+
+def isfile(filename):
+    """Return True if the filename exists and is a regular file."""
+    s = stat(filename)
+    return s is not None and _stat.S_ISREG(s.st_mode)
+
+
+def invalidate(filename=None):
+    """Forget the result for the filename, or all results if None."""
+    if filename is None:
+        _cache.clear()
+    else:
+        _cache.pop(filename, None)
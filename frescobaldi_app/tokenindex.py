@@ -0,0 +1,269 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+An incremental index of all the tokens in a document.
+
+The TokenIndex keeps a reference to the tokens of every block, as they are
+stored by the highlighter. When the document changes, only the blocks that
+were changed or retokenized are looked at again the next time the index is
+queried.
+
+Information derived from the tokens of a block (e.g. words harvested for
+autocompletion) can be cached per block using the harvest() method, so that
+it only is recomputed for the blocks that changed.
+
+Querying the index never runs the highlighter. Blocks the highlighter did
+not reach yet (see highlighter.Highlighter.isBusy()) have their previous
+tokens, or no tokens at all. They are read again when the highlighter stores
+their tokens, and the changed signal is emitted then, so information derived
+from the index can be computed again.
+
+"""
+
+
+import bisect
+
+import highlighter
+import plugin
+import signals
+
+
+def index(document):
+    """Return the TokenIndex for the document."""
+    return TokenIndex.instance(document)
+
+
+class Entry(object):
+    """The tokens of a block with some information derived from them.
+
+    If the highlighter stored the tokens compactly (see compacttokens.py),
+    the tokens are not kept but created again when requested.
+
+    """
+    __slots__ = ('block', 'classes', 'cache', '_tokens', '_compact', '_positions')
+
+    def __init__(self, block, tokens, compact=None):
+        self.block = block
+        self._tokens = tokens
+        self._compact = compact
+        if compact is not None:
+            self.classes = compact.classes()
+        else:
+            self.classes = frozenset(map(type, tokens))
+        self.cache = {}
+        self._positions = None
+
+    @property
+    def tokens(self):
+        """The tuple of tokens of the block."""
+        if self._tokens is not None:
+            return self._tokens
+        return self._compact.tokens(self.block.text())
+
+    def positions(self):
+        """Return the list of the positions of the tokens in the block."""
+        if self._positions is None:
+            if self._compact is not None:
+                self._positions = self._compact.positions()
+            else:
+                self._positions = [t.pos for t in self._tokens]
+        return self._positions
+
+
+class TokenIndex(plugin.DocumentPlugin):
+    """Keeps the tokens of a document, updating only changed blocks.
+
+    The index is updated lazily: edits only mark the affected blocks as
+    dirty, and they are read again when the index is queried.
+
+    The changed signal is emitted every time the highlighter stores new
+    tokens for a block.
+
+    """
+    changed = signals.Signal()
+
+    def __init__(self, document):
+        self._entries = None    # an Entry per block, None for dirty blocks
+        self._pending = []      # blocks retokenized by the highlighter
+        self._subclass = {}     # caches issubclass() results
+        document.contentsChange.connect(self._contentsChange)
+        hl = highlighter.highlighter(document)
+        hl.blockTokensChanged.connect(self._blockTokensChanged)
+
+    def _blockTokensChanged(self, block):
+        """Called when the highlighter has stored new tokens for a block.
+
+        The block number is resolved later, because the highlighter also
+        runs before we receive the contentsChange signal.
+
+        """
+        if self._entries is not None:
+            self._pending.append(block)
+        self.changed()
+
+    def _contentsChange(self, position, removed, added):
+        """Called on document changes; marks the changed blocks dirty."""
+        if self._entries is None:
+            return
+        doc = self.document()
+        count = doc.blockCount()
+        first = doc.findBlock(position).blockNumber()
+        last = doc.findBlock(position + added).blockNumber()
+        if last == -1:
+            last = count - 1
+        end = last + 1 - (count - len(self._entries))
+        if first == -1 or end < first or end > len(self._entries):
+            self._entries = None    # rebuild at next query
+        else:
+            self._entries[first:end] = [None] * (last + 1 - first)
+
+    def _update(self):
+        """Bring the index up-to-date, reading only the dirty blocks."""
+        doc = self.document()
+        entries = self._entries
+        if entries is None or len(entries) != doc.blockCount():
+            entries = self._entries = [None] * doc.blockCount()
+            del self._pending[:]
+        while True:
+            for block in self._pending:
+                n = block.blockNumber()
+                if 0 <= n < len(entries):
+                    entries[n] = None
+            del self._pending[:]
+            try:
+                i = entries.index(None)
+            except ValueError:
+                return
+            block = doc.findBlockByNumber(i)
+            while block.isValid():
+                if entries[i] is None:
+                    entries[i] = self._entry(block)
+                i += 1
+                block = block.next()
+
+    def _entry(self, block):
+        """Return a new Entry for the block, with the tokens stored for it."""
+        data = block.userData()
+        compact = getattr(data, 'compact', None)
+        if compact is not None:
+            return Entry(block, None, compact)
+        return Entry(block, getattr(data, 'tokens', ()))
+
+    def _matches(self, entry, cls):
+        """Return True if the entry has a token that is an instance of cls."""
+        issub = self._subclass
+        for c in entry.classes:
+            try:
+                if issub[c, cls]:
+                    return True
+            except KeyError:
+                if issub.setdefault((c, cls), issubclass(c, cls)):
+                    return True
+        return False
+
+    def entries(self):
+        """Return the up-to-date list of Entry instances, one for every block."""
+        self._update()
+        return self._entries
+
+    def all_tokens(self):
+        """Yield all tokens of the document."""
+        for entry in self.entries():
+            for t in entry.tokens:
+                yield t
+
+    def tokens(self, cls):
+        """Yield all tokens that are an instance of cls (a class or tuple).
+
+        Blocks that do not contain a token of the specified type(s) are
+        skipped without looking at their tokens.
+
+        """
+        for entry in self.entries():
+            if self._matches(entry, cls):
+                for t in entry.tokens:
+                    if isinstance(t, cls):
+                        yield t
+
+    def tokens_with_block(self, cls):
+        """Yield two-tuples (block_number, token) for tokens of type cls."""
+        for n, entry in enumerate(self.entries()):
+            if self._matches(entry, cls):
+                for t in entry.tokens:
+                    if isinstance(t, cls):
+                        yield n, t
+
+    def count(self, cls):
+        """Return the number of tokens that are an instance of cls."""
+        return sum(1 for t in self.tokens(cls))
+
+    def token(self, position):
+        """Return the token at the specified position, or None.
+
+        A token is returned if it contains the position or ends there.
+        The pos attribute of the token is relative to its block.
+
+        """
+        block = self.document().findBlock(position)
+        if not block.isValid():
+            return
+        entry = self.entries()[block.blockNumber()]
+        pos = position - block.position()
+        i = bisect.bisect_right(entry.positions(), pos) - 1
+        if i >= 0 and pos <= entry.tokens[i].end:
+            return entry.tokens[i]
+
+    def tokens_range(self, start, end):
+        """Yield two-tuples (block, token) for tokens between start and end.
+
+        Tokens partially overlapping the range are also yielded.
+
+        """
+        doc = self.document()
+        entries = self.entries()
+        block = doc.findBlock(start)
+        while block.isValid() and block.position() <= end:
+            entry = entries[block.blockNumber()]
+            pos = block.position()
+            positions = entry.positions()
+            i = max(0, bisect.bisect_right(positions, start - pos) - 1)
+            j = bisect.bisect_right(positions, end - pos)
+            for t in entry.tokens[i:j]:
+                if pos + t.end > start or pos + t.pos == start:
+                    yield block, t
+            block = block.next()
+
+    def harvest(self, func):
+        """Yield the items func(tokens) returns for every block.
+
+        func is called with the tuple of tokens of a block and should return
+        an iterable (preferably a tuple). The results are cached per block,
+        so func is only called again for blocks that changed.
+
+        """
+        for entry in self.entries():
+            try:
+                result = entry.cache[func]
+            except KeyError:
+                result = entry.cache[func] = tuple(func(entry.tokens))
+            for item in result:
+                yield item
+
+
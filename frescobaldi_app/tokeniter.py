@@ -35,14 +35,16 @@ import collections
 
 from PyQt5.QtGui import QTextBlock, QTextCursor
 
+import compacttokens
 import cursortools
 import highlighter
 
 
 def tokens(block):
     """Returns the tokens for the given block as a (possibly empty) tuple."""
+    highlighter.highlighter(block.document()).ensureHighlighted(block)
     try:
-        return block.userData().tokens
+        return compacttokens.stored_tokens(block)
     except AttributeError:
         # we used to call highlighter.highlighter(block.document()).rehighlight()
         # here, but there is a bug in PyQt-4.9.6 causing QTextBlockUserData to
@@ -54,16 +56,16 @@ def tokens(block):
 def state(block):
     """Return the ly.lex.State() object at the beginning of the given QTextBlock."""
     hl = highlighter.highlighter(block.document())
-    if block.previous().userState() == -1 and block.blockNumber() > 0:
-        hl.rehighlight()
-    return hl.state(block.previous())
+    prev = block.previous()
+    if prev.isValid():
+        hl.ensureHighlighted(prev)
+    return hl.state(prev)
 
 
 def state_end(block):
     """Return the ly.lex.State() object at the end of the given QTextBlock."""
     hl = highlighter.highlighter(block.document())
-    if block.userState() == -1:
-        hl.rehighlight()
+    hl.ensureHighlighted(block)
     return hl.state(block)
 
 
@@ -75,7 +77,7 @@ def update(block):
     automatically be updated when Qt re-enters the event loop.
     
     """
-    highlighter.highlighter(block.document()).rehighlightBlock(block)
+    highlighter.highlighter(block.document()).ensureHighlighted(block)
 
 
 def cursor(block, token, start=0, end=None):
@@ -157,7 +159,13 @@ def partition(cursor):
 
 
 def all_tokens(document):
-    """Yields all tokens of a document."""
-    return (token for block in cursortools.all_blocks(document) for token in tokens(block))
+    """Yields all tokens of a document.
+    
+    The tokens are read from the document's tokenindex.TokenIndex, which only
+    looks again at blocks that changed since the previous call.
+    
+    """
+    import tokenindex
+    return tokenindex.index(document).all_tokens()
 
 
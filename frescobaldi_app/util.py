@@ -32,6 +32,7 @@ import re
 from PyQt5.QtCore import QDir
 
 import appinfo
+import statcache
 import variables
 
 
@@ -123,7 +124,7 @@ def files(basenames, extension = '.*'):
 
 def newer_files(files, time):
     """Return a list of files that have their mtime >= time."""
-    return [f for f in files if os.path.getmtime(f) >= time]
+    return [f for f in files if statcache.getmtime(f) >= time]
 
 
 def group_files(names, groups):
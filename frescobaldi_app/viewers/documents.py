@@ -38,6 +38,7 @@ import plugin
 import resultfiles
 import signals
 import popplertools
+import qpopplerview
 
 
 _cache = weakref.WeakValueDictionary()
@@ -72,6 +73,7 @@ def load(filename):
             data = QByteArray(f.read())
         doc = popplerqt5.Poppler.Document.loadFromData(data)
         if doc:
+            qpopplerview.cache.setsource(doc, data)
             _cache[key] = doc
         return doc or None
 
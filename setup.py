@@ -31,6 +31,7 @@ package_data = {
         'TangoExt/index.theme',
         'TangoExt/scalable/*.svg',
     ],
+    'frescobaldi_app.engrave': ['*.scm'],
     'frescobaldi_app.layoutcontrol': ['*.ly', '*.ily'],
     'frescobaldi_app.po': ['*.mo'],
     'frescobaldi_app.scorewiz': ['*.png'],
@@ -0,0 +1,26 @@
+"""
+Test setup: makes the frescobaldi_app modules importable and creates the
+QApplication the modules expect, without showing any windows.
+"""
+
+import builtins
+import os
+import sys
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'frescobaldi_app'))
+
+# the translation functions are normally installed by po.setup
+builtins.__dict__.setdefault('_', lambda *args: args[-1])
+
+from PyQt5.QtCore import QSettings
+from PyQt5.QtWidgets import QApplication
+
+import app
+
+if app.qApp is None:
+    app.qApp = QApplication.instance() or QApplication([])
+    app.qApp.setApplicationName('frescobaldi-tests')
+    QSettings.setDefaultFormat(QSettings.IniFormat)
@@ -0,0 +1,27 @@
+"""
+Tests for the report of the batch engraving.
+"""
+
+import util
+
+import job
+from engrave import batch
+
+
+def test_result_messages():
+    name = "/tmp/étude.ly"
+    j = job.Job()
+    j.message("Processing `{0}'\n".format(name).encode('utf-8').decode('latin1'), job.STDERR)
+    j.message(name.encode('utf-8').decode('latin1') + ":3:", job.STDERR)
+    j.message("4: error: syntax error", job.STDERR)
+    j.message("Exited with return code 1.", job.FAILURE)
+    j.success = False
+    result = batch.Result(name, j)
+    assert result.messages() == [{
+        'file': util.normpath(name),
+        'line': 3,
+        'column': 4,
+        'message': "error: syntax error",
+    }]
+    assert not result.success()
+    assert batch.Result(name, error="could not load").messages() == []
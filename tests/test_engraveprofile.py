@@ -0,0 +1,113 @@
+"""
+Tests for the storage of the engraving profiles and the regression check.
+"""
+
+import os
+
+import pytest
+
+import document
+import job
+import jobattributes
+import statcache
+from engraveprofile import database, profiler, widget
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, 'filename',
+                        lambda: str(tmp_path / 'profile' / 'engraveprofile.sqlite'))
+    monkeypatch.setattr(database, '_connection', None)
+    yield database
+    if database._connection is not None:
+        database._connection.close()
+
+
+class Profile:
+    def __init__(self, document, time, wall=1.0, success=True):
+        self.document = document
+        self.time = time
+        self.command = ['lilypond', 'score.ly']
+        self.success = success
+        self.wall = wall
+        self.peak_rss = 1000
+        self.output_size = 2000
+        self.output_files = 1
+        self.text_size = 100
+        self.phases = [('startup', 0.0, 0.25), ('parsing', 0.25, wall - 0.25)]
+
+
+class Run:
+    def __init__(self, id, wall, success=True):
+        self.id = id
+        self.wall = wall
+        self.success = success
+
+
+def test_add_and_runs(db):
+    documents = []
+    def changed(document):
+        documents.append(document)
+    db.changed.connect(changed)
+    db.add(Profile('a.ly', 20.0, wall=2.0))
+    db.add(Profile('a.ly', 10.0, success=False))
+    db.add(Profile('b.ly', 15.0))
+    assert documents == ['a.ly', 'a.ly', 'b.ly']
+    runs = db.runs('a.ly')
+    assert [run.time for run in runs] == [10.0, 20.0]   # oldest first
+    assert [run.success for run in runs] == [False, True]
+    assert runs[1].wall == 2.0 and runs[1].command == 'lilypond score.ly'
+    assert runs[1].phases == [('startup', 0.0, 0.25), ('parsing', 0.25, 1.75)]
+    assert [run.time for run in db.runs('a.ly', limit=1)] == [20.0]
+    db.changed.disconnect(changed)
+
+
+def test_prune_and_clear(db, monkeypatch):
+    monkeypatch.setattr(database, 'maxruns', 3)
+    for t in range(5):
+        db.add(Profile('a.ly', float(t)))
+    db.add(Profile('b.ly', 0.0))
+    assert [run.time for run in db.runs('a.ly')] == [2.0, 3.0, 4.0]
+    # the phases of the removed runs are removed as well
+    count, = db.connection().execute("SELECT COUNT(*) FROM phases").fetchone()
+    assert count == 8
+    db.clear('a.ly')
+    assert db.runs('a.ly') == []
+    assert len(db.runs('b.ly')) == 1
+
+
+def test_regressions():
+    walls = [1.0, 1.2, 2.5, 0.9, 1.1, 1.0, 2.3, 3.0]
+    runs = [Run(i, wall) for i, wall in enumerate(walls)]
+    # the first three runs are not compared; run 2 would be a regression
+    assert widget.regressions(runs) == {6, 7}
+    # failed runs are not compared, and do not count as previous runs
+    runs = [Run(0, 1.0), Run(1, 1.0), Run(2, 5.0, False), Run(3, 3.0), Run(4, 3.0)]
+    assert widget.regressions(runs) == {4}
+
+
+def test_regressions_window():
+    # only the last five successful runs determine the usual time
+    walls = [10.0] * 5 + [1.0] * 5 + [2.5]
+    runs = [Run(i, wall) for i, wall in enumerate(walls)]
+    assert widget.regressions(runs) == {10}
+
+
+def test_profile_output_files(db, tmp_path):
+    for name in ('score.pdf', 'score.midi', 'score-old.pdf', 'other.pdf'):
+        (tmp_path / name).write_bytes(b'x' * 10)
+    doc = document.Document()
+    j = job.Job()
+    jobattributes.get(j).basenames = [str(tmp_path / 'score')]
+    j._begin()
+    p = profiler.Profile(doc, j)
+    start = j.start_time()
+    for name in ('score.pdf', 'score.midi', 'other.pdf'):
+        os.utime(str(tmp_path / name), (start + 1, start + 1))
+    os.utime(str(tmp_path / 'score-old.pdf'), (start - 100, start - 100))
+    statcache.invalidate()
+    j._end(True)
+    run, = db.runs(profiler.document_name(doc))
+    # other.pdf is created by another job, score-old.pdf by an earlier one
+    assert run.output_files == 2
+    assert run.output_size == 20
@@ -0,0 +1,22 @@
+"""
+Tests for the DocInfo answers stored in the disk cache of fileinfo.
+"""
+
+import fileinfo
+
+
+def test_stored_results_are_copies():
+    info = {
+        'include_args': ['a.ily', 'b.ily'],
+        'definitions': [],
+        'version_string': '2.18.0',
+    }
+    stored = fileinfo._StoredDocInfo(None, info)
+    args = stored.include_args()
+    assert args == ['a.ily', 'b.ily']
+    args.append('c.ily')
+    stored.definitions().append('music')
+    assert stored.include_args() == ['a.ily', 'b.ily']
+    assert stored.definitions() == []
+    assert info['include_args'] == ['a.ily', 'b.ily']
+    assert stored.version_string() == '2.18.0'
@@ -0,0 +1,113 @@
+"""
+Tests for the incremental highlighting in highlighter.py.
+"""
+
+import ly.lex
+import pytest
+
+from PyQt5.QtGui import QTextCursor, QTextDocument
+from PyQt5.QtWidgets import QPlainTextDocumentLayout
+
+import app
+import highlighter
+import tokeniter
+
+
+TEXT = (
+    '\\version "2.18.0"\n'
+    '\n'
+    'music = \\relative c\' {\n'
+    '  c4 d e f | g1\n'
+    '}\n'
+) * 200
+
+
+def make_document(text=TEXT):
+    doc = QTextDocument()
+    doc.setDocumentLayout(QPlainTextDocumentLayout(doc))
+    doc.setPlainText(text)
+    return doc
+
+
+@pytest.fixture
+def one_block_slices(monkeypatch):
+    """Highlight one block per time slice, independent of the speed."""
+    monkeypatch.setattr(highlighter.Highlighter, 'timeSlice', 0)
+
+
+def lexed(doc):
+    """Return the tokens of all lines as lists, using a fresh ly.lex state."""
+    state = ly.lex.guessState(doc.toPlainText())
+    return [[(type(t), t, t.pos) for t in state.tokens(line)]
+            for line in doc.toPlainText().split('\n')]
+
+
+def highlighted(doc):
+    """Return the tokens of all lines as lists, using tokeniter.tokens()."""
+    result = []
+    block = doc.firstBlock()
+    while block.isValid():
+        result.append([(type(t), t, t.pos) for t in tokeniter.tokens(block)])
+        block = block.next()
+    return result
+
+
+def test_highlights_in_background(one_block_slices):
+    doc = make_document()
+    hl = highlighter.highlighter(doc)
+    hl.setAutoContinue(False)
+    assert hl.isBusy()
+    assert hl.progress() == 1
+    assert hl.continueHighlighting()
+    assert hl.progress() == 2
+    while hl.continueHighlighting():
+        pass
+    assert hl.progress() == doc.blockCount()
+    assert highlighted(doc) == lexed(doc)
+
+
+def test_ensure_highlighted_stops_at_block(one_block_slices):
+    doc = make_document(TEXT * 5)
+    hl = highlighter.highlighter(doc)
+    hl.setAutoContinue(False)
+    number = 1000
+    tokeniter.tokens(doc.findBlockByNumber(number))
+    assert hl.progress() == number + 1
+    assert hl.isBusy()
+
+
+def test_tokens_after_edit():
+    doc = make_document()
+    hl = highlighter.highlighter(doc)
+    hl.setAutoContinue(False)
+    tokeniter.tokens(doc.findBlockByNumber(300))
+    # open a comment halfway, it changes the tokens of everything after it
+    cursor = QTextCursor(doc.findBlockByNumber(100))
+    cursor.insertText('%{ ')
+    assert highlighted(doc) == lexed(doc)
+    # close it again, on another line
+    cursor = QTextCursor(doc.findBlockByNumber(250))
+    cursor.insertText('%} ')
+    assert highlighted(doc) == lexed(doc)
+
+
+def test_tokens_after_edit_in_event_loop():
+    doc = make_document()
+    hl = highlighter.highlighter(doc)
+    app.qApp.processEvents()
+    cursor = QTextCursor(doc.findBlockByNumber(20))
+    cursor.insertText('"\n')
+    app.qApp.processEvents()
+    cursor = QTextCursor(doc)
+    cursor.movePosition(QTextCursor.End)
+    cursor.movePosition(QTextCursor.Up, QTextCursor.KeepAnchor, 30)
+    cursor.removeSelectedText()
+    assert highlighted(doc) == lexed(doc)
+
+
+def test_rehighlight():
+    doc = make_document()
+    hl = highlighter.highlighter(doc)
+    hl.rehighlight()
+    assert not hl.isBusy()
+    assert highlighted(doc) == lexed(doc)
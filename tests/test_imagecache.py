@@ -0,0 +1,114 @@
+"""
+Tests for the least recently used ImageCache.
+"""
+
+import collections
+
+import qpageview.cache
+
+
+class Image:
+    def __init__(self, name, size=100):
+        self.name = name
+        self.size = size
+
+    def byteCount(self):
+        return self.size
+
+
+class Document:
+    """A group to cache images for (must support weak references)."""
+
+
+Key = collections.namedtuple('Key', 'group page size')
+
+
+def make_cache(maxsize=1000, groupshare=1.0, maxzooms=4):
+    c = qpageview.cache.ImageCache()
+    c.maxsize = maxsize
+    c.groupshare = groupshare
+    c.maxzooms = maxzooms
+    return c
+
+
+def test_store_again():
+    c = make_cache()
+    doc = Document()
+    c.add(Image('a'), doc, 1, (100, 100))
+    c.add(Image('b'), doc, 1, (100, 100))
+    assert c.get(doc, 1, (100, 100)).name == 'b'
+    assert c.currentsize == 100
+    key = Key(doc, 1, (100, 100))
+    c[key] = Image('c')
+    assert c[key].name == 'c'
+    assert c.statistics()['images'] == 1
+
+
+def test_evict_two_documents():
+    c = make_cache(maxsize=300)
+    doc1, doc2 = Document(), Document()
+    c.add(Image('a'), doc1, 1, (100, 100))
+    c.add(Image('a'), doc1, 1, (100, 100))    # store again under the same key
+    c.add(Image('b'), doc2, 1, (100, 100))
+    c.add(Image('c'), doc2, 2, (100, 100))
+    c.get(doc1, 1, (100, 100))
+    c.add(Image('d'), doc1, 2, (100, 100))    # evicts doc2 page 1
+    assert c.get(doc2, 1, (100, 100)) is None
+    assert c.get(doc2, 2, (100, 100)).name == 'c'
+    assert c.get(doc1, 1, (100, 100)).name == 'a'
+    assert c.get(doc1, 2, (100, 100)).name == 'd'
+    c.add(Image('e'), doc2, 3, (100, 100))    # evicts doc2 page 2
+    c.add(Image('f'), doc2, 4, (100, 100))    # evicts doc1 page 1
+    c.add(Image('g'), doc1, 3, (100, 100))    # evicts doc1 page 2
+    assert c.currentsize == 300
+    assert c.statistics()['evictions'] == 4
+    assert c.get(doc1, 3, (100, 100)).name == 'g'
+    assert c.get(doc2, 4, (100, 100)).name == 'f'
+
+
+def test_groupshare():
+    c = make_cache(maxsize=1000, groupshare=0.5)
+    doc1, doc2 = Document(), Document()
+    c.add(Image('a'), doc2, 1, (100, 100))
+    for page in range(8):
+        c.add(Image(page), doc1, page, (100, 100))
+    assert c.currentsize == 600
+    assert [c.contains(doc1, page, (100, 100)) for page in range(8)] == [False] * 3 + [True] * 5
+    assert c.contains(doc2, 1, (100, 100))
+
+
+def test_maxzooms():
+    c = make_cache(maxzooms=2)
+    doc = Document()
+    for width in (100, 200, 300):
+        c.add(Image(width), doc, 1, (width, width))
+    assert not c.contains(doc, 1, (100, 100))
+    assert c.nearest(doc, 1, 120).name == 200
+    assert c.closest(Key(doc, 1, (280, 280))).name == 300
+    for width in (100, 200, 300):
+        c.add(Image(width), doc, 2, (width, width), False)
+    assert all(c.contains(doc, 2, (width, width)) for width in (100, 200, 300))
+
+
+def test_purge():
+    c = make_cache(maxsize=1000)
+    doc = Document()
+    for page in range(5):
+        c.add(Image(page), doc, page, (100, 100))
+    c.maxsize = 250
+    c.purge()
+    assert c.currentsize == 200
+    assert c.contains(doc, 3, (100, 100)) and c.contains(doc, 4, (100, 100))
+    assert c.statistics()['evictions'] == 3
+
+
+def test_dead_document():
+    c = make_cache()
+    doc1, doc2 = Document(), Document()
+    c.add(Image('a'), doc1, 1, (100, 100))
+    c.add(Image('b'), doc2, 1, (100, 100))
+    del doc1
+    assert c.get(doc2, 1, (100, 100)).name == 'b'
+    assert c.currentsize == 100
+    c.cleargroup(doc2)
+    assert c.currentsize == 0 and c.statistics()['images'] == 0
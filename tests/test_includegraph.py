@@ -0,0 +1,61 @@
+"""
+Tests for the include graph of the open documents.
+"""
+
+import os
+
+from PyQt5.QtCore import QUrl
+
+import app
+import document
+import documentinfo
+import includegraph
+
+
+def write(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def includefiles(doc):
+    return includegraph.includefiles(doc, documentinfo.docinfo(doc), [])
+
+
+def test_includegraph(tmp_path):
+    d = str(tmp_path)
+    write(os.path.join(d, 'master.ly'), '\\include "a.ily"\n\\include "c.ily"\n')
+    write(os.path.join(d, 'a.ily'), '\\include "b.ily"\n')
+    write(os.path.join(d, 'b.ily'), '{ c }\n')
+    a, b, c = (os.path.realpath(os.path.join(d, n)) for n in ('a.ily', 'b.ily', 'c.ily'))
+    doc = document.Document.new_from_url(QUrl.fromLocalFile(os.path.join(d, 'master.ly')))
+    changes = []
+    def changed(filename, documents):
+        changes.append((filename, documents))
+    includegraph.changed.connect(changed)
+    try:
+        assert includefiles(doc) == {a, b}
+        assert includegraph.masters(b) == {doc}
+        assert includefiles(doc) is includefiles(doc)
+
+        # a missing file is created
+        write(c, '{ d }\n')
+        includegraph.invalidate(c)
+        assert changes[-1] == (c, {doc})
+        assert includefiles(doc) == {a, b, c}
+        assert includegraph.masters(c) == {doc}
+
+        # an included file changes
+        write(a, '{ e }\n')
+        includegraph.invalidate(a)
+        assert changes[-1] == (a, {doc})
+        assert includefiles(doc) == {a, c}
+        assert includegraph.masters(b) == set()
+
+        # an unrelated file changes
+        del changes[:]
+        includegraph.invalidate(os.path.join(d, 'other.ily'))
+        assert changes == []
+    finally:
+        includegraph.changed.disconnect(changed)
+        doc.close()
+    assert includegraph.masters(a) == set()
@@ -0,0 +1,64 @@
+"""
+Tests for the History that stores the messages of a Job.
+"""
+
+import job
+
+
+def make_history(maxsize, messages):
+    h = job.History()
+    h.maxsize = maxsize
+    for text, type in messages:
+        h.append(text, type)
+    return h
+
+
+MESSAGES = [
+    ("Starting lilypond...\n", job.NEUTRAL),
+    ("Processing `test.ly'\n", job.STDERR),
+    ("Parsing...", job.STDERR),
+    ("\ntest.ly:3:4: warning: barcheck failed\n", job.STDERR),
+    ("output line\n", job.STDOUT),
+    ("Interpreting müsic...\n", job.STDERR),
+    ("Completed successfully.\n", job.SUCCESS),
+]
+
+
+def test_messages():
+    h = make_history(1048576, MESSAGES)
+    assert len(h) == len(MESSAGES)
+    assert list(h.messages()) == MESSAGES
+    assert list(h.messages(job.STDOUT)) == [MESSAGES[4]]
+    assert list(h.messages(job.OUTPUT, 3)) == MESSAGES[3:6]
+    assert list(h.messages(job.STATUS)) == [MESSAGES[0], MESSAGES[6]]
+
+
+def test_spilled_messages():
+    h = make_history(30, MESSAGES)
+    assert h._spilled
+    assert len(h) == len(MESSAGES)
+    assert [h.get(i) for i in range(len(h))] == MESSAGES
+    assert list(h.messages(job.STDERR, 2)) == [MESSAGES[2], MESSAGES[3], MESSAGES[5]]
+
+
+def test_many_spilled_messages():
+    messages = [("line {0}\n".format(i), job.STDERR if i % 3 else job.STDOUT)
+                for i in range(5000)]
+    h = make_history(100, messages)
+    assert len(h) == 5000
+    assert list(h.messages()) == messages
+    assert list(h.messages(job.STDOUT, 4990)) == [m for m in messages[4990:]
+                                                 if m[1] == job.STDOUT]
+
+
+def test_lines():
+    h = make_history(30, MESSAGES)
+    assert list(h.lines()) == [
+        "Processing `test.ly'\n",
+        "Parsing...\n",
+        "test.ly:3:4: warning: barcheck failed\n",
+        "output line\n",
+        "Interpreting müsic...\n",
+    ]
+    h.append("no newline", job.STDERR)
+    assert list(h.lines(job.STDERR))[-1] == "no newline"
@@ -0,0 +1,163 @@
+"""
+Tests for the JobQueue, using stub jobs that finish when told to.
+"""
+
+import pytest
+
+import app
+import document
+import job
+import jobqueue
+import signals
+
+
+class StubJob(job.Job):
+    """A job that runs until finish() is called; abort() only flags it."""
+    def __init__(self, name, started):
+        super(StubJob, self).__init__()
+        self.name = name
+        self._started = started
+        self._running = False
+
+    def start(self):
+        self._begin()
+        self._running = True
+        self._started.append(self.name)
+
+    def abort(self):
+        if self._running:
+            self._aborted = True
+
+    def is_running(self):
+        return self._running
+
+    def finish(self, success=True):
+        self._running = False
+        self._end(success)
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    # keep the jobs away from the other modules listening to these signals
+    monkeypatch.setattr(app, 'jobStarted', signals.Signal())
+    monkeypatch.setattr(app, 'jobFinished', signals.Signal())
+    q = jobqueue.JobQueue()
+    q.started = []
+    q.progress = []
+    q.finished = 0
+    def progress(done, total):
+        q.progress.append((done, total))
+    def finished():
+        q.finished += 1
+    jobqueue.progress.connect(progress)
+    jobqueue.finished.connect(finished)
+    def make_job(name):
+        return StubJob(name, q.started)
+    q.job = make_job
+    yield q
+    jobqueue.progress.disconnect(progress)
+    jobqueue.finished.disconnect(finished)
+
+
+def names(jobs):
+    return [j.name for j in jobs]
+
+
+def test_priority(queue):
+    queue.setMaxJobs(1)
+    i0, b1, b2, i1 = map(queue.job, ('i0', 'b1', 'b2', 'i1'))
+    queue.add(i0, document.Document(), jobqueue.INTERACTIVE)
+    queue.add(b1, document.Document(), jobqueue.BATCH)
+    queue.add(b2, document.Document(), jobqueue.BATCH)
+    queue.add(i1, document.Document(), jobqueue.INTERACTIVE)
+    # a running interactive job is never preempted
+    assert not i0.is_aborted()
+    assert names(queue.jobs()) == ['i0', 'i1', 'b1', 'b2']
+    for j in (i0, i1, b1, b2):
+        j.finish()
+    assert queue.started == ['i0', 'i1', 'b1', 'b2']
+    assert queue.progress[-1] == (4, 4)
+    assert queue.finished == 1
+
+
+def test_preempt_newest_batch_job(queue):
+    queue.setMaxJobs(2)
+    b1, b2, i1 = map(queue.job, ('b1', 'b2', 'i1'))
+    queue.add(b1, document.Document())
+    queue.add(b2, document.Document())
+    queue.add(i1, document.Document(), jobqueue.INTERACTIVE)
+    assert b2.is_aborted() and not b1.is_aborted()
+    assert queue.started == ['b1', 'b2']
+    assert queue.count() == (0, 3)
+    b2.finish(False)
+    # the aborted job is queued again, and does not count as done
+    assert queue.started == ['b1', 'b2', 'i1']
+    assert names(queue.jobs()) == ['b1', 'i1', 'b2']
+    assert queue.count() == (0, 3)
+    i1.finish()
+    assert queue.started == ['b1', 'b2', 'i1', 'b2']
+    assert not b2.is_aborted()
+    b1.finish()
+    b2.finish()
+    assert b2.success
+    assert queue.progress[-1] == (3, 3)
+    assert queue.finished == 1
+
+
+def test_cancel(queue):
+    queue.setMaxJobs(1)
+    a, b, c = map(queue.job, 'abc')
+    for j in (a, b, c):
+        queue.add(j, document.Document())
+    queue.cancel(b)
+    assert names(queue.jobs()) == ['a', 'c']
+    assert queue.count() == (0, 2)
+    queue.cancel(a)
+    assert a.is_aborted()
+    a.finish(False)
+    assert queue.started == ['a', 'c']
+    assert queue.count() == (1, 2)
+    c.finish()
+    assert queue.progress[-1] == (2, 2)
+    assert queue.finished == 1
+    assert queue.count() == (0, 0)
+
+
+def test_cancel_all(queue):
+    queue.setMaxJobs(1)
+    a, b, c = map(queue.job, 'abc')
+    for j in (a, b, c):
+        queue.add(j, document.Document())
+    queue.cancelAll()
+    assert a.is_aborted()
+    assert names(queue.jobs()) == ['a']
+    a.finish(False)
+    assert queue.started == ['a']
+    assert queue.jobs() == []
+    assert queue.progress[-1] == (1, 1)
+    assert queue.finished == 1
+    assert queue.count() == (0, 0)
+
+
+def test_max_jobs(queue):
+    queue.setMaxJobs(2)
+    jobs = [queue.job(str(i)) for i in range(4)]
+    for j in jobs:
+        queue.add(j, document.Document())
+    assert queue.started == ['0', '1']
+    jobs[1].finish()
+    assert queue.started == ['0', '1', '2']
+    queue.setMaxJobs(3)
+    assert queue.started == ['0', '1', '2', '3']
+    assert queue.maxJobs() == 3
+
+
+def test_one_job_per_document(queue):
+    queue.setMaxJobs(2)
+    doc = document.Document()
+    a, b = queue.job('a'), queue.job('b')
+    queue.add(a, doc)
+    queue.add(b, doc)
+    assert queue.started == ['a']
+    a.finish()
+    assert queue.started == ['a', 'b']
@@ -0,0 +1,65 @@
+"""
+Tests for the Parser that finds file references in the output of a job.
+"""
+
+import util
+
+from logtool.errors import Parser
+
+
+OUTPUT = (
+    "Processing `/tmp/score.ly'\n"
+    "Parsing...\n"
+    "/tmp/score.ly:12:5: warning: barcheck failed at: 1/4\n"
+    "  c4 d e f\n"
+    "/tmp/include/voice.ily:3: error: syntax error\n"
+    "Interpreting music...\n"
+    "/tmp/score.ly:20:0: programming error: no mark\n"
+)
+
+EXPECTED = [
+    ("/tmp/score.ly:12:5", util.normpath("/tmp/score.ly"), 12, 5),
+    ("/tmp/include/voice.ily:3", util.normpath("/tmp/include/voice.ily"), 3, 0),
+    ("/tmp/score.ly:20:0", util.normpath("/tmp/score.ly"), 20, 0),
+]
+
+
+def feed(chunks):
+    p = Parser()
+    refs = []
+    for chunk in chunks:
+        refs.extend(p.feed(chunk))
+    refs.extend(p.flush())
+    return refs
+
+
+def test_parse_at_once():
+    assert feed([OUTPUT]) == EXPECTED
+
+
+def test_parse_in_chunks():
+    for size in (1, 2, 7, 16, 50):
+        chunks = [OUTPUT[i:i+size] for i in range(0, len(OUTPUT), size)]
+        assert feed(chunks) == EXPECTED
+
+
+def test_incomplete_last_line():
+    p = Parser()
+    assert p.feed("Parsing...\n/tmp/score.ly:4") == []
+    assert p.feed(":2: error: unknown") == []
+    assert p.flush() == [("/tmp/score.ly:4:2", util.normpath("/tmp/score.ly"), 4, 2)]
+    assert p.flush() == []
+
+
+def test_no_references():
+    assert feed(["Processing...\n", "Success: compilation successfully completed\n"]) == []
+
+
+def test_messages():
+    # the output of a LilyPond job is decoded as latin1
+    name = "/tmp/partituur-één.ly"
+    output = "{0}:7:2: warning: één\n".format(name).encode('utf-8').decode('latin1')
+    p = Parser(True)
+    assert p.feed(output[:10]) == []
+    assert p.feed(output[10:]) == [
+        (name + ":7:2", util.normpath(name), 7, 2, "warning: één")]
@@ -0,0 +1,149 @@
+"""
+Tests for the ChunkedDocInfo that documentinfo builds from toplevel expressions.
+"""
+
+import ly.document
+import ly.lex.lilypond
+
+from PyQt5.QtGui import QTextCursor
+
+import document
+import documentinfo
+import highlighter
+import lydocinfo
+
+
+TEXT = r'''\version "2.18.0"
+\language "nederlands"
+\include "other.ily"
+
+melody = \relative c' {
+  c4 d e f | g1
+}
+
+title = \markup { \bold Title }
+
+#(define-markup-command (smallcaps-title layout props) ()
+  (interpret-markup layout props "x"))
+
+\score {
+  \new Staff \melody
+}
+'''
+
+
+def make_document(text=TEXT):
+    doc = document.Document()
+    doc.setPlainText(text)
+    return doc
+
+
+def plain_docinfo(doc):
+    """Return a DocInfo read in one go, to compare with."""
+    return lydocinfo.DocInfo(ly.document.Document(doc.toPlainText()), {})
+
+
+def positions(tokens):
+    return [(t, t.pos) for t in tokens]
+
+
+def assert_same_info(doc):
+    info = documentinfo.docinfo(doc, True)
+    expected = plain_docinfo(doc)
+    assert isinstance(info, lydocinfo.ChunkedDocInfo)
+    assert positions(info.tokens) == positions(expected.tokens)
+    assert info.classes == expected.classes
+    assert positions(info.definitions()) == positions(expected.definitions())
+    assert (positions(info.markup_definitions())
+            == positions(expected.markup_definitions()))
+    assert info.include_args() == expected.include_args()
+    assert info.version() == expected.version()
+    assert info.language() == expected.language()
+
+
+def test_chunks():
+    doc = make_document()
+    info = documentinfo.docinfo(doc, True)
+    assert len(info.chunks) > 1
+    assert_same_info(doc)
+
+
+def test_classes_cached():
+    info = documentinfo.docinfo(make_document(), True)
+    assert info.classes is info.classes
+    assert info.find(cls=ly.lex.lilypond.Name) == plain_docinfo(
+        info.document.document).find(cls=ly.lex.lilypond.Name)
+
+
+def test_definition_positions():
+    doc = make_document()
+    for t in documentinfo.docinfo(doc, True).definitions():
+        assert doc.toPlainText()[t.pos:t.end] == t
+
+
+def test_edit_reuses_unchanged_chunks():
+    doc = make_document()
+    old = documentinfo.docinfo(doc, True).chunks
+    cursor = QTextCursor(doc.findBlockByNumber(5))
+    cursor.insertText("  a b c\n")
+    new = documentinfo.docinfo(doc, True).chunks
+    assert len(new) == len(old)
+    assert old[0][2] is new[0][2]
+    assert old[-1][2] is new[-1][2]
+    assert old[3][2] is not new[3][2]
+    assert_same_info(doc)
+
+
+def test_edit_adds_definition():
+    doc = make_document()
+    documentinfo.docinfo(doc, True)
+    cursor = QTextCursor(doc)
+    cursor.movePosition(QTextCursor.End)
+    cursor.insertText("bass = { c1 }\n")
+    info = documentinfo.docinfo(doc, True)
+    assert 'bass' in info.definitions()
+    assert_same_info(doc)
+
+
+def test_token_hash():
+    doc = make_document()
+    old = documentinfo.docinfo(doc, True).token_hash()
+    cursor = QTextCursor(doc.findBlockByNumber(6))
+    cursor.insertText("  % a comment\n")
+    assert documentinfo.docinfo(doc, True).token_hash() == old
+    cursor.insertText("  a'\n")
+    assert documentinfo.docinfo(doc, True).token_hash() != old
+
+
+def test_follows_background_highlighting(monkeypatch):
+    monkeypatch.setattr(highlighter.Highlighter, 'timeSlice', 0)
+    doc = make_document()
+    hl = highlighter.highlighter(doc)
+    hl.setAutoContinue(False)
+    info = documentinfo.docinfo(doc)
+    assert hl.progress() == 1
+    assert not info.definitions()
+    while hl.continueHighlighting():
+        pass
+    assert documentinfo.docinfo(doc) is not info
+    assert_same_info(doc)
+
+
+def test_chunks_do_not_keep_tokens():
+    doc = make_document()
+    info = documentinfo.docinfo(doc, True)
+    for pos, end, chunk in info.chunks:
+        assert not any(isinstance(v, tuple) and v and isinstance(v[0], ly.lex.Token)
+                       for v in vars(chunk).values())
+        assert chunk.tokens == chunk.tokens and chunk.tokens is not chunk.tokens
+
+
+def test_range():
+    doc = make_document()
+    info = documentinfo.docinfo(doc, True)
+    start = doc.findBlockByNumber(5).position()
+    part = info.range(start, doc.characterCount())
+    expected = plain_docinfo(doc).range(start, doc.characterCount())
+    assert positions(part.definitions()) == positions(expected.definitions())
+    assert part.has_output() and part.count_tokens(ly.lex.lilypond.Note) == (
+        expected.count_tokens(ly.lex.lilypond.Note))
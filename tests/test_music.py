@@ -0,0 +1,95 @@
+"""
+Tests for the music tree that documentinfo builds from toplevel expressions,
+and for the TimeIndex of music.Document.
+"""
+
+import ly.document
+import ly.music
+
+from PyQt5.QtGui import QTextCursor
+
+import document
+import documentinfo
+
+
+TEXT = r'''\version "2.18.0"
+\language "nederlands"
+
+melody = \relative c' {
+  c4 d e f | g2 a8 b c4 | \tuplet 3/2 { d8 e f } g2.
+}
+
+bass = { c1 | es2 g | \times 2/3 { c4 d e } f2 }
+
+\score {
+  <<
+    \new Staff \melody
+    \new Staff { \clef bass \bass }
+  >>
+}
+'''
+
+
+def make_document(text=TEXT):
+    doc = document.Document()
+    doc.setPlainText(text)
+    return doc
+
+
+def tree(doc):
+    """Return the music tree of documentinfo, after highlighting the document."""
+    documentinfo.docinfo(doc, True)
+    return documentinfo.music(doc)
+
+
+def fresh_music(doc):
+    """Return a music tree read in one go, to compare with."""
+    return ly.music.document(ly.document.Document(doc.toPlainText()))
+
+
+def dump(tree):
+    """Return a list describing every node of the tree."""
+    return [(type(node), node.position, node.end_position(),
+             node.token if node.token is None else (node.token, node.token.pos))
+            for node in tree.descendants()]
+
+
+def test_music_tree():
+    doc = make_document()
+    assert dump(tree(doc)) == dump(fresh_music(doc))
+
+
+def test_music_tree_after_edits():
+    doc = make_document()
+    old = tree(doc)
+    nodes = list(old)
+    # insert text before the last expressions, they are shifted
+    cursor = QTextCursor(doc.findBlockByNumber(5))
+    cursor.insertText("  a4 b\n")
+    music = tree(doc)
+    assert dump(music) == dump(fresh_music(doc))
+    assert music[-1] is nodes[-1]
+    # changing the language changes the pitches in all expressions after it
+    cursor = QTextCursor(doc.findBlockByNumber(1))
+    cursor.movePosition(QTextCursor.EndOfBlock, QTextCursor.KeepAnchor)
+    cursor.insertText(r'\language "english"')
+    assert dump(tree(doc)) == dump(fresh_music(doc))
+
+
+def test_time_position():
+    doc = make_document()
+    music = tree(doc)
+    fresh = fresh_music(doc)
+    text = doc.toPlainText()
+    for pos in range(text.index('melody'), len(text), 3):
+        assert music.time_position(pos) == fresh.time_position(pos)
+
+
+def test_time_length():
+    doc = make_document()
+    music = tree(doc)
+    fresh = fresh_music(doc)
+    text = doc.toPlainText()
+    start = text.index('c4 d e f')
+    for end in range(start, text.index('}', start), 2):
+        assert music.time_length(start, end) == fresh.time_length(start, end)
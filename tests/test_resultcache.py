@@ -0,0 +1,145 @@
+"""
+Tests for the persistent cache of engraving results.
+"""
+
+import os
+import time
+
+import pytest
+
+from PyQt5.QtCore import QEventLoop, QUrl
+
+import app
+import document
+import documentinfo
+import includegraph
+import job
+import jobattributes
+import resultcache
+import resultfiles
+import statcache
+
+
+def write(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def touch(path, delta):
+    """Move the mtime of the file, so the cached information is read again."""
+    mtime = os.path.getmtime(path) + delta
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def score(tmp_path, monkeypatch):
+    monkeypatch.setattr(resultcache, 'directory', lambda: str(tmp_path / 'cache'))
+    monkeypatch.setattr(resultcache, 'enabled', lambda: True)
+    d = str(tmp_path)
+    write(os.path.join(d, 'lilypond'), '#!/bin/sh\n')
+    write(os.path.join(d, 'score.ly'), '\\include "inc.ily"\n{ c }\n')
+    write(os.path.join(d, 'inc.ily'), '{ d }\n')
+    doc = document.Document.new_from_url(QUrl.fromLocalFile(os.path.join(d, 'score.ly')))
+    yield doc
+    doc.close()
+
+
+def make_job(doc, *args):
+    j = job.Job()
+    filename = doc.url().toLocalFile()
+    j.directory = os.path.dirname(filename)
+    j.command = [os.path.join(j.directory, 'lilypond')] + list(args) + [filename]
+    return j
+
+
+def test_key(score):
+    d = os.path.dirname(score.url().toLocalFile())
+    j = make_job(score)
+    k = resultcache.key(j, score)
+    assert k and resultcache.key(make_job(score), score) == k
+
+    # another command line
+    assert resultcache.key(make_job(score, '-dpoint-and-click'), score) != k
+
+    # an included file changes
+    inc = os.path.join(d, 'inc.ily')
+    assert documentinfo.info(score).includefiles() == {os.path.realpath(inc)}
+    write(inc, '{ e }\n')
+    touch(inc, 10)
+    includegraph.invalidate(inc)
+    k2 = resultcache.key(j, score)
+    assert k2 != k
+
+    # another LilyPond version
+    lilypond = os.path.join(d, 'lilypond')
+    write(lilypond, '#!/bin/sh\nexit 0\n')
+    statcache.invalidate(lilypond)
+    k3 = resultcache.key(j, score)
+    assert k3 not in (k, k2)
+
+    # the file itself changes
+    write(j.command[-1], '\\include "inc.ily"\n{ c d }\n')
+    assert resultcache.key(j, score) not in (k, k2, k3)
+
+    # the file can't be read
+    os.remove(j.command[-1])
+    assert resultcache.key(j, score) is None
+
+
+def engrave(score, j):
+    """Pretend the job ran LilyPond and created a PDF and a MIDI file."""
+    d = j.directory
+    start = time.time() - 10
+    resultfiles.results(score).saveDocumentInfo(
+        start, j.command[-1], [os.path.join(d, 'score')])
+    write(os.path.join(d, 'score.pdf'), 'PDF')
+    write(os.path.join(d, 'score.midi'), 'MIDI')
+    statcache.invalidate()
+    j.message("Processing `score.ly'\n", job.STDERR)
+    j.success = True
+
+
+def test_store_and_lookup(score):
+    d = os.path.dirname(score.url().toLocalFile())
+    j = make_job(score)
+    assert resultcache.lookup(j, score) is j
+    engrave(score, j)
+    resultcache.store(j, score)
+    path = os.path.join(resultcache.directory(), resultcache.key(j, score))
+    assert sorted(os.listdir(os.path.join(path, 'files'))) == ['score.midi', 'score.pdf']
+
+    # a hit restores the output files and the output of LilyPond
+    for name in ('score.pdf', 'score.midi'):
+        os.remove(os.path.join(d, name))
+    cached = resultcache.lookup(make_job(score), score)
+    assert isinstance(cached, resultcache.CachedJob)
+    cached.start()
+    timeout = time.time() + 10
+    while cached.is_running() and time.time() < timeout:
+        app.qApp.processEvents(QEventLoop.AllEvents, 50)
+    assert cached.success
+    with open(os.path.join(d, 'score.pdf')) as f:
+        assert f.read() == 'PDF'
+    with open(os.path.join(d, 'score.midi')) as f:
+        assert f.read() == 'MIDI'
+    assert cached.stderr() == "Processing `score.ly'\n"
+    assert [m for m, t in cached.history(job.SUCCESS)] == ["Used cached results."]
+
+    # hidden jobs are not cached
+    hidden = make_job(score)
+    jobattributes.get(hidden).hidden = True
+    assert resultcache.lookup(hidden, score) is hidden
+
+
+def test_prune(tmp_path):
+    root = str(tmp_path)
+    now = time.time()
+    for i in range(resultcache.maxsize + 3):
+        path = os.path.join(root, 'key{0}'.format(i))
+        os.mkdir(path)
+        os.utime(path, (now + i, now + i))
+    resultcache.prune(root)
+    names = os.listdir(root)
+    assert len(names) == resultcache.maxsize == 100
+    # the least recently used results are removed
+    assert not {'key0', 'key1', 'key2'} & set(names)
@@ -0,0 +1,104 @@
+"""
+Tests for the ServerJob, using a fake LilyPond that speaks the server protocol.
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+from PyQt5.QtCore import QEventLoop
+
+import app
+import job
+from engrave import server
+
+
+# Engraves a file by exiting with the number in the file. When run with
+# -e, it is a server like server.scm (or fails to start if BROKEN is set).
+FAKE_LILYPOND = r'''
+import os, sys
+
+def engrave(directory, filename):
+    with open(os.path.join(directory, filename)) as f:
+        code = int(f.read())
+    sys.stderr.write("Processing `{0}'\n".format(filename))
+    sys.stderr.flush()
+    return code
+
+if '-e' not in sys.argv:
+    sys.exit(engrave(os.getcwd(), sys.argv[-1]))
+if os.environ.get('BROKEN'):
+    sys.exit(1)
+print('frescobaldi-server-ready', flush=True)
+for line in sys.stdin:
+    directory, filename = line.rstrip('\n').split('\t')
+    print('frescobaldi-server-start', os.getpid(), flush=True)
+    print('frescobaldi-server-done', engrave(directory, filename), flush=True)
+'''
+
+
+@pytest.fixture
+def make_job(tmp_path):
+    fake = tmp_path / 'lilypond.py'
+    fake.write_text(FAKE_LILYPOND)
+    def make_job(code, environment=None):
+        filename = tmp_path / 'file{0}.ly'.format(code)
+        filename.write_text(str(code))
+        j = job.Job()
+        j.command = [sys.executable, str(fake), filename.name]
+        j.directory = str(tmp_path)
+        j.environment = environment or {}
+        return server.ServerJob(j)
+    yield make_job
+    server.stop()
+
+
+def run(*jobs):
+    for j in jobs:
+        j.start()
+    timeout = time.time() + 20
+    while any(j.is_running() for j in jobs) and time.time() < timeout:
+        app.qApp.processEvents(QEventLoop.AllEvents, 50)
+    assert not any(j.is_running() for j in jobs)
+
+
+def test_success(make_job):
+    j = make_job(0)
+    run(j)
+    assert j.success
+    assert server._server is not None and not server._server.busy()
+    assert "Processing `file0.ly'" in j.stderr()
+    assert list(j.history(job.SUCCESS))
+    # the server is reused
+    s = server._server
+    j = make_job(0)
+    run(j)
+    assert j.success and server._server is s
+
+
+def test_return_code(make_job):
+    j = make_job(3)
+    run(j)
+    assert j.success is False
+    assert [m for m, t in j.history(job.FAILURE)] == ["Exited with return code 3."]
+
+
+def test_fallback_when_broken(make_job):
+    j = make_job(2, {'BROKEN': '1'})
+    run(j)
+    assert j.success is False
+    assert [m for m, t in j.history(job.FAILURE)] == ["Exited with return code 2."]
+    assert "Processing `file2.ly'" in j.stderr()
+    j = make_job(0, {'BROKEN': '1'})
+    run(j)
+    assert j.success
+
+
+def test_fallback_when_busy(make_job):
+    j1, j2 = make_job(0), make_job(4)
+    run(j1, j2)
+    assert j1.success
+    assert j2.success is False
+    assert [m for m, t in j2.history(job.FAILURE)] == ["Exited with return code 4."]
@@ -0,0 +1,79 @@
+"""
+Tests for the TokenIndex, which must not wait for the highlighter.
+"""
+
+import pytest
+
+from PyQt5.QtGui import QTextCursor, QTextDocument
+from PyQt5.QtWidgets import QPlainTextDocumentLayout
+
+import highlighter
+import tokenindex
+import tokeniter
+
+
+TEXT = (
+    'music = \\relative c\' {\n'
+    '  c4 d e f | g1\n'
+    '}\n'
+) * 300
+
+
+@pytest.fixture
+def document(monkeypatch):
+    monkeypatch.setattr(highlighter.Highlighter, 'timeSlice', 0)
+    doc = QTextDocument()
+    doc.setDocumentLayout(QPlainTextDocumentLayout(doc))
+    doc.setPlainText(TEXT)
+    highlighter.highlighter(doc).setAutoContinue(False)
+    return doc
+
+
+def indexed(doc):
+    return [tuple(entry.tokens) for entry in tokenindex.index(doc).entries()]
+
+
+def highlighted(doc):
+    result = []
+    block = doc.firstBlock()
+    while block.isValid():
+        result.append(tuple(tokeniter.tokens(block)))
+        block = block.next()
+    return result
+
+
+def test_query_does_not_highlight(document):
+    hl = highlighter.highlighter(document)
+    tokeniter.tokens(document.findBlockByNumber(100))
+    entries = indexed(document)
+    assert hl.progress() == 101
+    assert all(entries[:101])
+    assert not any(entries[101:])
+
+
+def test_follows_background_highlighting(document):
+    hl = highlighter.highlighter(document)
+    index = tokenindex.index(document)
+    index.entries()
+    changes = []
+    index.changed.connect(lambda: changes.append(True), owner=document)
+    while hl.continueHighlighting():
+        pass
+    assert changes
+    assert indexed(document) == highlighted(document)
+
+
+def test_edit_keeps_old_tokens_until_highlighted(document):
+    hl = highlighter.highlighter(document)
+    while hl.continueHighlighting():
+        pass
+    before = indexed(document)
+    # open a comment, changing the tokens of all following blocks
+    QTextCursor(document.findBlockByNumber(10)).insertText('%{ ')
+    entries = indexed(document)
+    assert hl.isBusy()
+    assert entries[11:] == before[11:]
+    while hl.continueHighlighting():
+        pass
+    assert indexed(document) == highlighted(document)
+    assert indexed(document)[11:] != before[11:]